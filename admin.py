@@ -4,6 +4,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 
+import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -15,14 +16,14 @@ async def admin_users_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     
     try:
         # Get recent users
-        users_result = db.supabase.table('converter_users').select(
-            'user_id, username, first_name, subscription_tier, created_at'
-        ).order('created_at', desc=True).limit(15).execute()
+        users_result = await db.store.select(
+            'converter_users', 'user_id, username, first_name, subscription_tier, created_at', order='created_at.desc', limit=15
+        )
         
         text = "👥 <b>Recent Users (Last 15)</b>\n\n"
         
-        if users_result.data:
-            for user in users_result.data:
+        if users_result:
+            for user in users_result:
                 user_id = user['user_id']
                 username = f"@{user['username']}" if user.get('username') else user.get('first_name', 'Unknown')
                 tier = "💎" if user.get('subscription_tier') == 'premium' else "🆓"
@@ -60,21 +61,18 @@ async def admin_payments_callback(update: Update, context: ContextTypes.DEFAULT_
     
     try:
         # Get recent payments
-        payments_result = db.supabase.table('converter_payments').select(
-            'id, user_id, amount, status, created_at'
-        ).order('created_at', desc=True).limit(10).execute()
+        payments_result = await db.store.select(
+            'converter_payments', 'id, user_id, amount, status, created_at', order='created_at.desc', limit=10
+        )
         
         # Get pending count
-        pending_result = db.supabase.table('converter_payments').select(
-            'id', count='exact'
-        ).eq('status', 'pending').execute()
-        pending_count = pending_result.count or 0
+        pending_count = await db.store.count('converter_payments', filters={'status': 'pending'})
         
         # Get total revenue
-        revenue_result = db.supabase.table('converter_payments').select(
-            'amount'
-        ).eq('status', 'approved').execute()
-        total_revenue = sum(p['amount'] for p in revenue_result.data) if revenue_result.data else 0
+        revenue_result = await db.store.select(
+            'converter_payments', 'amount', filters={'status': 'approved'}
+        )
+        total_revenue = sum(p['amount'] for p in revenue_result) if revenue_result else 0
         
         text = (
             "💰 <b>Payment Management</b>\n\n"
@@ -83,14 +81,14 @@ async def admin_payments_callback(update: Update, context: ContextTypes.DEFAULT_
             "<b>Recent Payments:</b>\n\n"
         )
         
-        if payments_result.data:
+        if payments_result:
             status_emoji = {
                 'pending': '⏳',
                 'approved': '✅',
                 'rejected': '❌'
             }
             
-            for payment in payments_result.data:
+            for payment in payments_result:
                 status = status_emoji.get(payment['status'], '❓')
                 created = datetime.fromisoformat(payment['created_at'].replace('Z', '+00:00')).strftime('%m-%d %H:%M')
                 text += (
@@ -128,14 +126,14 @@ async def admin_premium_users_callback(update: Update, context: ContextTypes.DEF
     
     try:
         # Get premium users
-        premium_result = db.supabase.table('converter_users').select(
-            'user_id, username, first_name, subscription_expires_at'
-        ).eq('subscription_tier', 'premium').order('subscription_expires_at', desc=True).execute()
+        premium_result = await db.store.select(
+            'converter_users', 'user_id, username, first_name, subscription_expires_at', filters={'subscription_tier': 'premium'}, order='subscription_expires_at.desc'
+        )
         
         text = "💎 <b>Premium Users</b>\n\n"
         
-        if premium_result.data:
-            for user in premium_result.data:
+        if premium_result:
+            for user in premium_result:
                 username = f"@{user['username']}" if user.get('username') else user.get('first_name', 'Unknown')
                 
                 if user.get('subscription_expires_at'):
@@ -182,16 +180,13 @@ async def admin_conversions_callback(update: Update, context: ContextTypes.DEFAU
     
     try:
         # Get recent conversions
-        conversions_result = db.supabase.table('file_conversions').select(
-            'user_id, original_format, target_format, conversion_status, created_at'
-        ).order('created_at', desc=True).limit(15).execute()
+        conversions_result = await db.store.select(
+            'file_conversions', 'user_id, original_format, target_format, conversion_status, created_at', order='created_at.desc', limit=15
+        )
         
         # Get today's stats
         today = datetime.now(timezone.utc).date().isoformat()
-        today_result = db.supabase.table('file_conversions').select(
-            'id', count='exact'
-        ).gte('created_at', today).execute()
-        today_count = today_result.count or 0
+        today_count = await db.store.count('file_conversions', filters={'created_at': ('gte', today)})
         
         text = (
             "📝 <b>Recent Conversions</b>\n\n"
@@ -199,14 +194,16 @@ async def admin_conversions_callback(update: Update, context: ContextTypes.DEFAU
             "<b>Latest Activity:</b>\n\n"
         )
         
-        if conversions_result.data:
+        if conversions_result:
             status_emoji = {
                 'success': '✅',
                 'failed': '❌',
+                'limit_exceeded': '🛑',
+                'cancelled': '🚫',
                 'processing': '⏳'
             }
             
-            for conv in conversions_result.data:
+            for conv in conversions_result:
                 status = status_emoji.get(conv['conversion_status'], '❓')
                 created = datetime.fromisoformat(conv['created_at'].replace('Z', '+00:00')).strftime('%m-%d %H:%M')
                 text += (
@@ -245,14 +242,14 @@ async def admin_conversions_callback(update: Update, context: ContextTypes.DEFAU
     
     try:
         # Get premium users
-        premium_result = db.supabase.table('converter_users').select(
-            'user_id, username, first_name, subscription_expires_at'
-        ).eq('subscription_tier', 'premium').order('subscription_expires_at', desc=True).execute()
+        premium_result = await db.store.select(
+            'converter_users', 'user_id, username, first_name, subscription_expires_at', filters={'subscription_tier': 'premium'}, order='subscription_expires_at.desc'
+        )
         
         text = "💎 <b>Premium Users</b>\n\n"
         
-        if premium_result.data:
-            for user in premium_result.data:
+        if premium_result:
+            for user in premium_result:
                 username = f"@{user['username']}" if user.get('username') else user.get('first_name', 'Unknown')
                 
                 if user.get('subscription_expires_at'):
@@ -298,76 +295,54 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE, db,
     
     try:
         # Total users
-        total_users_result = db.supabase.table('converter_users').select(
-            'user_id', count='exact'
-        ).execute()
-        total_users = total_users_result.count or 0
+        total_users = await db.store.count('converter_users')
         
         # Premium users
-        premium_users_result = db.supabase.table('converter_users').select(
-            'user_id', count='exact'
-        ).eq('subscription_tier', 'premium').execute()
-        premium_users = premium_users_result.count or 0
+        premium_users = await db.store.count('converter_users', filters={'subscription_tier': 'premium'})
         
         # Active today
         today = datetime.now(timezone.utc).date().isoformat()
-        active_today_result = db.supabase.table('converter_user_stats').select(
-            'user_id', count='exact'
-        ).eq('last_conversion_date', today).execute()
-        active_today = active_today_result.count or 0
+        active_today = await db.store.count('converter_user_stats', filters={'last_conversion_date': today})
         
         # Active this week
         week_ago = (datetime.now(timezone.utc) - timedelta(days=7)).date().isoformat()
-        active_week_result = db.supabase.table('converter_user_stats').select(
-            'user_id', count='exact'
-        ).gte('last_conversion_date', week_ago).execute()
-        active_week = active_week_result.count or 0
+        active_week = await db.store.count('converter_user_stats', filters={'last_conversion_date': ('gte', week_ago)})
         
         # Total conversions
-        total_conversions_result = db.supabase.table('file_conversions').select(
-            'id', count='exact'
-        ).execute()
-        total_conversions = total_conversions_result.count or 0
+        total_conversions = await db.store.count('file_conversions')
         
         # Successful conversions
-        success_conversions_result = db.supabase.table('file_conversions').select(
-            'id', count='exact'
-        ).eq('conversion_status', 'success').execute()
-        success_conversions = success_conversions_result.count or 0
+        success_conversions = await db.store.count('file_conversions', filters={'conversion_status': 'success'})
         
-        # Failed conversions
-        failed_conversions = total_conversions - success_conversions
+        # Failed, cancelled by the user, stopped at a resource limit
+        failed_conversions = await db.store.count('file_conversions', filters={'conversion_status': 'failed'})
+        cancelled_conversions = await db.store.count('file_conversions', filters={'conversion_status': 'cancelled'})
+        limited_conversions = await db.store.count('file_conversions', filters={'conversion_status': 'limit_exceeded'})
         
         # Success rate
         success_rate = (success_conversions / total_conversions * 100) if total_conversions > 0 else 0
         
         # Conversions today
-        today_conversions_result = db.supabase.table('file_conversions').select(
-            'id', count='exact'
-        ).gte('created_at', today).execute()
-        today_conversions = today_conversions_result.count or 0
+        today_conversions = await db.store.count('file_conversions', filters={'created_at': ('gte', today)})
         
         # Pending payments
-        pending_payments_result = db.supabase.table('converter_payments').select(
-            'id', count='exact'
-        ).eq('status', 'pending').execute()
-        pending_payments = pending_payments_result.count or 0
+        pending_payments = await db.store.count('converter_payments', filters={'status': 'pending'})
         
         # Total revenue (approved payments only)
-        revenue_result = db.supabase.table('converter_payments').select(
-            'amount'
-        ).eq('status', 'approved').execute()
+        revenue_result = await db.store.select(
+            'converter_payments', 'amount', filters={'status': 'approved'}
+        )
         
-        total_revenue = sum(payment['amount'] for payment in revenue_result.data) if revenue_result.data else 0
+        total_revenue = sum(payment['amount'] for payment in revenue_result) if revenue_result else 0
         
         # Most popular format conversions
-        popular_formats_result = db.supabase.table('file_conversions').select(
-            'original_format, target_format'
-        ).limit(1000).execute()
+        popular_formats_result = await db.store.select(
+            'file_conversions', 'original_format, target_format', limit=1000
+        )
         
         format_counts = {}
-        if popular_formats_result.data:
-            for conv in popular_formats_result.data:
+        if popular_formats_result:
+            for conv in popular_formats_result:
                 key = f"{conv['original_format']} → {conv['target_format']}"
                 format_counts[key] = format_counts.get(key, 0) + 1
         
@@ -385,6 +360,8 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE, db,
             f"• Total: <b>{total_conversions}</b>\n"
             f"• Successful: <b>{success_conversions}</b> ({success_rate:.1f}%)\n"
             f"• Failed: <b>{failed_conversions}</b>\n"
+            f"• Cancelled: <b>{cancelled_conversions}</b>\n"
+            f"• Limit exceeded: <b>{limited_conversions}</b>\n"
             f"• Today: <b>{today_conversions}</b>\n"
             f"• Avg per user: <b>{total_conversions/total_users:.1f}</b>\n\n" if total_users > 0 else ""
             "💰 <b>Revenue:</b>\n"
@@ -430,14 +407,14 @@ async def users_command(update: Update, context: ContextTypes.DEFAULT_TYPE, db,
     
     try:
         # Get recent users
-        users_result = db.supabase.table('converter_users').select(
-            'user_id, username, first_name, subscription_tier, created_at'
-        ).order('created_at', desc=True).limit(10).execute()
+        users_result = await db.store.select(
+            'converter_users', 'user_id, username, first_name, subscription_tier, created_at', order='created_at.desc', limit=10
+        )
         
         text = "👥 <b>Recent Users (Last 10)</b>\n\n"
         
-        if users_result.data:
-            for user in users_result.data:
+        if users_result:
+            for user in users_result:
                 user_id = user['user_id']
                 username = f"@{user['username']}" if user.get('username') else user.get('first_name', 'Unknown')
                 tier = "💎" if user.get('subscription_tier') == 'premium' else "🆓"
@@ -476,35 +453,20 @@ async def admin_stats_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     # Reuse stats command logic but for callback
     try:
         # Total users
-        total_users_result = db.supabase.table('converter_users').select(
-            'user_id', count='exact'
-        ).execute()
-        total_users = total_users_result.count or 0
+        total_users = await db.store.count('converter_users')
         
         # Premium users
-        premium_users_result = db.supabase.table('converter_users').select(
-            'user_id', count='exact'
-        ).eq('subscription_tier', 'premium').execute()
-        premium_users = premium_users_result.count or 0
+        premium_users = await db.store.count('converter_users', filters={'subscription_tier': 'premium'})
         
         # Active today
         today = datetime.now(timezone.utc).date().isoformat()
-        active_today_result = db.supabase.table('converter_user_stats').select(
-            'user_id', count='exact'
-        ).eq('last_conversion_date', today).execute()
-        active_today = active_today_result.count or 0
+        active_today = await db.store.count('converter_user_stats', filters={'last_conversion_date': today})
         
         # Total conversions
-        total_conversions_result = db.supabase.table('file_conversions').select(
-            'id', count='exact'
-        ).execute()
-        total_conversions = total_conversions_result.count or 0
+        total_conversions = await db.store.count('file_conversions')
         
         # Success rate
-        success_conversions_result = db.supabase.table('file_conversions').select(
-            'id', count='exact'
-        ).eq('conversion_status', 'success').execute()
-        success_conversions = success_conversions_result.count or 0
+        success_conversions = await db.store.count('file_conversions', filters={'conversion_status': 'success'})
         
         success_rate = (success_conversions / total_conversions * 100) if total_conversions > 0 else 0
         
@@ -551,26 +513,14 @@ async def admin_back_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     try:
         # Get admin statistics
-        total_users_result = db.supabase.table('converter_users').select(
-            'user_id', count='exact'
-        ).execute()
-        total_users = total_users_result.count or 0
+        total_users = await db.store.count('converter_users')
         
         today = datetime.now(timezone.utc).date().isoformat()
-        active_today_result = db.supabase.table('converter_user_stats').select(
-            'user_id', count='exact'
-        ).eq('last_conversion_date', today).execute()
-        todays_active_users = active_today_result.count or 0
+        todays_active_users = await db.store.count('converter_user_stats', filters={'last_conversion_date': today})
         
-        total_files_result = db.supabase.table('file_conversions').select(
-            'id', count='exact'
-        ).execute()
-        total_processed_files = total_files_result.count or 0
+        total_processed_files = await db.store.count('file_conversions')
         
-        successful_files_result = db.supabase.table('file_conversions').select(
-            'id', count='exact'
-        ).eq('conversion_status', 'success').execute()
-        successful_files = successful_files_result.count or 0
+        successful_files = await db.store.count('file_conversions', filters={'conversion_status': 'success'})
         
         success_rate = (successful_files / total_processed_files * 100) if total_processed_files > 0 else 0
         avg_files_per_user = total_processed_files / total_users if total_users > 0 else 0
@@ -587,6 +537,8 @@ async def admin_back_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
             "🔧 <b>Admin Commands:</b>\n"
             "/stats - Detailed statistics\n"
             "/users - User management\n"
+            "/metrics - Live pipeline metrics\n"
+            "/reload - Reload subscription plans\n"
             "/broadcast - Send message to all users"
         )
         
@@ -612,4 +564,99 @@ async def admin_back_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         
     except Exception as e:
         logger.error(f"Error going back to admin dashboard: {e}")
-        await query.answer(f"❌ Error: {e}", show_alert=True)
\ No newline at end of file
+        await query.answer(f"❌ Error: {e}", show_alert=True)
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE, admin_ids):
+    """Handle /metrics command - Show in-process pipeline metrics"""
+    if str(update.effective_user.id) not in admin_ids:
+        await update.message.reply_text("⛔ Unauthorized")
+        return
+    
+    try:
+        snap = metrics.snapshot()
+        counters = snap['counters']
+        gauges = snap['gauges']
+        
+        submitted = counters.get('jobs_submitted', 0)
+        coalesced = counters.get('dedup_inflight_hits', 0) + counters.get('dedup_recent_hits', 0)
+        dedup_rate = (coalesced / submitted * 100) if submitted > 0 else 0
+        
+        text = (
+            "📈 <b>Live Metrics</b>\n"
+            f"⏱ Uptime: <b>{snap['uptime_seconds'] / 3600:.1f}h</b>\n\n"
+            "🔄 <b>Jobs:</b>\n"
+            f"• Submitted: <b>{int(submitted)}</b>\n"
+            f"• Successful: <b>{int(counters.get('conversions_success', 0))}</b>\n"
+            f"• Failed: <b>{int(counters.get('conversions_failed', 0))}</b>\n"
+            f"• Limit exceeded: <b>{int(counters.get('conversions_limit_exceeded', 0))}</b>\n"
+            f"• Cancelled: <b>{int(counters.get('conversions_cancelled', 0))}</b>\n"
+            f"• Shed under load: <b>{int(counters.get('admission_shed', 0))}</b>\n\n"
+            "♻️ <b>Deduplication:</b>\n"
+            f"• Joined in-flight: <b>{int(counters.get('dedup_inflight_hits', 0))}</b>\n"
+            f"• Reused recent result: <b>{int(counters.get('dedup_recent_hits', 0))}</b>\n"
+            f"• Share of requests: <b>{dedup_rate:.1f}%</b>\n"
+            f"• Downloads saved: <b>{counters.get('dedup_bytes_saved', 0) / (1024 * 1024):.1f} MB</b>\n"
+        )
+        
+        pipeline_stats = gauges.get('pipeline')
+        if pipeline_stats:
+            text += (
+                "\n🏭 <b>Pipeline:</b>\n"
+                f"• Waiting: <b>{pipeline_stats['waiting']}</b>\n"
+                f"• Convert queues: <b>{pipeline_stats['convert']}</b>\n"
+                f"• Upload queue: <b>{pipeline_stats['upload']}</b>\n"
+                f"• Avg job: <b>{pipeline_stats['avg_job_seconds']}s</b>\n"
+            )
+        
+        admission_stats = gauges.get('admission')
+        if admission_stats:
+            signals = admission_stats['signals']
+            text += (
+                "\n🚦 <b>Load:</b>\n"
+                f"• Level: <b>{admission_stats['level']}</b>\n"
+                f"• Load/CPU: <b>{signals['load_per_cpu']:.2f}</b>\n"
+                f"• Memory used: <b>{signals['memory_used_pct']:.0f}%</b>\n"
+                f"• Loop lag: <b>{signals['loop_lag_ms']:.0f} ms</b>\n"
+            )
+        
+        workspace_stats = gauges.get('workspaces')
+        if workspace_stats:
+            text += (
+                "\n📁 <b>Workspaces:</b>\n"
+                f"• Active: <b>{workspace_stats['active_jobs']}</b>\n"
+                f"• RAM reserved: <b>{workspace_stats['ram_bytes_reserved'] / (1024 * 1024):.0f} MB</b>\n"
+                f"• Disk reserved: <b>{workspace_stats['disk_bytes_reserved'] / (1024 * 1024):.0f} MB</b>\n"
+            )
+        
+        # Every other registered gauge (caches, quota ledger, journal, spool, reference data)
+        for name, values in gauges.items():
+            if name in ('pipeline', 'admission', 'workspaces'):
+                continue
+            text += f"\n📊 <b>{name.replace('_', ' ').capitalize()}:</b>\n"
+            if not values:
+                text += "• <i>empty</i>\n"
+            for key, value in values.items():
+                text += f"• {str(key).replace('_', ' ').capitalize()}: <b>{value}</b>\n"
+        
+        await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+        
+    except Exception as e:
+        logger.error(f"Error in metrics command: {e}")
+        await update.message.reply_text(f"❌ Error: {e}")
+
+
+async def reload_command(update: Update, context: ContextTypes.DEFAULT_TYPE, db, admin_ids):
+    """Handle /reload command - Re-read subscription plans after editing them in the database"""
+    if str(update.effective_user.id) not in admin_ids:
+        await update.message.reply_text("⛔ Unauthorized")
+        return
+    
+    if not await db.reference.refresh():
+        await update.message.reply_text("❌ Could not load subscription plans, keeping the previous ones")
+        return
+    
+    plans = db.reference.active_plans()
+    text = f"🔄 <b>Reference data reloaded</b>\n\n📋 Active plans: <b>{len(plans)}</b>\n"
+    for plan in plans:
+        text += f"• {plan['name']}: <b>{plan['price']:,.0f}</b> / {plan['duration_days']} days\n"
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
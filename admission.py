@@ -0,0 +1,165 @@
+"""
+Load-aware admission control for conversion requests
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from config import (
+    ADMISSION_SAMPLE_INTERVAL_SECONDS, ADMISSION_THRESHOLDS,
+    ADMISSION_RECOVERY_FACTOR, ADMISSION_MIN_HOLD_SECONDS,
+    ADMISSION_LAG_EWMA_ALPHA, HEAVY_RESOURCE_CLASSES,
+)
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pressure levels, each one includes the measures of the levels below it
+NORMAL = 0
+DEFER = 1      # free-tier heavy jobs stay queued instead of being dispatched
+SHED_FREE = 2  # new free-tier requests are refused
+SHED_ALL = 3   # all new requests are refused
+
+LEVEL_NAMES = {NORMAL: 'normal', DEFER: 'defer', SHED_FREE: 'shed_free', SHED_ALL: 'shed_all'}
+
+
+def read_memory_used_pct() -> Optional[float]:
+    """Share of RAM in use according to /proc/meminfo (None if unavailable)"""
+    try:
+        values = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('MemTotal', 'MemAvailable'):
+                    values[key] = int(rest.split()[0])
+        return 100.0 * (1 - values['MemAvailable'] / values['MemTotal'])
+    except (OSError, KeyError, ValueError, ZeroDivisionError):
+        return None
+
+
+def read_load_per_cpu() -> Optional[float]:
+    """1-minute load average divided by the CPU count (None if unavailable)"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (OSError, AttributeError):
+        return None
+
+
+class AdmissionController:
+    """Samples host and bot load and decides whether new jobs may start
+
+    Escalation is immediate: the level jumps to the highest one any signal
+    crosses. Recovery is one level at a time, only after the level has been
+    held for ADMISSION_MIN_HOLD_SECONDS and every signal has dropped below
+    ADMISSION_RECOVERY_FACTOR of the current level's thresholds.
+    """
+
+    def __init__(self, pipeline, thresholds: Optional[dict] = None,
+                 interval: float = ADMISSION_SAMPLE_INTERVAL_SECONDS):
+        self.pipeline = pipeline
+        self.thresholds = dict(thresholds or ADMISSION_THRESHOLDS)
+        self.interval = interval
+        self.level = NORMAL
+        self.level_since = time.monotonic()
+        self.signals = {'load_per_cpu': 0.0, 'memory_used_pct': 0.0, 'queue_depth': 0, 'loop_lag_ms': 0.0}
+        self.shed_count = 0
+        self._task: Optional[asyncio.Task] = None
+        pipeline.scheduler.hold = self.should_defer
+
+    def start(self):
+        """Start the sampling task (call from the running event loop)"""
+        self._task = asyncio.create_task(self._sample_loop(), name='admission-sampler')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # Decisions
+    @staticmethod
+    def _is_free(tier_limits: dict) -> bool:
+        return tier_limits.get('tier', 'free') == 'free'
+
+    def should_defer(self, job) -> bool:
+        """Scheduler hook: keep free-tier heavy jobs queued while under pressure"""
+        return (self.level >= DEFER and self._is_free(job.tier_limits)
+                and job.resource_class in HEAVY_RESOURCE_CLASSES)
+
+    def check(self, tier_limits: dict) -> Optional[int]:
+        """Return minutes to wait if a new request must be refused, else None"""
+        if self.level >= SHED_ALL or (self.level >= SHED_FREE and self._is_free(tier_limits)):
+            self.shed_count += 1
+            metrics.incr('admission_shed')
+            return self.retry_minutes()
+        return None
+
+    def retry_minutes(self) -> int:
+        """Rough time for the current backlog to drain"""
+        wait = self.pipeline.estimate_wait_seconds(self.pipeline.scheduler.qsize())
+        return min(30, max(1, math.ceil(wait / 60)))
+
+    # Sampling
+    async def _sample_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - scheduled) * 1000)
+            try:
+                self._update(lag_ms)
+            except Exception as e:
+                logger.error(f"Error sampling load: {e}")
+
+    def _update(self, lag_ms: float):
+        signals = self.signals
+        signals['loop_lag_ms'] += ADMISSION_LAG_EWMA_ALPHA * (lag_ms - signals['loop_lag_ms'])
+        # Deferred jobs are left out, otherwise they would hold the level up themselves
+        signals['queue_depth'] = sum(
+            1 for job in self.pipeline.scheduler.ordered() if not self.should_defer(job)
+        )
+        load = read_load_per_cpu()
+        if load is not None:
+            signals['load_per_cpu'] = load
+        memory = read_memory_used_pct()
+        if memory is not None:
+            signals['memory_used_pct'] = memory
+
+        target = self._level_for(1.0)
+        now = time.monotonic()
+        if target > self.level:
+            self._set_level(target, now)
+        elif (self.level > NORMAL and now - self.level_since >= ADMISSION_MIN_HOLD_SECONDS
+              and self._level_for(ADMISSION_RECOVERY_FACTOR) < self.level):
+            self._set_level(self.level - 1, now)
+
+    def _level_for(self, factor: float) -> int:
+        """Highest level whose threshold (scaled by factor) any signal reaches"""
+        level = NORMAL
+        for name, limits in self.thresholds.items():
+            value = self.signals.get(name, 0)
+            for i, threshold in enumerate(limits, start=1):
+                if value >= threshold * factor:
+                    level = max(level, i)
+        return level
+
+    def _set_level(self, level: int, now: float):
+        previous, self.level, self.level_since = self.level, level, now
+        signals = ', '.join(f"{k}={v:.1f}" for k, v in self.signals.items())
+        if level > previous:
+            logger.warning(f"🚦 Load level {LEVEL_NAMES[previous]} -> {LEVEL_NAMES[level]} ({signals})")
+        else:
+            logger.info(f"🚦 Load level {LEVEL_NAMES[previous]} -> {LEVEL_NAMES[level]} ({signals})")
+        # Deferred jobs may be dispatchable again
+        self.pipeline.scheduler.wake()
+
+    def stats(self) -> dict:
+        return {
+            'level': LEVEL_NAMES[self.level],
+            'signals': dict(self.signals),
+            'shed': self.shed_count,
+        }
@@ -0,0 +1,109 @@
+"""
+Benchmark: in-memory conversion path vs. workspace (disk) path
+
+Simulates the convert_callback job for small files without Telegram:
+the disk path writes the "downloaded" input into a job workspace,
+converts file to file and reads the output back for upload; the memory
+path converts buffer to buffer.
+
+Usage:
+    python benchmarks/bench_memory_path.py --jobs 500
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PIL import Image
+
+from converters import FileConverter
+from workspace import WorkspaceManager
+
+# Per-job INFO logs would dominate the timings
+logging.disable(logging.INFO)
+
+
+def make_png(size=(640, 480)) -> bytes:
+    """Small RGBA test image, roughly the size of a Telegram photo thumbnail"""
+    img = Image.new('RGBA', size)
+    for x in range(0, size[0], 8):
+        for y in range(0, size[1], 8):
+            img.putpixel((x, y), (x % 256, y % 256, (x * y) % 256, 255))
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def make_json(rows=200) -> bytes:
+    """Small JSON document with a list of flat records"""
+    data = [{'id': i, 'name': f'user_{i}', 'score': i * 1.5} for i in range(rows)]
+    return json.dumps(data).encode('utf-8')
+
+
+def run_disk(converter, workspaces, data, name, target, jobs):
+    for _ in range(jobs):
+        with workspaces.workspace(len(data), label='bench') as ws:
+            input_path = ws.path_for(name)
+            with open(input_path, 'wb') as f:
+                f.write(data)
+            output_path = converter.convert(input_path, target)
+            with open(output_path, 'rb') as f:
+                f.read()
+
+
+def run_memory(converter, data, ext, target, jobs):
+    for _ in range(jobs):
+        converter.convert_bytes(data, ext, target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--jobs', type=int, default=300)
+    parser.add_argument('--tmpfs', action='store_true',
+                        help='let the disk path use tmpfs workspaces (default: disk only)')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_workspace_')
+    converter = FileConverter(temp_dir=os.path.join(root, 'converter'))
+    workspaces = WorkspaceManager(
+        disk_root=os.path.join(root, 'jobs'),
+        tmpfs_root='/dev/shm/bench_converter' if args.tmpfs else None,
+    )
+
+    cases = [
+        ('photo.png', 'png', 'jpg', make_png()),
+        ('photo.png', 'png', 'pdf', make_png()),
+        ('data.json', 'json', 'csv', make_json()),
+        ('data.json', 'json', 'xml', make_json()),
+    ]
+
+    print(f"{'case':<16}{'size':>10}{'disk jobs/s':>14}{'memory jobs/s':>16}{'speedup':>10}")
+    try:
+        for name, ext, target, data in cases:
+            started = time.perf_counter()
+            run_disk(converter, workspaces, data, name, target, args.jobs)
+            disk_rate = args.jobs / (time.perf_counter() - started)
+
+            started = time.perf_counter()
+            run_memory(converter, data, ext, target, args.jobs)
+            memory_rate = args.jobs / (time.perf_counter() - started)
+
+            print(
+                f"{ext + '->' + target:<16}{len(data):>10}"
+                f"{disk_rate:>14.1f}{memory_rate:>16.1f}{memory_rate / disk_rate:>9.2f}x"
+            )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree('/dev/shm/bench_converter', ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+Benchmark: query plans and latencies of the bot's queries on large tables
+
+Seeds a scratch Postgres database with millions of rows (users, stats,
+conversions and payments), applies migrations/ and then, for every query
+admin.py, broadcast.py and database.py send (as PostgREST or the asyncpg
+backend would run them), checks with EXPLAIN that it uses the expected
+index and that its median latency stays within budget. Exits non-zero if
+any check fails.
+
+Run it against a throwaway database only: it creates the tables, seeds
+rows with user ids from 1 and, with --reseed, truncates everything first.
+
+Usage:
+    python benchmarks/bench_query_plans.py --dsn postgresql://localhost/converter_bench
+    python benchmarks/bench_query_plans.py --dsn ... --conversions 5000000 --users 500000
+    python benchmarks/bench_query_plans.py --dsn ... --skip-indexes   # plans without 002
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import asyncpg
+
+from migrate import apply_migrations
+
+logging.disable(logging.INFO)
+
+# Median latency budgets (ms)
+POINT_MS = 5      # primary-key lookups
+RANGE_MS = 50     # index range scans, top-N by an indexed column; writes
+SCAN_MS = 1500    # counts and reads over most of a table
+
+TODAY = datetime.now(timezone.utc).date()
+TODAY_ISO = TODAY.isoformat()
+WEEK_AGO = TODAY - timedelta(days=7)
+
+# (source, description, sql, args, index expected in the plan or None, budget ms)
+QUERIES = [
+    # admin.py
+    ('admin', 'recent users', "SELECT user_id, username, first_name, subscription_tier, created_at "
+     "FROM converter_users ORDER BY created_at DESC LIMIT 15", (), 'idx_converter_users_created_at', RANGE_MS),
+    ('admin', 'recent payments', "SELECT id, user_id, amount, status, created_at "
+     "FROM converter_payments ORDER BY created_at DESC LIMIT 10", (), 'idx_converter_payments_created_at', RANGE_MS),
+    ('admin', 'pending payments count', "SELECT count(*) FROM converter_payments WHERE status = $1",
+     ('pending',), 'idx_converter_payments_status', RANGE_MS),
+    # Most payments are approved: a sequential scan is the right plan here
+    ('admin', 'approved revenue', "SELECT amount FROM converter_payments WHERE status = $1",
+     ('approved',), None, SCAN_MS),
+    ('admin', 'premium users', "SELECT user_id, username, first_name, subscription_expires_at "
+     "FROM converter_users WHERE subscription_tier = $1 ORDER BY subscription_expires_at DESC LIMIT 1000",
+     ('premium',), 'idx_converter_users_tier_expires', RANGE_MS),
+    ('admin', 'recent conversions', "SELECT user_id, original_format, target_format, conversion_status, created_at "
+     "FROM file_conversions ORDER BY created_at DESC LIMIT 15", (), 'idx_file_conversions_created_at', RANGE_MS),
+    ('admin', 'conversions today count', "SELECT count(*) FROM file_conversions WHERE created_at >= $1",
+     (datetime.combine(TODAY, datetime.min.time(), timezone.utc),), 'idx_file_conversions_created_at', RANGE_MS),
+    ('admin', 'total users count', "SELECT count(*) FROM converter_users", (), None, SCAN_MS),
+    ('admin', 'premium users count', "SELECT count(*) FROM converter_users WHERE subscription_tier = $1",
+     ('premium',), 'idx_converter_users_tier_expires', RANGE_MS),
+    ('admin', 'active today count', "SELECT count(*) FROM converter_user_stats WHERE last_conversion_date = $1",
+     (TODAY,), 'idx_converter_user_stats_last_date', RANGE_MS),
+    ('admin', 'active this week count', "SELECT count(*) FROM converter_user_stats WHERE last_conversion_date >= $1",
+     (WEEK_AGO,), 'idx_converter_user_stats_last_date', RANGE_MS),
+    ('admin', 'total conversions count', "SELECT count(*) FROM file_conversions", (), None, SCAN_MS),
+    ('admin', 'successful conversions count', "SELECT count(*) FROM file_conversions WHERE conversion_status = $1",
+     ('success',), 'idx_file_conversions_status', SCAN_MS),
+    ('admin', 'format sample', "SELECT original_format, target_format FROM file_conversions LIMIT 1000",
+     (), None, RANGE_MS),
+    # broadcast.py
+    ('broadcast', 'audience count', "SELECT count(*) FROM converter_users WHERE language_code = $1",
+     ('ru',), 'idx_converter_users_language', SCAN_MS),
+    ('broadcast', 'audience ids', "SELECT user_id FROM converter_users WHERE language_code = $1",
+     ('ru',), 'idx_converter_users_language', SCAN_MS),
+    # database.py
+    ('database', 'get_user', "SELECT * FROM converter_users WHERE user_id = $1",
+     (4242,), 'converter_users_pkey', POINT_MS),
+    ('database', 'get_user_stats', "SELECT * FROM converter_user_stats WHERE user_id = $1",
+     (4242,), 'converter_user_stats_pkey', POINT_MS),
+    ('database', 'get_payment', "SELECT * FROM converter_payments WHERE id = $1",
+     (4242,), 'converter_payments_pkey', POINT_MS),
+    ('database', 'get_plan_by_id', "SELECT * FROM subscription_plans WHERE id = $1", (2,), None, POINT_MS),
+    ('database', 'get_subscription_plans', "SELECT * FROM subscription_plans WHERE is_active = $1",
+     (True,), None, POINT_MS),
+    ('database', 'quota ledger refresh', "SELECT * FROM converter_user_stats WHERE last_conversion_date = $1 "
+     "ORDER BY user_id LIMIT 200 OFFSET 400", (TODAY,), 'idx_converter_user_stats_last_date', RANGE_MS),
+    ('database', 'quota ledger merge read', "SELECT * FROM converter_user_stats WHERE user_id = ANY($1)",
+     (list(range(1000, 1200)),), 'converter_user_stats_pkey', RANGE_MS),
+]
+
+# Writes run inside a transaction that is rolled back; plans are not checked
+WRITES = [
+    ('database', 'create_converter_user', "SELECT * FROM create_converter_user($1, $2, $3, $4, $5)",
+     (10 ** 12, 'bench', 'Bench', None, 'en')),
+    ('database', 'update_user_language', "UPDATE converter_users SET language_code = $1 WHERE user_id = $2",
+     ('uz', 4242)),
+    ('database', 'extend_premium', "SELECT extend_premium($1, $2)", (4242, 30)),
+    ('database', 'downgrade_to_free', "UPDATE converter_users SET subscription_tier = 'free', "
+     "subscription_expires_at = NULL WHERE user_id = $1", (4242,)),
+    ('database', 'create_payment', "INSERT INTO converter_payments (user_id, plan_id, amount, status) "
+     "VALUES ($1, $2, $3, 'pending') RETURNING id", (4242, 1, 10000)),
+    ('database', 'approve_converter_payment', "SELECT approve_converter_payment($1, $2)", (4242, 1)),
+    ('database', 'reject_payment', "UPDATE converter_payments SET status = 'rejected', processed_at = now(), "
+     "processed_by = $2, admin_notes = $3 WHERE id = $1", (4243, 1, 'bench')),
+    ('database', 'log_conversion (batch of 100)', "INSERT INTO file_conversions "
+     "(user_id, original_filename, original_format, target_format, file_size_bytes, conversion_status) "
+     "SELECT 1 + g, 'bench.png', 'png', 'jpg', 1024, 'success' FROM generate_series(1, 100) g", ()),
+    ('database', 'apply_user_stats_deltas (200 users)', "SELECT * FROM apply_user_stats_deltas($1::jsonb)",
+     (json.dumps([{'user_id': 1 + i, 'date': TODAY_ISO, 'today': 1, 'total': 1, 'size': 1024}
+                  for i in range(200)]),)),
+]
+
+SEED = {
+    'converter_users': """
+        INSERT INTO converter_users (user_id, username, first_name, language_code, subscription_tier,
+                                     subscription_expires_at, created_at)
+        SELECT g, 'user_' || g, 'User', (ARRAY['uz', 'uz', 'ru', 'en'])[1 + g % 4],
+               CASE WHEN g % 20 = 0 THEN 'premium' ELSE 'free' END,
+               CASE WHEN g % 20 = 0 THEN now() + (g % 365) * interval '1 day' END,
+               now() - (g % 730) * interval '1 day' - (g % 86400) * interval '1 second'
+          FROM generate_series(1, $1) g
+    """,
+    'converter_user_stats': """
+        INSERT INTO converter_user_stats (user_id, conversions_today, total_conversions,
+                                          last_conversion_date, total_files_size_bytes)
+        SELECT g, g % 5, g % 500, current_date - (g % 90), (g % 500) * 100000
+          FROM generate_series(1, $1) g
+    """,
+    'file_conversions': """
+        INSERT INTO file_conversions (user_id, original_filename, original_format, target_format,
+                                      file_size_bytes, conversion_status, error_message,
+                                      processing_time_seconds, created_at)
+        SELECT 1 + g % $2, 'file_' || g, (ARRAY['png', 'jpg', 'pdf', 'docx', 'mp4', 'mp3'])[1 + g % 6],
+               (ARRAY['pdf', 'jpg', 'png', 'mp3'])[1 + g % 4], 1000 + g % 10000000,
+               CASE WHEN g % 20 = 0 THEN 'failed' ELSE 'success' END,
+               CASE WHEN g % 20 = 0 THEN 'bench error' END, (g % 100) / 10.0,
+               now() - (g % 365) * interval '1 day' - (g % 86400) * interval '1 second'
+          FROM generate_series(1, $1) g
+    """,
+    'converter_payments': """
+        INSERT INTO converter_payments (user_id, plan_id, amount, status, created_at)
+        SELECT 1 + g % $2, 1 + g % 3, (ARRAY[10000, 25000, 80000])[1 + g % 3],
+               CASE WHEN g % 50 = 0 THEN 'pending' WHEN g % 10 = 1 THEN 'rejected' ELSE 'approved' END,
+               now() - (g % 365) * interval '1 day'
+          FROM generate_series(1, $1) g
+    """,
+}
+
+
+async def seed(conn, args):
+    sizes = {
+        'converter_users': (args.users,),
+        'converter_user_stats': (args.users,),
+        'file_conversions': (args.conversions, args.users),
+        'converter_payments': (args.payments, args.users),
+    }
+    if args.reseed:
+        await conn.execute(
+            "TRUNCATE file_conversions, converter_payments, converter_user_stats, converter_users"
+        )
+    for table, params in sizes.items():
+        existing = await conn.fetchval(f"SELECT count(*) FROM {table}")
+        if existing >= params[0]:
+            continue
+        if existing:
+            raise SystemExit(f"{table} has {existing} rows, fewer than requested: rerun with --reseed")
+        started = time.perf_counter()
+        await conn.execute(SEED[table], *params)
+        print(f"seeded {table}: {params[0]:,} rows in {time.perf_counter() - started:.1f}s")
+    # Steady state: autovacuum has set the visibility map, so index-only scans are possible
+    await conn.execute("VACUUM ANALYZE")
+
+
+def plan_indexes(plan: dict) -> set:
+    """Index names used anywhere in an EXPLAIN (FORMAT JSON) plan tree"""
+    found = set()
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if 'Index Name' in node:
+            found.add(node['Index Name'])
+        stack.extend(node.get('Plans', []))
+    return found
+
+
+async def check_query(conn, sql, args, index, budget, runs):
+    raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]['Plan']
+    used = plan_indexes(plan)
+    statement = await conn.prepare(sql)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await statement.fetch(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+    median = statistics.median(timings)
+    problems = []
+    if index and index not in used:
+        problems.append(f"expected {index}, plan: {plan['Node Type']} {sorted(used) or ''}".rstrip())
+    if median > budget:
+        problems.append(f"p50 {median:.1f}ms > {budget}ms")
+    return median, max(timings), plan['Node Type'], problems
+
+
+async def check_write(conn, sql, args, runs):
+    timings = []
+    for _ in range(runs):
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            started = time.perf_counter()
+            await conn.fetch(sql, *args)
+            timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            await transaction.rollback()
+    median = statistics.median(timings)
+    problems = [f"p50 {median:.1f}ms > {RANGE_MS}ms"] if median > RANGE_MS else []
+    return median, max(timings), problems
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--dsn', required=True, help='scratch Postgres database')
+    parser.add_argument('--users', type=int, default=200_000)
+    parser.add_argument('--conversions', type=int, default=2_000_000)
+    parser.add_argument('--payments', type=int, default=100_000)
+    parser.add_argument('--runs', type=int, default=20, help='timed executions per query')
+    parser.add_argument('--reseed', action='store_true', help='truncate and seed again')
+    parser.add_argument('--skip-indexes', action='store_true',
+                        help='do not apply 002_indexes.sql (to see the plans without it)')
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        await apply_migrations(conn, skip=('002',) if args.skip_indexes else ())
+        await seed(conn, args)
+
+        failures = 0
+        print(f"\n{'source':<10}{'query':<38}{'plan':<18}{'p50 ms':>9}{'max ms':>9}  result")
+        for source, name, sql, query_args, index, budget in QUERIES:
+            median, worst, node, problems = await check_query(conn, sql, query_args, index, budget, args.runs)
+            failures += bool(problems)
+            print(f"{source:<10}{name:<38}{node:<18}{median:>9.2f}{worst:>9.2f}  "
+                  f"{'; '.join(problems) if problems else 'ok'}")
+        for source, name, sql, query_args in WRITES:
+            median, worst, problems = await check_write(conn, sql, query_args, args.runs)
+            failures += bool(problems)
+            print(f"{source:<10}{name:<38}{'(write)':<18}{median:>9.2f}{worst:>9.2f}  "
+                  f"{'; '.join(problems) if problems else 'ok'}")
+    finally:
+        await conn.close()
+
+    total = len(QUERIES) + len(WRITES)
+    print(f"\n{total - failures}/{total} queries within plan and latency expectations")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
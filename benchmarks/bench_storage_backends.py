@@ -0,0 +1,144 @@
+"""
+Benchmark: storage backend throughput (Supabase REST vs. direct Postgres vs. SQLite)
+
+Runs the queries on the conversion path straight against each backend
+(no DatabaseManager caches in between): the user and stats lookups, the
+file_conversions insert and the quota merge. Each operation is issued
+--ops times from --concurrency tasks; the table shows operations per
+second and p50 / p99 latency.
+
+Point it at a scratch database with the bot's tables (and
+migrations/001_rpc_functions.sql for the quota merge): it writes users
+with ids from 9000000000 up and conversion rows for them.
+
+Usage:
+    python benchmarks/bench_storage_backends.py --sqlite
+    python benchmarks/bench_storage_backends.py --dsn postgresql://localhost/converter_test
+    python benchmarks/bench_storage_backends.py --supabase-url URL --supabase-key KEY --dsn DSN
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Connection and fallback logs would interleave with the table
+logging.disable(logging.WARNING)
+
+BASE_USER_ID = 9_000_000_000
+
+
+async def seed(store, users: int):
+    rows = [
+        {'user_id': BASE_USER_ID + i, 'username': f'bench_{i}', 'language_code': 'en',
+         'subscription_tier': 'free'}
+        for i in range(users)
+    ]
+    for i in range(0, users, 500):
+        await store.upsert('converter_users', rows[i:i + 500], on_conflict='user_id')
+        await store.upsert('converter_user_stats', [
+            {'user_id': row['user_id'], 'conversions_today': 0, 'total_conversions': 0,
+             'total_files_size_bytes': 0}
+            for row in rows[i:i + 500]
+        ], on_conflict='user_id')
+
+
+def operations(store, users: int):
+    today = datetime.now(timezone.utc).date().isoformat()
+
+    def user(n):
+        return BASE_USER_ID + n % users
+
+    async def get_user(n):
+        await store.select('converter_users', filters={'user_id': user(n)})
+
+    async def get_user_stats(n):
+        await store.select('converter_user_stats', filters={'user_id': user(n)})
+
+    async def log_conversion(n):
+        await store.insert('file_conversions', {
+            'user_id': user(n), 'original_filename': 'bench.png', 'original_format': 'png',
+            'target_format': 'jpg', 'file_size_bytes': 1024, 'conversion_status': 'success',
+            'processing_time_seconds': 0.5,
+        })
+
+    async def increment_stats(n):
+        await store.rpc('apply_user_stats_deltas', {'p_deltas': [
+            {'user_id': user(n), 'date': today, 'today': 1, 'total': 1, 'size': 1024}
+        ]})
+
+    return [
+        ('get_user', get_user),
+        ('get_user_stats', get_user_stats),
+        ('log_conversion', log_conversion),
+        ('increment_stats', increment_stats),
+    ]
+
+
+async def measure(operation, ops: int, concurrency: int):
+    latencies = []
+    counter = iter(range(ops))
+
+    async def worker():
+        for n in counter:
+            started = time.perf_counter()
+            await operation(n)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return ops / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+async def run_backend(name, store, args):
+    try:
+        await seed(store, args.users)
+        for label, operation in operations(store, args.users):
+            await measure(operation, min(args.ops, 50), args.concurrency)  # warm connections / statements
+            rate, p50, p99 = await measure(operation, args.ops, args.concurrency)
+            print(f"{name:<10}{label:<18}{rate:>12.1f}{p50 * 1000:>12.2f}{p99 * 1000:>12.2f}")
+    except Exception as e:
+        print(f"{name:<10}failed: {e}")
+    finally:
+        await store.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ops', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--dsn', help='Postgres connection string for the asyncpg backend')
+    parser.add_argument('--supabase-url', default=os.environ.get('ACTIVITY_SUPABASE_URL'))
+    parser.add_argument('--supabase-key', default=os.environ.get('ACTIVITY_SUPABASE_KEY'))
+    parser.add_argument('--sqlite', action='store_true', help='also run the embedded SQLite backend')
+    args = parser.parse_args()
+
+    print(f"{'backend':<10}{'operation':<18}{'ops/s':>12}{'p50 ms':>12}{'p99 ms':>12}")
+    if args.supabase_url and args.supabase_key:
+        from rest_client import AsyncRestClient
+        await run_backend('rest', AsyncRestClient(args.supabase_url, args.supabase_key), args)
+    if args.dsn:
+        from postgres_backend import PostgresBackend
+        await run_backend('postgres', PostgresBackend(args.dsn), args)
+    if args.sqlite:
+        from sqlite_backend import SQLiteBackend
+        root = tempfile.mkdtemp(prefix='bench_sqlite_')
+        try:
+            await run_backend('sqlite', SQLiteBackend(os.path.join(root, 'converter.db')), args)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
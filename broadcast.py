@@ -107,16 +107,8 @@ class BroadcastManager:
         }
         
         # Get user count for this language
-        if lang_code == 'all':
-            users_result = self.db.supabase.table('converter_users').select(
-                'user_id', count='exact'
-            ).execute()
-        else:
-            users_result = self.db.supabase.table('converter_users').select(
-                'user_id', count='exact'
-            ).eq('language_code', lang_code).execute()
-        
-        user_count = users_result.count or 0
+        filters = None if lang_code == 'all' else {'language_code': lang_code}
+        user_count = await self.db.store.count('converter_users', filters=filters)
         
         lang_names = {
             'uz': '🇺🇿 Uzbek',
@@ -183,18 +175,13 @@ class BroadcastManager:
             return
         
         # Get users
-        if lang_code == 'all':
-            users_result = self.db.supabase.table('converter_users').select('user_id').execute()
-        else:
-            users_result = self.db.supabase.table('converter_users').select(
-                'user_id'
-            ).eq('language_code', lang_code).execute()
+        filters = None if lang_code == 'all' else {'language_code': lang_code}
+        users = await self.db.store.select('converter_users', 'user_id', filters=filters)
         
-        if not users_result.data:
+        if not users:
             await query.edit_message_text("❌ No users found")
             return
         
-        users = users_result.data
         total_users = len(users)
         
         # Update message to show progress
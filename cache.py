@@ -0,0 +1,111 @@
+"""
+In-process TTL cache for per-user lookups
+"""
+
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Result handed to waiters when the load they joined was cancelled
+_RETRY = object()
+
+
+class TTLCache:
+    """LRU-bounded cache whose entries expire after ttl seconds or on invalidate()
+
+    get_or_load() also coalesces concurrent loads of the same key, so a burst
+    of updates from one user costs a single database round-trip.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 10000, name: str = 'cache'):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._loading = {}             # key -> future of an in-progress load
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Forget a key; a load already in progress will not be stored"""
+        self._entries.pop(key, None)
+        self._loading.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._loading.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Cached value, loading and caching it on a miss (None results are not cached)"""
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            pending = self._loading.get(key)
+            if pending is None:
+                break
+            value = await asyncio.shield(pending)
+            if value is not _RETRY:
+                self.hits += 1
+                return value
+            # The caller that was loading it got cancelled: load it ourselves
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            value = await loader()
+        except Exception as e:
+            self._finish_load(key, future)
+            future.set_exception(e)
+            future.exception()  # waiters re-raise it; don't warn if there are none
+            raise
+        except BaseException:
+            # Cancelled: only this caller was, so the waiters retry instead of seeing CancelledError
+            self._finish_load(key, future)
+            future.set_result(_RETRY)
+            raise
+        # Only store if nobody invalidated the key while we were loading
+        if self._finish_load(key, future) and value is not None:
+            self.set(key, value)
+        future.set_result(value)
+        return value
+
+    def _finish_load(self, key: Hashable, future) -> bool:
+        """Drop our load marker; False if the key was invalidated meanwhile"""
+        if self._loading.get(key) is future:
+            del self._loading[key]
+            return True
+        return False
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
@@ -25,15 +25,165 @@ NOTIFICATION_ADMIN_IDS = ["8437026582", "999932510"]
 
 # FREEMIUM LIMITS
 FREE_TIER_LIMITS = {
+    'tier': 'free',
     'daily_conversions': 30,  # 30 conversions per day for free users
     'max_file_size_mb': 50,   # 50 MB max file size
+    # Per-job resource limits for converter processes
+    'max_memory_mb': 1024,         # RLIMIT_AS / cgroup memory.max
+    'max_cpu_seconds': 300,        # RLIMIT_CPU
+    'max_output_mb': 200,          # RLIMIT_FSIZE
+    'max_image_pixels': 50_000_000,
+    'scheduler_weight': 1,         # share of worker dispatches under contention
+    'max_concurrent_jobs': 1,      # jobs running in the pipeline at once
+    'max_queued_jobs': 3,          # running + waiting; further clicks are refused
 }
 
 PREMIUM_TIER_LIMITS = {
+    'tier': 'premium',
     'daily_conversions': -1,  # Unlimited
     'max_file_size_mb': 500,  # 500 MB max file size
+    # Per-job resource limits for converter processes
+    'max_memory_mb': 2048,
+    'max_cpu_seconds': 900,
+    'max_output_mb': 1024,
+    'max_image_pixels': 150_000_000,
+    'scheduler_weight': 4,
+    'max_concurrent_jobs': 2,
+    'max_queued_jobs': 10,
 }
 
+TIER_LIMITS = {
+    'free': FREE_TIER_LIMITS,
+    'premium': PREMIUM_TIER_LIMITS,
+}
+
+# Delegated cgroup v2 directory for per-job slices (falls back to rlimits if unset)
+CGROUP_ROOT = os.environ.get("CONVERTER_CGROUP_ROOT")
+
+# Job workspaces
+WORKSPACE_DISK_ROOT = os.environ.get("WORKSPACE_DISK_ROOT", "/tmp/converter/jobs")
+WORKSPACE_TMPFS_ROOT = os.environ.get("WORKSPACE_TMPFS_ROOT", "/dev/shm/converter")
+WORKSPACE_RAM_BUDGET_MB = int(os.environ.get("WORKSPACE_RAM_BUDGET_MB", "512"))
+WORKSPACE_SIZE_FACTOR = 3  # input + output + scratch, as a multiple of the input size
+
+# Temp-file sweeper and disk admission control
+WORKSPACE_SWEEP_INTERVAL_SECONDS = 600
+WORKSPACE_MAX_AGE_MINUTES = 60      # anything older is an orphan
+WORKSPACE_MAX_TOTAL_MB = 4096       # oldest artifacts go first above this
+DISK_FREE_WATERMARK_MB = 1024       # keep at least this much free after a download
+DISK_ADMISSION_WAIT_SECONDS = 60    # how long a job waits for space before being refused
+
+# Files up to this size (of in-memory capable types) skip the workspace entirely
+MEMORY_PATH_MAX_BYTES = int(os.environ.get("MEMORY_PATH_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# Pipe-through ffmpeg streaming for audio/video
+STREAMING_ENABLED = os.environ.get("STREAMING_ENABLED", "1") == "1"
+STREAM_CHUNK_SIZE = 256 * 1024
+STREAM_SPOOL_MAX_BYTES = 64 * 1024 * 1024  # converted output spills to disk only above this
+
+# Download / convert / upload pipeline
+PIPELINE_DOWNLOAD_WORKERS = 4
+PIPELINE_UPLOAD_WORKERS = 3
+PIPELINE_STAGE_QUEUE_SIZE = 8  # jobs waiting between stages before upstream workers block
+CONVERT_CONCURRENCY = {
+    'ffmpeg': 2,   # audio / video
+    'office': 1,   # LibreOffice, poppler, PyPDF2
+    'image': 4,    # Pillow, ImageMagick
+    'data': 4,     # JSON / CSV / XML
+}
+
+# Fair scheduling between users (weights live in the tier limits)
+SCHEDULER_MAX_SLOTS_PER_USER = 2  # default when a tier has no 'max_concurrent_jobs'
+
+# Queue position updates on the processing message
+QUEUE_STATUS_INTERVAL_SECONDS = 3   # how often queued jobs are re-ranked
+QUEUE_STATUS_MIN_EDIT_SECONDS = 10  # per message, well under Telegram's edit limits
+QUEUE_STATUS_MAX_EDITS_PER_TICK = 20
+JOB_DURATION_EWMA_ALPHA = 0.2
+JOB_DURATION_INITIAL_SECONDS = 30   # ETA basis until real jobs have finished
+
+# ffmpeg progress reporting (-progress) and stall watchdog
+PROGRESS_UPDATE_INTERVAL_SECONDS = 3
+PROGRESS_MIN_EDIT_SECONDS = 10      # per message, like queue position edits
+FFMPEG_STALL_SECONDS = 90           # output position not moving for this long -> kill
+
+# Load-aware admission control
+# Thresholds per signal for the defer / shed_free / shed_all levels
+ADMISSION_THRESHOLDS = {
+    'load_per_cpu': (1.0, 1.5, 2.5),      # 1-minute load average per CPU
+    'memory_used_pct': (80, 90, 95),
+    'queue_depth': (20, 50, 100),         # jobs waiting in the scheduler
+    'loop_lag_ms': (100, 300, 1000),      # event loop scheduling delay (EWMA)
+}
+ADMISSION_SAMPLE_INTERVAL_SECONDS = 2
+ADMISSION_RECOVERY_FACTOR = 0.8   # step down only once all signals are below 80% of the level's thresholds
+ADMISSION_MIN_HOLD_SECONDS = 30   # minimum time at a level before stepping down
+ADMISSION_LAG_EWMA_ALPHA = 0.3
+HEAVY_RESOURCE_CLASSES = ('ffmpeg', 'office')  # deferred first for free users
+
+# Identical requests (same file_unique_id, target and tier) share one conversion;
+# requests arriving shortly after it finished reuse the sent Telegram file_id
+DEDUP_RESULT_TTL_SECONDS = 300
+
+# Durable job journal (SQLite WAL); unfinished jobs are resumed on startup
+JOURNAL_PATH = os.environ.get("JOB_JOURNAL_PATH", "data/job_journal.db")
+JOURNAL_MAX_ATTEMPTS = 3  # a job interrupted this many times is given up on
+JOURNAL_LEASE_SECONDS = 60           # a process owns a job while its lease is fresh
+JOURNAL_CLAIM_INTERVAL_SECONDS = 2   # how often idle capacity pulls jobs from the journal
+
+# Split deployment: "inline" converts in the bot process; "enqueue" only journals
+# jobs and leaves the conversions to `python worker.py` processes
+CONVERSION_MODE = os.environ.get("CONVERSION_MODE", "inline")
+WORKER_PREFETCH = 4  # claimed jobs a process keeps waiting locally
+
+# Graceful drain on SIGTERM: keep the orchestrator's kill timeout above the sum of these
+DRAIN_DEADLINE_SECONDS = int(os.environ.get("DRAIN_DEADLINE_SECONDS", "120"))
+DRAIN_FLUSH_TIMEOUT_SECONDS = 15  # per flush hook
+
+# Storage backend behind DatabaseManager: "supabase" (REST API), "postgres" (direct
+# asyncpg connection to the same database) or "sqlite" (embedded file for
+# single-node deployments)
+DB_BACKEND = os.environ.get("DB_BACKEND", "supabase")
+SQLITE_DB_PATH = os.environ.get("SQLITE_DB_PATH", "data/converter.db")
+SQLITE_STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection
+# Direct or session-mode connection string (transaction-mode poolers drop prepared statements)
+PG_DSN = os.environ.get("DATABASE_URL")
+PG_POOL_MIN_SIZE = 2
+PG_POOL_MAX_SIZE = 10
+PG_STATEMENT_CACHE_SIZE = 256
+
+# Async PostgREST client used by DatabaseManager (one pooled HTTP/2 connection set per process)
+DB_MAX_CONCURRENT_REQUESTS = 20   # in-flight requests; more wait instead of opening sockets
+DB_MAX_CONNECTIONS = 10
+DB_KEEPALIVE_SECONDS = 60
+DB_TIMEOUT_SECONDS = 10
+DB_CONNECT_TIMEOUT_SECONDS = 5
+
+# Per-user lookup cache (user row and stats), invalidated on every write through DatabaseManager
+USER_CACHE_TTL_SECONDS = 60
+USER_STATS_CACHE_TTL_SECONDS = 15  # short: workers in a split deployment update stats too
+USER_CACHE_MAX_ENTRIES = 10000
+
+# Write-behind quota ledger: conversion counts live in memory, converter_user_stats is
+# updated in batches and re-read periodically to pick up other processes' conversions
+QUOTA_FLUSH_INTERVAL_SECONDS = 10
+QUOTA_REFRESH_INTERVAL_SECONDS = 60
+QUOTA_BATCH_SIZE = 200  # users per select / upsert request
+
+# Lapsed premium subscriptions are moved to the free tier by a JobQueue task this often
+PREMIUM_EXPIRY_INTERVAL_SECONDS = 300
+
+# Subscription plans are served from memory and re-read this often (or on the admin /reload)
+REFERENCE_REFRESH_INTERVAL_SECONDS = 3600
+
+# Durable write-behind spool for file_conversions rows (SQLite WAL, shared by all processes)
+SPOOL_PATH = os.environ.get("CONVERSION_LOG_SPOOL_PATH", "data/conversion_log_spool.db")
+SPOOL_BATCH_SIZE = 100              # flush as soon as this many rows are waiting...
+SPOOL_FLUSH_INTERVAL_SECONDS = 5    # ...or after this long
+SPOOL_RETRY_BASE_SECONDS = 2        # backoff after a failed insert doubles up to the max
+SPOOL_RETRY_MAX_SECONDS = 300
+SPOOL_LEASE_SECONDS = 60            # a batch being inserted is hidden from other processes
+
 # Logging setup
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
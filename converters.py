@@ -3,8 +3,11 @@ File conversion utilities
 """
 
 import os
+import io
 import subprocess
+import threading
 import logging
+from collections import deque
 from pathlib import Path
 from typing import Optional, List, Tuple
 from PIL import Image
@@ -14,6 +17,11 @@ import json
 import csv
 import xml.etree.ElementTree as ET
 
+from resource_limits import (
+    JobLimits, ConversionAborted, ResourceLimitExceeded, ConversionCancelled, kill_process_group,
+)
+from progress import JobProgress, ConversionStalled, progress_args
+
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
@@ -66,6 +74,42 @@ FORMAT_CONVERSIONS = {
 }
 
 
+IMAGE_FORMATS = ['jpg', 'jpeg', 'png', 'webp', 'bmp']
+AUDIO_FORMATS = ['mp3', 'wav', 'aac', 'ogg', 'flac']
+VIDEO_FORMATS = ['mp4', 'mkv', 'avi', 'mov']
+DATA_FORMATS = ['json', 'csv', 'xml']
+
+# Conversions that can run entirely in memory (no workspace files)
+
+MEMORY_CONVERSIONS = {
+    **{ext: ['png', 'jpg', 'webp', 'bmp', 'pdf'] for ext in IMAGE_FORMATS},
+    **{ext: AUDIO_FORMATS for ext in AUDIO_FORMATS},
+    **{ext: ['json', 'csv', 'xml', 'txt'] for ext in DATA_FORMATS},
+    'pdf': ['txt', 'docx'],
+    'docx': ['txt'],
+}
+
+# Pillow format names that differ from the file extension
+PIL_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG'}
+
+# ffmpeg muxer names for writing audio to a pipe
+FFMPEG_MUXERS = {'mp3': 'mp3', 'wav': 'wav', 'aac': 'adts', 'ogg': 'ogg', 'flac': 'flac'}
+
+# Containers ffmpeg can demux from a non-seekable pipe (MP4/MOV may keep
+# their index at the end of the file, AVI keeps it there by design)
+STREAM_INPUT_FORMATS = ['mkv', 'mp3', 'ogg', 'flac', 'aac', 'wav']
+
+# Containers ffmpeg can mux to a pipe, with the flags that make them streamable
+STREAM_OUTPUT_MUXERS = {
+    'mp4': ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof'],
+    'mkv': ['-f', 'matroska'],
+    'mp3': ['-f', 'mp3'],
+    'ogg': ['-f', 'ogg'],
+    'flac': ['-f', 'flac'],
+    'aac': ['-f', 'adts'],
+}
+
+
 def get_file_extension(filename: str) -> str:
     """Get file extension without dot"""
     return Path(filename).suffix.lower().lstrip('.')
@@ -76,72 +120,272 @@ def get_supported_formats(file_extension: str) -> List[str]:
     return FORMAT_CONVERSIONS.get(file_extension.lower(), [])
 
 
+def get_resource_class(file_extension: str) -> str:
+    """Which converter resource pool a file type uses: ffmpeg, office, image or data"""
+    ext = file_extension.lower()
+    if ext in AUDIO_FORMATS or ext in VIDEO_FORMATS:
+        return 'ffmpeg'
+    if ext in IMAGE_FORMATS or ext == 'svg':
+        return 'image'
+    if ext in DATA_FORMATS:
+        return 'data'
+    return 'office'
+
+
 class FileConverter:
     def __init__(self, temp_dir: str = '/tmp/converter'):
         self.temp_dir = temp_dir
         os.makedirs(temp_dir, exist_ok=True)
     
-    def convert(self, input_file: str, output_format: str) -> Optional[str]:
-        """Main conversion function"""
+    def convert(self, input_file: str, output_format: str,
+                limits: Optional[JobLimits] = None,
+                progress: Optional[JobProgress] = None) -> Optional[str]:
+        """Main conversion function
+        
+        Raises ResourceLimitExceeded if the job breaches its resource limits,
+        ConversionStalled if an ffmpeg job stops making progress and
+        ConversionCancelled if the user cancelled it.
+        """
         input_ext = get_file_extension(input_file)
         
         # Route to appropriate converter
         if input_ext in ['jpg', 'jpeg', 'png', 'webp', 'bmp']:
-            return self._convert_image(input_file, output_format)
+            return self._convert_image(input_file, output_format, limits)
         elif input_ext == 'svg':
-            return self._convert_svg(input_file, output_format)
+            return self._convert_svg(input_file, output_format, limits)
         elif input_ext in ['pdf']:
-            return self._convert_pdf(input_file, output_format)
+            return self._convert_pdf(input_file, output_format, limits)
         elif input_ext in ['docx', 'doc']:
-            return self._convert_document(input_file, output_format)
+            return self._convert_document(input_file, output_format, limits)
         elif input_ext in ['mp3', 'wav', 'aac', 'ogg', 'flac']:
-            return self._convert_audio(input_file, output_format)
-        elif input_ext in ['mp4', 'mkv', 'avi', 'mov']:
-            return self._convert_video(input_file, output_format)
+            return self._convert_audio(input_file, output_format, limits, progress)
+        elif input_ext in VIDEO_FORMATS:
+            return self._convert_video(input_file, output_format, limits, progress)
         elif input_ext in ['json', 'csv', 'xml']:
             return self._convert_data(input_file, output_format)
         else:
             logger.error(f"Unsupported format: {input_ext}")
             return None
     
-    def _convert_image(self, input_file: str, output_format: str) -> Optional[str]:
+    def ffmpeg_stream_command(self, input_ext: str, output_format: str,
+                              with_progress: bool = False) -> Optional[List[str]]:
+        """FFmpeg command reading stdin and writing stdout, or None if a container needs seeking"""
+        input_ext = input_ext.lower()
+        if input_ext not in STREAM_INPUT_FORMATS or output_format not in STREAM_OUTPUT_MUXERS:
+            return None
+        if input_ext in AUDIO_FORMATS:
+            if output_format not in AUDIO_FORMATS:
+                return None
+            codec_args = self._audio_args()
+        else:
+            codec_args = self._video_args(output_format)
+        progress = ['-progress', 'pipe:2', '-nostats'] if with_progress else []
+        return ['ffmpeg', *progress, '-i', 'pipe:0', *codec_args, *STREAM_OUTPUT_MUXERS[output_format], 'pipe:1']
+    
+    def supports_memory(self, input_ext: str, output_format: str) -> bool:
+        """Check if a conversion can run on in-memory buffers"""
+        return output_format in MEMORY_CONVERSIONS.get(input_ext.lower(), [])
+    
+    def convert_bytes(self, data: bytes, input_ext: str, output_format: str,
+                      limits: Optional[JobLimits] = None,
+                      progress: Optional[JobProgress] = None) -> Optional[bytes]:
+        """Convert an in-memory file and return the output bytes
+        
+        Raises ResourceLimitExceeded, ConversionStalled or ConversionCancelled
+        like convert().
+        """
+        input_ext = input_ext.lower()
+        src = io.BytesIO(data)
+        dst = io.BytesIO()
+        try:
+            if input_ext in IMAGE_FORMATS:
+                self._save_image(src, dst, output_format, limits)
+            elif input_ext in AUDIO_FORMATS:
+                return self._convert_audio_bytes(data, output_format, limits, progress)
+            elif input_ext in DATA_FORMATS:
+                return self._dump_data(self._load_data(data, input_ext), output_format)
+            elif input_ext == 'pdf' and output_format == 'txt':
+                return self._pdf_to_text(src).encode('utf-8')
+            elif input_ext == 'pdf' and output_format == 'docx':
+                self._pdf_to_docx(src, dst)
+            elif input_ext == 'docx' and output_format == 'txt':
+                return self._docx_to_text(src).encode('utf-8')
+            else:
+                logger.error(f"Unsupported in-memory conversion: {input_ext} -> {output_format}")
+                return None
+            return dst.getvalue()
+        except ConversionAborted:
+            raise
+        except Image.DecompressionBombError as e:
+            raise ResourceLimitExceeded('memory', str(e))
+        except Exception as e:
+            logger.error(f"In-memory conversion error ({input_ext} -> {output_format}): {e}")
+            return None
+    
+    def _run(self, cmd: List[str], timeout: Optional[int] = None,
+             limits: Optional[JobLimits] = None, check: bool = False,
+             input: Optional[bytes] = None,
+             progress: Optional[JobProgress] = None) -> subprocess.CompletedProcess:
+        """Run a converter command under the job's resource limits"""
+        if limits is not None:
+            limits.open_cgroup()
+        try:
+            if progress is None:
+                result = self._run_plain(cmd, timeout, input, limits)
+            else:
+                result = self._run_with_progress(cmd, timeout, input, progress, limits)
+        finally:
+            oom_killed, cpu_seconds = limits.close_cgroup() if limits is not None else (False, None)
+        
+        if limits is not None and limits.cancelled:
+            raise ConversionCancelled()
+        # The watchdog's SIGKILL would otherwise look like a CPU limit hit
+        if progress is not None and progress.stalled:
+            raise ConversionStalled(f"no progress for {progress.stalled_for():.0f}s")
+        if limits is not None:
+            limits.check_result(result.returncode, result.stderr, oom_killed, cpu_seconds)
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
+        return result
+    
+    def _run_plain(self, cmd: List[str], timeout: Optional[int], input: Optional[bytes],
+                   limits: Optional[JobLimits] = None) -> subprocess.CompletedProcess:
+        """subprocess.run in its own process group, killable through limits.cancel()"""
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if input is not None else None,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True
+        )
+        if limits is not None:
+            limits.attach(proc)
+        try:
+            stdout, stderr = proc.communicate(input, timeout=timeout)
+        except BaseException:
+            # Timeout or interrupt: don't leave the converter or its children running
+            kill_process_group(proc)
+            proc.communicate()
+            raise
+        finally:
+            if limits is not None:
+                limits.detach(proc)
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+    
+    def _run_with_progress(self, cmd: List[str], timeout: Optional[int], input: Optional[bytes],
+                           progress: JobProgress,
+                           limits: Optional[JobLimits] = None) -> subprocess.CompletedProcess:
+        """Run ffmpeg with -progress on stderr, feeding progress as lines arrive"""
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True
+        )
+        progress.attach(proc)
+        if limits is not None:
+            limits.attach(proc)
+        stdout = []
+        stderr_tail = deque(maxlen=200)
+        timed_out = threading.Event()
+        
+        def write_input():
+            try:
+                proc.stdin.write(input)
+            except (BrokenPipeError, OSError):
+                pass
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+        
+        def kill_on_timeout():
+            timed_out.set()
+            kill_process_group(proc)
+        
+        threads = [threading.Thread(target=lambda: stdout.append(proc.stdout.read()), daemon=True)]
+        if input is not None:
+            threads.append(threading.Thread(target=write_input, daemon=True))
+        timer = threading.Timer(timeout, kill_on_timeout) if timeout else None
+        try:
+            for thread in threads:
+                thread.start()
+            if timer:
+                timer.start()
+            for raw in proc.stderr:
+                line = raw.decode(errors='ignore').rstrip()
+                if not progress.feed(line):
+                    stderr_tail.append(line)
+            proc.wait()
+        finally:
+            if timer:
+                timer.cancel()
+            if proc.poll() is None:
+                kill_process_group(proc)
+                proc.wait()
+            for thread in threads:
+                thread.join()
+            progress.detach()
+            if limits is not None:
+                limits.detach(proc)
+        
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        return subprocess.CompletedProcess(
+            cmd, proc.returncode, b''.join(stdout), '\n'.join(stderr_tail).encode()
+        )
+    
+    def _convert_image(self, input_file: str, output_format: str,
+                       limits: Optional[JobLimits] = None) -> Optional[str]:
         """Convert image files"""
         try:
             output_file = input_file.rsplit('.', 1)[0] + f'.{output_format}'
-            
-            if output_format == 'pdf':
-                # Convert image to PDF
-                img = Image.open(input_file)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                img.save(output_file, 'PDF')
-            else:
-                # Convert between image formats
-                img = Image.open(input_file)
-                if output_format in ['jpg', 'jpeg'] and img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                img.save(output_file, output_format.upper())
-            
+            self._save_image(input_file, output_file, output_format, limits)
             return output_file
+        except ConversionAborted:
+            raise
+        except Image.DecompressionBombError as e:
+            raise ResourceLimitExceeded('memory', str(e))
         except Exception as e:
             logger.error(f"Image conversion error: {e}")
             return None
     
-    def _convert_svg(self, input_file: str, output_format: str) -> Optional[str]:
+    def _save_image(self, src, dst, output_format: str, limits: Optional[JobLimits] = None):
+        """Convert an image between paths or file-like objects"""
+        img = Image.open(src)
+        if limits:
+            limits.check_image(*img.size)
+        
+        if output_format == 'pdf':
+            # Convert image to PDF
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
+            img.save(dst, 'PDF')
+        else:
+            # Convert between image formats
+            if output_format in ['jpg', 'jpeg'] and img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
+            img.save(dst, PIL_FORMATS.get(output_format, output_format.upper()))
+    
+    def _convert_svg(self, input_file: str, output_format: str,
+                     limits: Optional[JobLimits] = None) -> Optional[str]:
         """Convert SVG files using ImageMagick"""
         try:
             output_file = input_file.rsplit('.', 1)[0] + f'.{output_format}'
             
             # Use ImageMagick convert command
             cmd = ['convert', '-background', 'none', input_file, output_file]
-            subprocess.run(cmd, check=True, capture_output=True)
+            self._run(cmd, limits=limits, check=True)
             
             return output_file
+        except ConversionAborted:
+            raise
         except Exception as e:
             logger.error(f"SVG conversion error: {e}")
             return None
             
-    def _convert_pdf(self, input_file: str, output_format: str) -> Optional[str]:
+    def _convert_pdf(self, input_file: str, output_format: str,
+                     limits: Optional[JobLimits] = None) -> Optional[str]:
         """Convert PDF files"""
         try:
             logger.info(f"📄 Starting PDF conversion: {input_file} -> {output_format}")
@@ -151,11 +395,7 @@ class FileConverter:
                 logger.info(f"📝 Extracting text from PDF...")
                 # Extract text from PDF
                 with open(input_file, 'rb') as f:
-                    pdf_reader = PyPDF2.PdfReader(f)
-                    text = ''
-                    for page_num, page in enumerate(pdf_reader.pages):
-                        logger.info(f"  📃 Processing page {page_num + 1}/{len(pdf_reader.pages)}")
-                        text += page.extract_text() + '\n\n'
+                    text = self._pdf_to_text(f)
                 
                 with open(output_file, 'w', encoding='utf-8') as f:
                     f.write(text)
@@ -173,7 +413,7 @@ class FileConverter:
                         output_file.rsplit('.', 1)[0]
                     ]
                     logger.info(f"🔧 Running command: {' '.join(cmd)}")
-                    result = subprocess.run(cmd, check=True, capture_output=True, timeout=60)
+                    result = self._run(cmd, timeout=60, limits=limits, check=True)
                     
                     if result.returncode != 0:
                         logger.error(f"❌ pdftoppm error: {result.stderr.decode()}")
@@ -188,26 +428,16 @@ class FileConverter:
                 # Use pypandoc or simple text extraction instead of pdf2docx
                 try:
                     # Extract text and create a simple DOCX
-                    from docx import Document as DocxDocument
-                    
                     with open(input_file, 'rb') as f:
-                        pdf_reader = PyPDF2.PdfReader(f)
-                        doc = DocxDocument()
-                        
-                        for page_num, page in enumerate(pdf_reader.pages):
-                            logger.info(f"  📃 Processing page {page_num + 1}/{len(pdf_reader.pages)}")
-                            text = page.extract_text()
-                            doc.add_paragraph(text)
-                            if page_num < len(pdf_reader.pages) - 1:
-                                doc.add_page_break()
-                        
-                        doc.save(output_file)
+                        self._pdf_to_docx(f, output_file)
                     logger.info(f"✅ PDF to DOCX conversion successful: {output_file}")
                 except Exception as e:
                     logger.error(f"❌ DOCX conversion error: {e}")
                     return None
             
             return output_file
+        except ConversionAborted:
+            raise
         except subprocess.TimeoutExpired:
             logger.error(f"⏱️ PDF conversion timeout for {input_file}")
             return None
@@ -215,6 +445,34 @@ class FileConverter:
             logger.error(f"❌ PDF conversion error: {e}", exc_info=True)
             return None
 
+    def _pdf_to_text(self, src) -> str:
+        """Extract text from a PDF file object"""
+        pdf_reader = PyPDF2.PdfReader(src)
+        text = ''
+        for page_num, page in enumerate(pdf_reader.pages):
+            logger.info(f"  📃 Processing page {page_num + 1}/{len(pdf_reader.pages)}")
+            text += page.extract_text() + '\n\n'
+        return text
+    
+    def _pdf_to_docx(self, src, dst):
+        """Build a simple DOCX from the text of a PDF file object"""
+        pdf_reader = PyPDF2.PdfReader(src)
+        doc = Document()
+        
+        for page_num, page in enumerate(pdf_reader.pages):
+            logger.info(f"  📃 Processing page {page_num + 1}/{len(pdf_reader.pages)}")
+            text = page.extract_text()
+            doc.add_paragraph(text)
+            if page_num < len(pdf_reader.pages) - 1:
+                doc.add_page_break()
+        
+        doc.save(dst)
+    
+    def _docx_to_text(self, src) -> str:
+        """Extract paragraph text from a DOCX path or file object"""
+        doc = Document(src)
+        return '\n\n'.join([para.text for para in doc.paragraphs])
+
     def _check_command_exists(self, command: str) -> bool:
         """Check if a command exists in PATH"""
         try:
@@ -226,7 +484,8 @@ class FileConverter:
         except subprocess.CalledProcessError:
             return False
     
-    def _convert_document(self, input_file: str, output_format: str) -> Optional[str]:
+    def _convert_document(self, input_file: str, output_format: str,
+                          limits: Optional[JobLimits] = None) -> Optional[str]:
         """Convert document files"""
         try:
             output_file = input_file.rsplit('.', 1)[0] + f'.{output_format}'
@@ -234,11 +493,14 @@ class FileConverter:
             if output_format == 'pdf':
                 # Try LibreOffice first
                 try:
+                    outdir = os.path.dirname(output_file) or '/tmp'
+                    # Private profile so concurrent LibreOffice runs don't fight over its lock
                     cmd = [
-                        'libreoffice', '--headless', '--convert-to', 'pdf',
-                        '--outdir', os.path.dirname(output_file) or '/tmp', input_file
+                        'libreoffice', f'-env:UserInstallation=file://{outdir}/.lo_profile',
+                        '--headless', '--convert-to', 'pdf',
+                        '--outdir', outdir, input_file
                     ]
-                    result = subprocess.run(cmd, check=True, capture_output=True, timeout=60)
+                    result = self._run(cmd, timeout=60, limits=limits, check=True)
                     # LibreOffice saves with original name + .pdf in outdir
                     lo_output = os.path.join(
                         os.path.dirname(output_file) or '/tmp',
@@ -251,29 +513,41 @@ class FileConverter:
                     return None
 
             elif output_format == 'txt':
-                doc = Document(input_file)
-                text = '\n\n'.join([para.text for para in doc.paragraphs])
+                text = self._docx_to_text(input_file)
                 with open(output_file, 'w', encoding='utf-8') as f:
                     f.write(text)
             
             return output_file if os.path.exists(output_file) else None
+        except ConversionAborted:
+            raise
         except Exception as e:
             logger.error(f"Document conversion error: {e}")
             return None
 
     
-    def _convert_audio(self, input_file: str, output_format: str) -> Optional[str]:
+    def _audio_args(self) -> List[str]:
+        """FFmpeg output options for audio conversions"""
+        return ['-vn', '-ar', '44100', '-ac', '2', '-b:a', '192k']
+    
+    def _video_args(self, output_format: str) -> List[str]:
+        """FFmpeg output options for video conversions"""
+        if output_format == 'gif':
+            return ['-vf', 'fps=10,scale=480:-1:flags=lanczos', '-c:v', 'gif']
+        return [
+            '-c:v', 'libx264', '-preset', 'medium', '-crf', '23',
+            '-c:a', 'aac', '-b:a', '128k'
+        ]
+    
+    def _convert_audio(self, input_file: str, output_format: str,
+                       limits: Optional[JobLimits] = None,
+                       progress: Optional[JobProgress] = None) -> Optional[str]:
         """Convert audio files using FFmpeg"""
         try:
             output_file = input_file.rsplit('.', 1)[0] + f'.{output_format}'
             
-            cmd = [
-                'ffmpeg', '-i', input_file,
-                '-vn', '-ar', '44100', '-ac', '2', '-b:a', '192k',
-                '-y', output_file
-            ]
+            cmd = ['ffmpeg', *progress_args(progress), '-i', input_file, *self._audio_args(), '-y', output_file]
             
-            result = subprocess.run(cmd, capture_output=True, timeout=300)
+            result = self._run(cmd, timeout=300, limits=limits, progress=progress)
             
             if result.returncode != 0:
                 logger.error(f"FFmpeg error: {result.stderr.decode()}")
@@ -281,6 +555,8 @@ class FileConverter:
             
             return output_file if os.path.exists(output_file) else None
 
+        except ConversionAborted:
+            raise
         except FileNotFoundError:
             logger.error("ffmpeg not found - install ffmpeg on the server")
             return None
@@ -290,28 +566,48 @@ class FileConverter:
         except Exception as e:
             logger.error(f"Audio conversion error: {e}")
             return None
+    
+    def _convert_audio_bytes(self, data: bytes, output_format: str,
+                             limits: Optional[JobLimits] = None,
+                             progress: Optional[JobProgress] = None) -> Optional[bytes]:
+        """Convert audio through FFmpeg pipes without touching disk"""
+        try:
+            cmd = [
+                'ffmpeg', *progress_args(progress), '-i', 'pipe:0', *self._audio_args(),
+                '-f', FFMPEG_MUXERS[output_format], 'pipe:1'
+            ]
+            
+            result = self._run(cmd, timeout=300, limits=limits, input=data, progress=progress)
+            
+            if result.returncode != 0:
+                logger.error(f"FFmpeg error: {result.stderr.decode()}")
+                return None
+            
+            return result.stdout or None
+        
+        except ConversionAborted:
+            raise
+        except FileNotFoundError:
+            logger.error("ffmpeg not found - install ffmpeg on the server")
+            return None
+        except subprocess.TimeoutExpired:
+            logger.error("In-memory audio conversion timeout")
+            return None
+        except Exception as e:
+            logger.error(f"Audio conversion error: {e}")
+            return None
 
     
-    def _convert_video(self, input_file: str, output_format: str) -> Optional[str]:
+    def _convert_video(self, input_file: str, output_format: str,
+                       limits: Optional[JobLimits] = None,
+                       progress: Optional[JobProgress] = None) -> Optional[str]:
         """Convert video files using FFmpeg"""
         try:
             output_file = input_file.rsplit('.', 1)[0] + f'.{output_format}'
             
-            if output_format == 'gif':
-                cmd = [
-                    'ffmpeg', '-i', input_file,
-                    '-vf', 'fps=10,scale=480:-1:flags=lanczos',
-                    '-c:v', 'gif', '-y', output_file
-                ]
-            else:
-                cmd = [
-                    'ffmpeg', '-i', input_file,
-                    '-c:v', 'libx264', '-preset', 'medium', '-crf', '23',
-                    '-c:a', 'aac', '-b:a', '128k',
-                    '-y', output_file
-                ]
+            cmd = ['ffmpeg', *progress_args(progress), '-i', input_file, *self._video_args(output_format), '-y', output_file]
             
-            result = subprocess.run(cmd, capture_output=True, timeout=600)
+            result = self._run(cmd, timeout=600, limits=limits, progress=progress)
             
             if result.returncode != 0:
                 logger.error(f"FFmpeg error: {result.stderr.decode()}")
@@ -319,6 +615,8 @@ class FileConverter:
             
             return output_file if os.path.exists(output_file) else None
 
+        except ConversionAborted:
+            raise
         except FileNotFoundError:
             logger.error("ffmpeg not found - install ffmpeg on the server")
             return None
@@ -335,45 +633,54 @@ class FileConverter:
             output_file = input_file.rsplit('.', 1)[0] + f'.{output_format}'
             input_ext = get_file_extension(input_file)
             
-            # Load data based on input format
-            data = None
-            if input_ext == 'json':
-                with open(input_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            elif input_ext == 'csv':
-                with open(input_file, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    data = list(reader)
-            elif input_ext == 'xml':
-                tree = ET.parse(input_file)
-                root = tree.getroot()
-                # Simple XML to dict conversion
-                data = self._xml_to_dict(root)
+            with open(input_file, 'rb') as f:
+                data = self._load_data(f.read(), input_ext)
             
-            # Save in output format
-            if output_format == 'json':
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2, ensure_ascii=False)
-            elif output_format == 'csv':
-                if isinstance(data, list) and len(data) > 0:
-                    with open(output_file, 'w', encoding='utf-8', newline='') as f:
-                        writer = csv.DictWriter(f, fieldnames=data[0].keys())
-                        writer.writeheader()
-                        writer.writerows(data)
-            elif output_format == 'xml':
-                root = ET.Element('root')
-                self._dict_to_xml(root, data)
-                tree = ET.ElementTree(root)
-                tree.write(output_file, encoding='utf-8', xml_declaration=True)
-            elif output_format == 'txt':
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(json.dumps(data, indent=2, ensure_ascii=False))
+            output = self._dump_data(data, output_format)
+            if output is None:
+                return None
+            
+            with open(output_file, 'wb') as f:
+                f.write(output)
             
             return output_file
         except Exception as e:
             logger.error(f"Data conversion error: {e}")
             return None
     
+    def _load_data(self, raw: bytes, input_ext: str):
+        """Parse JSON, CSV or XML bytes into Python data"""
+        if input_ext == 'json':
+            return json.loads(raw.decode('utf-8'))
+        elif input_ext == 'csv':
+            reader = csv.DictReader(io.StringIO(raw.decode('utf-8'), newline=''))
+            return list(reader)
+        elif input_ext == 'xml':
+            root = ET.fromstring(raw)
+            # Simple XML to dict conversion
+            return self._xml_to_dict(root)
+        return None
+    
+    def _dump_data(self, data, output_format: str) -> Optional[bytes]:
+        """Serialize Python data in the target format"""
+        if output_format == 'json':
+            return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        elif output_format == 'csv':
+            if not (isinstance(data, list) and len(data) > 0):
+                return None
+            buffer = io.StringIO(newline='')
+            writer = csv.DictWriter(buffer, fieldnames=data[0].keys())
+            writer.writeheader()
+            writer.writerows(data)
+            return buffer.getvalue().encode('utf-8')
+        elif output_format == 'xml':
+            root = ET.Element('root')
+            self._dict_to_xml(root, data)
+            return ET.tostring(root, encoding='utf-8', xml_declaration=True)
+        elif output_format == 'txt':
+            return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        return None
+    
     def _xml_to_dict(self, element):
         """Convert XML element to dictionary"""
         result = {}
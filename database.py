@@ -1,9 +1,18 @@
 import os
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta, timezone, time as dt_time
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
-from supabase import create_client, Client
 import logging
+
+from storage import FunctionNotFound
+from cache import TTLCache
+from quota import QuotaLedger
+from spool import WriteSpool
+from reference import ReferenceData
+from config import (
+    DB_BACKEND, SQLITE_DB_PATH, PG_DSN,
+    USER_CACHE_TTL_SECONDS, USER_STATS_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES,
+)
 load_dotenv()
 
 logging.basicConfig(
@@ -15,26 +24,75 @@ logger = logging.getLogger(__name__)
 
 class DatabaseManager:
     def __init__(self):
-        self.supabase: Client = create_client(
-            os.environ.get("ACTIVITY_SUPABASE_URL"),
-            os.environ.get("ACTIVITY_SUPABASE_KEY")
-        )
+        if DB_BACKEND == 'sqlite':
+            from sqlite_backend import SQLiteBackend
+            self.store = SQLiteBackend(SQLITE_DB_PATH)
+        elif DB_BACKEND == 'postgres':
+            from postgres_backend import PostgresBackend
+            self.store = PostgresBackend(PG_DSN)
+        else:
+            from rest_client import AsyncRestClient
+            self.store = AsyncRestClient(
+                os.environ.get("ACTIVITY_SUPABASE_URL"), os.environ.get("ACTIVITY_SUPABASE_KEY")
+            )
+        # One update typically asks for the same user row and stats several times
+        self.user_cache = TTLCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES, name='users')
+        self.stats_cache = TTLCache(USER_STATS_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES, name='user_stats')
+        # Daily conversion counts; start() it from the running event loop
+        self.quota = QuotaLedger(self.store)
+        # file_conversions rows are written behind through a durable local spool
+        self.conversion_log = WriteSpool(self.store, table='file_conversions')
+        # Subscription plans and tier limits; start() loads them from the running event loop
+        self.reference = ReferenceData(self.store)
+    
+    async def close(self):
+        """Close the storage backend's connections"""
+        await self.store.close()
     
     # User Management
+    def invalidate_user(self, user_id: int):
+        """Drop cached user row and stats after a write"""
+        self.user_cache.invalidate(user_id)
+        self.stats_cache.invalidate(user_id)
+    
     async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Get user by user_id"""
+        """Get user by user_id (cached)"""
+        async def load():
+            rows = await self.store.select('converter_users', filters={'user_id': user_id})
+            return rows[0] if rows else None
+        
         try:
-            result = self.supabase.table('converter_users').select('*').eq('user_id', user_id).execute()
-            return result.data[0] if result.data else None
+            return await self.user_cache.get_or_load(user_id, load)
         except Exception as e:
             logger.error(f"Error getting user {user_id}: {e}")
             return None
     
+    async def count_users(self) -> int:
+        """Total number of registered users"""
+        try:
+            return await self.store.count('converter_users')
+        except Exception as e:
+            logger.error(f"Error counting users: {e}")
+            return 0
+    
     async def create_user(self, user_id: int, username: str = None, 
                          first_name: str = None, last_name: str = None,
                          language_code: str = 'en') -> bool:
-        """Create a new user"""
+        """Create a new user (create_converter_user RPC, or two inserts)"""
         try:
+            try:
+                await self.store.rpc('create_converter_user', {
+                    'p_user_id': user_id,
+                    'p_username': username,
+                    'p_first_name': first_name,
+                    'p_last_name': last_name,
+                    'p_language_code': language_code,
+                })
+                self.invalidate_user(user_id)
+                return True
+            except FunctionNotFound:
+                pass
+            
             data = {
                 'user_id': user_id, 
                 'username': username,
@@ -43,15 +101,16 @@ class DatabaseManager:
                 'language_code': language_code,
                 'subscription_tier': 'free', 
             }
-            self.supabase.table('converter_users').insert(data).execute()
+            await self.store.insert('converter_users', data)
+            self.invalidate_user(user_id)
             
             # Create user stats entry
-            self.supabase.table('converter_user_stats').insert({
+            await self.store.insert('converter_user_stats', {
                 'user_id': user_id,
                 'conversions_today': 0,
                 'total_conversions': 0,
                 'total_files_size_bytes': 0
-            }).execute()
+            })
             return True
         except Exception as e:
             logger.error(f"Error creating user {user_id}: {e}")
@@ -60,36 +119,21 @@ class DatabaseManager:
     async def update_user_language(self, user_id: int, language_code: str) -> bool:
         """Update user's language preference"""
         try:
-            self.supabase.table('converter_users').update(
-                {'language_code': language_code}
-            ).eq('user_id', user_id).execute()
+            await self.store.update(
+                'converter_users', {'language_code': language_code}, {'user_id': user_id}
+            )
+            self.user_cache.invalidate(user_id)
             return True
         except Exception as e:
             logger.error(f"Error updating user language {user_id}: {e}")
             return False
     
     async def get_user_tier(self, user_id: int) -> str:
-        """Get user's subscription tier (free/premium)"""
-        try:
-            user = await self.get_user(user_id)
-            if not user:
-                return 'free'
-            
-            # Check if premium subscription is still valid
-            if user.get('subscription_tier') == 'premium':
-                if user.get('subscription_expires_at'):
-                    expiry = datetime.fromisoformat(user['subscription_expires_at'].replace('Z', '+00:00'))
-                    if expiry > datetime.now(timezone.utc):
-                        return 'premium'
-                    else:
-                        # Subscription expired, downgrade to free
-                        await self.downgrade_to_free(user_id)
-                        return 'free'
-            
-            return user.get('subscription_tier', 'free')
-        except Exception as e:
-            logger.error(f"Error getting user tier {user_id}: {e}")
+        """Get user's subscription tier (free/premium); expire_premium_job downgrades lapsed ones"""
+        user = await self.get_user(user_id)
+        if not user:
             return 'free'
+        return user.get('subscription_tier') or 'free'
     
     async def is_premium_user(self, user_id: int) -> bool:
         """Check if user has active premium subscription"""
@@ -99,6 +143,14 @@ class DatabaseManager:
     async def upgrade_to_premium(self, user_id: int, days: int) -> bool:
         """Upgrade user to premium tier"""
         try:
+            try:
+                new_expiry = await self.store.rpc('extend_premium', {'p_user_id': user_id, 'p_days': days})
+                self.user_cache.invalidate(user_id)
+                logger.info(f"✅ User {user_id} upgraded to premium until {new_expiry}")
+                return True
+            except FunctionNotFound:
+                pass
+            
             user = await self.get_user(user_id)
             current_expiry = None
             
@@ -114,10 +166,11 @@ class DatabaseManager:
             else:
                 new_expiry = datetime.now(timezone.utc) + timedelta(days=days)
             
-            self.supabase.table('converter_users').update({
+            await self.store.update('converter_users', {
                 'subscription_tier': 'premium',
                 'subscription_expires_at': new_expiry.isoformat()
-            }).eq('user_id', user_id).execute()
+            }, {'user_id': user_id})
+            self.user_cache.invalidate(user_id)
             
             logger.info(f"✅ User {user_id} upgraded to premium until {new_expiry.isoformat()}")
             return True
@@ -128,10 +181,11 @@ class DatabaseManager:
     async def downgrade_to_free(self, user_id: int) -> bool:
         """Downgrade user to free tier"""
         try:
-            self.supabase.table('converter_users').update({
+            await self.store.update('converter_users', {
                 'subscription_tier': 'free',
                 'subscription_expires_at': None
-            }).eq('user_id', user_id).execute()
+            }, {'user_id': user_id})
+            self.user_cache.invalidate(user_id)
             
             logger.info(f"ℹ️ User {user_id} downgraded to free tier")
             return True
@@ -139,6 +193,25 @@ class DatabaseManager:
             logger.error(f"Error downgrading user {user_id}: {e}")
             return False
     
+    async def expire_premium_subscriptions(self) -> int:
+        """Downgrade every premium user whose subscription has ended, in one bulk update"""
+        try:
+            rows = await self.store.update('converter_users', {
+                'subscription_tier': 'free',
+                'subscription_expires_at': None
+            }, {
+                'subscription_tier': 'premium',
+                'subscription_expires_at': ('lt', datetime.now(timezone.utc).isoformat())
+            })
+        except Exception as e:
+            logger.error(f"Error expiring premium subscriptions: {e}")
+            return 0
+        for row in rows:
+            self.user_cache.invalidate(row['user_id'])
+        if rows:
+            logger.info(f"ℹ️ {len(rows)} premium subscriptions expired, users moved to free tier")
+        return len(rows)
+    
     # Payment Management
     async def create_payment(self, user_id: int, plan_id: int, 
                             amount: float, file_id: str = None) -> Optional[int]:
@@ -151,8 +224,8 @@ class DatabaseManager:
                 'payment_proof_file_id': file_id,
                 'status': 'pending'
             }
-            result = self.supabase.table('converter_payments').insert(data).execute()
-            return result.data[0]['id'] if result.data else None
+            rows = await self.store.insert('converter_payments', data)
+            return rows[0]['id'] if rows else None
         except Exception as e:
             logger.error(f"Error creating payment for {user_id}: {e}")
             return None
@@ -160,35 +233,43 @@ class DatabaseManager:
     async def get_payment(self, payment_id: int) -> Optional[Dict[str, Any]]:
         """Get payment by ID"""
         try:
-            result = self.supabase.table('converter_payments').select('*').eq('id', payment_id).execute()
-            return result.data[0] if result.data else None
+            rows = await self.store.select('converter_payments', filters={'id': payment_id})
+            return rows[0] if rows else None
         except Exception as e:
             logger.error(f"Error getting payment {payment_id}: {e}")
             return None
     
     async def approve_payment(self, payment_id: int, admin_id: int) -> bool:
-        """Approve a payment"""
+        """Approve a payment (approve_converter_payment RPC, or the multi-request path)"""
         try:
+            try:
+                result = await self.store.rpc('approve_converter_payment', {
+                    'p_payment_id': payment_id, 'p_admin_id': admin_id
+                })
+                if not result:
+                    return False
+                self.user_cache.invalidate(result['user_id'])
+                logger.info(f"✅ User {result['user_id']} upgraded to premium until {result['subscription_expires_at']}")
+                return True
+            except FunctionNotFound:
+                pass
+            
             payment = await self.get_payment(payment_id)
             if not payment:
                 return False
             
             # Get plan details
-            plan = self.supabase.table('subscription_plans').select('*').eq(
-                'id', payment['plan_id']
-            ).execute()
+            plan_data = await self.get_plan_by_id(payment['plan_id'])
             
-            if not plan.data:
+            if not plan_data:
                 return False
             
-            plan_data = plan.data[0]
-            
             # Update payment status
-            self.supabase.table('converter_payments').update({
+            await self.store.update('converter_payments', {
                 'status': 'approved',
                 'processed_at': datetime.now(timezone.utc).isoformat(),
                 'processed_by': admin_id
-            }).eq('id', payment_id).execute()
+            }, {'id': payment_id})
             
             # Upgrade to premium
             await self.upgrade_to_premium(
@@ -205,12 +286,12 @@ class DatabaseManager:
                             reason: str = None) -> bool:
         """Reject a payment"""
         try:
-            self.supabase.table('converter_payments').update({
+            await self.store.update('converter_payments', {
                 'status': 'rejected',
                 'processed_at': datetime.now(timezone.utc).isoformat(),
                 'processed_by': admin_id,
                 'admin_notes': reason
-            }).eq('id', payment_id).execute()
+            }, {'id': payment_id})
             return True
         except Exception as e:
             logger.error(f"Error rejecting payment {payment_id}: {e}")
@@ -221,8 +302,12 @@ class DatabaseManager:
                             original_format: str, target_format: str,
                             file_size: int, status: str = 'success',
                             error_message: str = None,
-                            processing_time: float = None) -> bool:
-        """Log a file conversion"""
+                            processing_time: float = None,
+                            counted: bool = False) -> bool:
+        """Log a file conversion (spooled locally, inserted in bulk in the background)
+
+        counted: the conversion was already counted when it was queued (count_conversion)
+        """
         try:
             data = {
                 'user_id': user_id,
@@ -234,10 +319,12 @@ class DatabaseManager:
                 'error_message': error_message,
                 'processing_time_seconds': processing_time
             }
-            self.supabase.table('file_conversions').insert(data).execute()
+            if not self.conversion_log.append(data):
+                # Spool unavailable: write through rather than lose the row
+                await self.store.insert('file_conversions', data)
             
             # Update user stats if successful
-            if status == 'success':
+            if status == 'success' and not counted:
                 await self.increment_user_stats(user_id, file_size)
             
             return True
@@ -246,105 +333,108 @@ class DatabaseManager:
             return False
     
     async def increment_user_stats(self, user_id: int, file_size: int) -> bool:
-        """Increment user conversion statistics"""
-        try:
-            # Get current stats
-            stats = self.supabase.table('converter_user_stats').select('*').eq(
-                'user_id', user_id
-            ).execute()
-            
-            if not stats.data:
-                # Create stats if not exists
-                self.supabase.table('converter_user_stats').insert({
-                    'user_id': user_id,
-                    'conversions_today': 1,
-                    'total_conversions': 1,
-                    'last_conversion_date': datetime.now(timezone.utc).date().isoformat(),
-                    'total_files_size_bytes': file_size
-                }).execute()
-                return True
-            
-            current_stats = stats.data[0]
-            today = datetime.now(timezone.utc).date()
-            
-            # Reset daily count if it's a new day
-            conversions_today = current_stats.get('conversions_today', 0)
-            last_date = current_stats.get('last_conversion_date')
-            
-            if last_date:
-                last_date = datetime.fromisoformat(str(last_date)).date()
-                if last_date < today:
-                    conversions_today = 0
-            
-            # Update stats
-            self.supabase.table('converter_user_stats').update({
-                'total_conversions': current_stats.get('total_conversions', 0) + 1,
-                'conversions_today': conversions_today + 1,
-                'last_conversion_date': today.isoformat(),
-                'total_files_size_bytes': current_stats.get('total_files_size_bytes', 0) + file_size
-            }).eq('user_id', user_id).execute()
-            
-            return True
-        except Exception as e:
-            logger.error(f"Error incrementing stats for {user_id}: {e}")
-            return False
+        """Count a successful conversion (written to the table by the quota ledger)"""
+        self.quota.record(user_id, file_size)
+        self.stats_cache.invalidate(user_id)
+        return True
+    
+    def count_conversion(self, user_id: int, file_size: int) -> str:
+        """Count a conversion before it runs (enqueue mode); returns the day it counts against"""
+        self.quota.record(user_id, file_size)
+        self.stats_cache.invalidate(user_id)
+        return self.quota.date
+
+    def refund_conversion(self, user_id: int, date: str, file_size: int):
+        """Take back a conversion counted by count_conversion that failed or was cancelled"""
+        self.quota.refund(user_id, date, file_size)
+        self.stats_cache.invalidate(user_id)
     
     async def get_user_stats(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Get user statistics"""
+        """Get user statistics (cached)"""
+        async def load():
+            rows = await self.store.select('converter_user_stats', filters={'user_id': user_id})
+            return rows[0] if rows else None
+        
         try:
-            result = self.supabase.table('converter_user_stats').select('*').eq(
-                'user_id', user_id
-            ).execute()
-            return result.data[0] if result.data else None
+            stats = await self.stats_cache.get_or_load(user_id, load)
         except Exception as e:
             logger.error(f"Error getting stats for {user_id}: {e}")
-            return None
+            stats = None
+        if self.quota.ready:
+            # The ledger is ahead of the table by whatever has not been flushed yet
+            stats = dict(stats or {'user_id': user_id})
+            stats['conversions_today'] = self.quota.conversions_today(user_id)
+        return stats
     
     async def check_daily_limit(self, user_id: int, max_conversions: int) -> bool:
-        """Check if user has reached daily conversion limit"""
+        """Check if user has reached daily conversion limit (counts are reset by daily_rollover_job)"""
+        # -1 means unlimited
+        if max_conversions == -1:
+            return False
+        if self.quota.ready:
+            return self.quota.conversions_today(user_id) >= max_conversions
+        stats = await self.get_user_stats(user_id)
+        if not stats:
+            return False
+        return (stats.get('conversions_today') or 0) >= max_conversions
+    
+    async def roll_over_daily_counters(self) -> int:
+        """Reset conversions_today for the new UTC day, in one bulk update"""
+        self.quota.roll_over()
         try:
-            stats = await self.get_user_stats(user_id)
-            if not stats:
-                return False
-            
-            today = datetime.now(timezone.utc).date()
-            last_date = stats.get('last_conversion_date')
-            
-            if last_date:
-                last_date = datetime.fromisoformat(str(last_date)).date()
-                if last_date < today:
-                    return False  # New day, limit not reached
-            
-            conversions_today = stats.get('conversions_today', 0)
-            
-            # -1 means unlimited
-            if max_conversions == -1:
-                return False
-            
-            return conversions_today >= max_conversions
+            # Yesterday's unflushed increments must not land on top of the reset
+            await self.quota.flush()
+        except Exception:
+            pass  # logged by the ledger, which keeps them for its next flush
+        try:
+            rows = await self.store.update('converter_user_stats', {'conversions_today': 0}, {
+                'last_conversion_date': ('lt', datetime.now(timezone.utc).date().isoformat()),
+                'conversions_today': ('gt', 0)
+            })
         except Exception as e:
-            logger.error(f"Error checking daily limit for {user_id}: {e}")
-            return False
+            logger.error(f"Error rolling over daily counters: {e}")
+            return 0
+        finally:
+            self.stats_cache.clear()
+        logger.info(f"🌅 Daily counters rolled over ({len(rows)} users reset)")
+        return len(rows)
     
     # Subscription Plans
     async def get_subscription_plans(self) -> list:
         """Get all active subscription plans"""
+        if self.reference.ready:
+            return self.reference.active_plans()
         try:
-            result = self.supabase.table('subscription_plans').select('*').eq(
-                'is_active', True
-            ).execute()
-            return result.data if result.data else []
+            return await self.store.select('subscription_plans', filters={'is_active': True})
         except Exception as e:
             logger.error(f"Error getting subscription plans: {e}")
             return []
     
     async def get_plan_by_id(self, plan_id: int) -> Optional[Dict[str, Any]]:
         """Get subscription plan by ID"""
+        if self.reference.ready:
+            plan = self.reference.plan(plan_id)
+            if plan is not None:
+                return plan
         try:
-            result = self.supabase.table('subscription_plans').select('*').eq(
-                'id', plan_id
-            ).execute()
-            return result.data[0] if result.data else None
+            rows = await self.store.select('subscription_plans', filters={'id': plan_id})
+            return rows[0] if rows else None
         except Exception as e:
             logger.error(f"Error getting plan {plan_id}: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+# Scheduled maintenance (registered on the bot's JobQueue in main.py)
+DAILY_ROLLOVER_AT = dt_time(0, 0, tzinfo=timezone.utc)
+
+
+async def expire_premium_job(context):
+    """JobQueue task: move lapsed premium subscriptions to the free tier"""
+    db: DatabaseManager = context.job.data
+    await db.expire_premium_subscriptions()
+
+
+async def daily_rollover_job(context):
+    """JobQueue task at UTC midnight (and once at startup): reset daily conversion counts"""
+    db: DatabaseManager = context.job.data
+    await db.roll_over_daily_counters()
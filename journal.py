@@ -0,0 +1,232 @@
+"""
+Durable SQLite (WAL) journal of conversion jobs that survives restarts
+
+The journal doubles as the job queue between the bot and worker processes:
+a process owns a job while it holds an unexpired lease on it, and jobs with
+no lease (enqueued by the bot) or an expired one (owner died) can be claimed.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List
+
+from config import JOURNAL_PATH, JOURNAL_LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Job states, in order
+QUEUED = 'queued'          # accepted, waiting for a worker
+RUNNING = 'running'        # downloading or converting
+UPLOADING = 'uploading'    # send_document in progress
+DELIVERED = 'delivered'    # result is in the user's chat; only logging remains
+
+_COLUMNS = (
+    'job_id', 'user_id', 'username', 'chat_id', 'lang', 'file_id', 'file_unique_id',
+    'file_name', 'file_size', 'file_ext', 'target_format', 'media_duration', 'quota_date', 'tier', 'status_message_id',
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    username TEXT,
+    chat_id INTEGER NOT NULL,
+    lang TEXT,
+    file_id TEXT NOT NULL,
+    file_unique_id TEXT,
+    file_name TEXT,
+    file_size INTEGER,
+    file_ext TEXT,
+    target_format TEXT NOT NULL,
+    media_duration REAL,
+    quota_date TEXT,
+    tier TEXT,
+    status_message_id INTEGER,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result_file_id TEXT,
+    processing_time REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, created_at);
+"""
+
+# Columns added after the first release of the journal
+_ADDED_COLUMNS = {
+    'owner': 'TEXT',
+    'lease_until': 'REAL',
+    'cancel_requested': 'INTEGER NOT NULL DEFAULT 0',
+    'media_duration': 'REAL',
+    'quota_date': 'TEXT',
+}
+
+
+class JobJournal:
+    """Records every accepted job until its result is delivered and logged"""
+
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: a committed row survives a process crash, only an OS crash can lose the last commits
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(_SCHEMA)
+        existing = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for name, kind in _ADDED_COLUMNS.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (lease_until, created_at)")
+        # The pipeline runs its journal calls here, off the event loop; one thread keeps them in order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='journal')
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def record(self, job, owner: Optional[str] = None,
+               lease_seconds: float = JOURNAL_LEASE_SECONDS):
+        """Persist a newly accepted job as queued, leased to owner if given"""
+        now = time.time()
+        values = [getattr(job, name) for name in _COLUMNS[:-2]]
+        values += [job.tier_limits.get('tier', 'free'), job.status_message_id]
+        lease_until = now + lease_seconds if owner else None
+        try:
+            self._execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}, state, attempts, created_at, updated_at, owner, lease_until) "
+                f"VALUES ({', '.join('?' * len(_COLUMNS))}, ?, ?, ?, ?, ?, ?)",
+                (*values, QUEUED, job.attempts, job.created_at, now, owner, lease_until)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Error journaling job {job.job_id}: {e}")
+
+    def set_state(self, job_id: str, state: str, **fields):
+        """Move a job to a new state, optionally updating result columns"""
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        sql = "UPDATE jobs SET state = ?, updated_at = ?" + (f", {assignments}" if assignments else '') + " WHERE job_id = ?"
+        try:
+            self._execute(sql, (state, time.time(), *fields.values(), job_id))
+        except sqlite3.Error as e:
+            logger.error(f"Error updating job {job_id} to {state}: {e}")
+
+    def finish(self, job_id: str):
+        """Forget a job whose outcome has been delivered and logged"""
+        try:
+            self._execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        except sqlite3.Error as e:
+            logger.error(f"Error removing job {job_id} from journal: {e}")
+
+    def claim(self, owner: str, limit: int,
+              lease_seconds: float = JOURNAL_LEASE_SECONDS) -> List[dict]:
+        """Atomically take up to limit unowned or orphaned jobs, oldest first
+
+        Returned rows carry the previous 'owner'; a non-empty one means the job
+        was interrupted and its attempt count has been incremented.
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                rows = self._conn.execute(
+                    "SELECT * FROM jobs WHERE lease_until IS NULL OR lease_until < ? "
+                    "ORDER BY created_at LIMIT ?",
+                    (now, limit)
+                ).fetchall()
+                for row in rows:
+                    self._conn.execute(
+                        "UPDATE jobs SET owner = ?, lease_until = ?, updated_at = ?, "
+                        "attempts = attempts + ? WHERE job_id = ?",
+                        (owner, now + lease_seconds, now, 1 if row['owner'] else 0, row['job_id'])
+                    )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._conn.execute("ROLLBACK")
+                logger.error(f"Error claiming jobs for {owner}: {e}")
+                return []
+        return [dict(row) for row in rows]
+
+    def renew(self, owner: str, lease_seconds: float = JOURNAL_LEASE_SECONDS) -> int:
+        """Extend the leases of all jobs held by owner"""
+        try:
+            cursor = self._execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ?",
+                (time.time() + lease_seconds, owner)
+            )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Error renewing leases for {owner}: {e}")
+            return 0
+
+    def release(self, owner: str):
+        """Give up all leases held by owner so other processes can claim the jobs now"""
+        try:
+            self._execute("UPDATE jobs SET lease_until = 0 WHERE owner = ?", (owner,))
+        except sqlite3.Error as e:
+            logger.error(f"Error releasing leases for {owner}: {e}")
+
+    def release_jobs(self, job_ids: List[str]):
+        """Hand specific jobs back unowned: renew() no longer covers them and claim() sees them as fresh"""
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    "UPDATE jobs SET owner = NULL, lease_until = 0 WHERE job_id = ?", [(job_id,) for job_id in job_ids]
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error releasing {len(job_ids)} job leases: {e}")
+
+    def request_cancel(self, job_id: str, user_id: int) -> bool:
+        """Flag a user's job for cancellation by whichever process holds it"""
+        try:
+            cursor = self._execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE job_id = ? AND user_id = ?",
+                (time.time(), job_id, user_id)
+            )
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Error requesting cancellation of job {job_id}: {e}")
+            return False
+
+    def cancel_requests(self, owner: str) -> List[str]:
+        """Ids of jobs held by owner that a user has asked to cancel"""
+        try:
+            rows = self._execute(
+                "SELECT job_id FROM jobs WHERE owner = ? AND cancel_requested = 1", (owner,)
+            ).fetchall()
+            return [row['job_id'] for row in rows]
+        except sqlite3.Error as e:
+            logger.error(f"Error reading cancel requests for {owner}: {e}")
+            return []
+
+    def pending_for_user(self, user_id: int) -> int:
+        """Jobs a user has anywhere in the journal"""
+        try:
+            return self._execute("SELECT COUNT(*) FROM jobs WHERE user_id = ?", (user_id,)).fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error counting jobs for user {user_id}: {e}")
+            return 0
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def counts(self) -> dict:
+        """Number of journaled jobs per state"""
+        rows = self._execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
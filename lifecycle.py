@@ -0,0 +1,29 @@
+"""
+Shutdown flush hooks for buffered writes
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_flush_hooks: List[Tuple[str, Callable[[], Awaitable]]] = []
+
+
+def register_flush_hook(name: str, hook: Callable[[], Awaitable]):
+    """Register a coroutine function that writes out pending data on shutdown"""
+    _flush_hooks.append((name, hook))
+
+
+async def flush_all(timeout: float) -> bool:
+    """Run every flush hook in registration order; returns False if any failed"""
+    ok = True
+    for name, hook in _flush_hooks:
+        try:
+            await asyncio.wait_for(hook(), timeout=timeout)
+            logger.info(f"💾 Flushed {name}")
+        except Exception as e:
+            ok = False
+            logger.error(f"Error flushing {name} on shutdown: {e}")
+    return ok
@@ -2,12 +2,9 @@
 Main Telegram Bot Implementation - FREEMIUM MODEL
 """
 from datetime import datetime, timezone  
-import os
 import logging
 import asyncio
 from datetime import datetime
-from pathlib import Path
-import time
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -16,9 +13,15 @@ from telegram.ext import (
 )
 from telegram.constants import ParseMode
 
-from database import DatabaseManager
+from database import DatabaseManager, expire_premium_job, daily_rollover_job, DAILY_ROLLOVER_AT
 from translations import get_text, get_language_keyboard, TRANSLATIONS
 from converters import FileConverter, get_file_extension, get_supported_formats
+from workspace import WorkspaceManager, sweep_workspaces_job
+from pipeline import ConversionPipeline, ConversionJob, cancel_markup
+from journal import JobJournal
+from admission import AdmissionController
+import metrics
+import lifecycle
 from subscribe import require_subscription, setup_subscription_handlers
 from config import *
 
@@ -26,13 +29,30 @@ from config import *
 # Initialize
 db = DatabaseManager()
 converter = FileConverter()
+workspaces = WorkspaceManager(sweep_roots=[converter.temp_dir])
+journal = JobJournal()
+pipeline = ConversionPipeline(
+    db, converter, workspaces, journal=journal,
+    enqueue_only=CONVERSION_MODE == 'enqueue'
+)
+admission = AdmissionController(pipeline)
+metrics.register_gauge('pipeline', pipeline.stats)
+metrics.register_gauge('admission', admission.stats)
+metrics.register_gauge('workspaces', workspaces.stats)
+metrics.register_gauge('journal', journal.counts)
+metrics.register_gauge('user_cache', db.user_cache.stats)
+metrics.register_gauge('user_stats_cache', db.stats_cache.stats)
+metrics.register_gauge('quota', db.quota.stats)
+lifecycle.register_flush_hook('quota ledger', db.quota.flush)
+lifecycle.register_flush_hook('conversion log spool', db.conversion_log.flush)
+metrics.register_gauge('conversion_log', db.conversion_log.stats)
+metrics.register_gauge('reference', db.reference.stats)
 
 async def notify_admin_new_user(context: ContextTypes.DEFAULT_TYPE, user_id: int, username: str, first_name: str, last_name: str):
     """Notify admin about new user registration"""
     try:
         # Get total user count
-        total_users_result = db.supabase.table('converter_users').select('user_id', count='exact').execute()
-        total_users = total_users_result.count if total_users_result.count else 0
+        total_users = await db.count_users()
         
         # Format user info
         full_name = f"{first_name or ''} {last_name or ''}".strip()
@@ -65,11 +85,7 @@ async def notify_admin_new_user(context: ContextTypes.DEFAULT_TYPE, user_id: int
 async def get_user_limits(user_id: int) -> dict:
     """Get user's conversion limits based on their tier"""
     is_premium = await db.is_premium_user(user_id)
-    
-    if is_premium:
-        return PREMIUM_TIER_LIMITS
-    else:
-        return FREE_TIER_LIMITS
+    return db.reference.limits('premium' if is_premium else 'free')
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
@@ -115,29 +131,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Get admin statistics
         try:
             # Get total users
-            total_users_result = db.supabase.table('converter_users').select(
-                'user_id', count='exact'
-            ).execute()
-            total_users = total_users_result.count if total_users_result.count else 0
+            total_users = await db.store.count('converter_users')
             
             # Get today's active users
             today = datetime.now(timezone.utc).date().isoformat()
-            active_today_result = db.supabase.table('converter_user_stats').select(
-                'user_id', count='exact'
-            ).eq('last_conversion_date', today).execute()
-            todays_active_users = active_today_result.count if active_today_result.count else 0
+            todays_active_users = await db.store.count('converter_user_stats', filters={'last_conversion_date': today})
             
             # Get total processed files
-            total_files_result = db.supabase.table('file_conversions').select(
-                'id', count='exact'
-            ).execute()
-            total_processed_files = total_files_result.count if total_files_result.count else 0
+            total_processed_files = await db.store.count('file_conversions')
             
             # Get successful conversions
-            successful_files_result = db.supabase.table('file_conversions').select(
-                'id', count='exact'
-            ).eq('conversion_status', 'success').execute()
-            successful_files = successful_files_result.count if successful_files_result.count else 0
+            successful_files = await db.store.count('file_conversions', filters={'conversion_status': 'success'})
             
             # Calculate success rate
             success_rate = (successful_files / total_processed_files * 100) if total_processed_files > 0 else 0
@@ -157,6 +161,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "🔧 <b>Admin Commands:</b>\n"
                 "/stats - Detailed statistics\n"
                 "/users - User management\n"
+                "/metrics - Live pipeline metrics\n"
+                "/reload - Reload subscription plans\n"
                 "/broadcast - Send message to all users"
             )
             
@@ -373,7 +379,7 @@ async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = get_text(lang, 'upgrade_to_premium', 
                    card_number=CARD_NUMBER,
                    conversions_today=conversions_today,
-                   daily_limit=FREE_TIER_LIMITS['daily_conversions'])
+                   daily_limit=db.reference.limits('free')['daily_conversions'])
     
     keyboard = [
         [InlineKeyboardButton(
@@ -596,6 +602,8 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Store file info in context
     context.user_data['file_id'] = document.file_id
+    context.user_data['file_unique_id'] = document.file_unique_id
+    context.user_data['duration'] = None
     context.user_data['file_name'] = file_name
     context.user_data['file_size'] = file_size
     context.user_data['file_ext'] = file_ext
@@ -683,6 +691,8 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Store file info
     context.user_data['file_id'] = photo.file_id
+    context.user_data['file_unique_id'] = photo.file_unique_id
+    context.user_data['duration'] = None
     context.user_data['file_name'] = f'photo_{photo.file_unique_id}.jpg'
     context.user_data['file_size'] = file_size
     context.user_data['file_ext'] = 'jpg'
@@ -773,6 +783,8 @@ async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Store file info
     context.user_data['file_id'] = audio.file_id
+    context.user_data['file_unique_id'] = audio.file_unique_id
+    context.user_data['duration'] = audio.duration
     context.user_data['file_name'] = file_name
     context.user_data['file_size'] = file_size
     context.user_data['file_ext'] = file_ext
@@ -864,6 +876,8 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Store file info
     context.user_data['file_id'] = voice.file_id
+    context.user_data['file_unique_id'] = voice.file_unique_id
+    context.user_data['duration'] = voice.duration
     context.user_data['file_name'] = file_name
     context.user_data['file_size'] = file_size
     context.user_data['file_ext'] = file_ext
@@ -969,6 +983,8 @@ async def handle_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Store file info
     context.user_data['file_id'] = video.file_id
+    context.user_data['file_unique_id'] = video.file_unique_id
+    context.user_data['duration'] = video.duration
     context.user_data['file_name'] = file_name
     context.user_data['file_size'] = file_size
     context.user_data['file_ext'] = file_ext
@@ -1031,7 +1047,7 @@ async def upgrade_prompt_callback(update: Update, context: ContextTypes.DEFAULT_
     text = get_text(lang, 'upgrade_to_premium',
                    card_number=CARD_NUMBER,
                    conversions_today=conversions_today,
-                   daily_limit=FREE_TIER_LIMITS['daily_conversions'])
+                   daily_limit=db.reference.limits('free')['daily_conversions'])
     
     keyboard = [
         [InlineKeyboardButton(
@@ -1058,13 +1074,28 @@ async def upgrade_prompt_callback(update: Update, context: ContextTypes.DEFAULT_
 async def convert_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle format conversion - WITH ENHANCED LOGGING"""
     query = update.callback_query
-    await query.answer()
     
     user_id = query.from_user.id
     username = query.from_user.username or query.from_user.first_name
     
     user = await db.get_user(user_id)
     lang = user.get('language_code', 'en')
+    limits = await get_user_limits(user_id)
+    
+    # Per-user cap on queued + running jobs; the keyboard stays so they can retry later
+    pending = pipeline.user_pending(user_id)
+    if pending >= limits['max_queued_jobs']:
+        logger.info(f"⏳ User ID:{user_id} Name:{username} refused - {pending} conversions already pending")
+        await query.answer(get_text(lang, 'queue_full', count=pending), show_alert=True)
+        return
+    
+    # Shed new work while the server is overloaded
+    retry_minutes = admission.check(limits)
+    if retry_minutes is not None:
+        logger.warning(f"🚦 User ID:{user_id} Name:{username} shed under load - retry in {retry_minutes} min")
+        await query.answer(get_text(lang, 'server_busy_retry', minutes=retry_minutes), show_alert=True)
+        return
+    await query.answer()
     
     target_format = query.data.split('_')[1]
     
@@ -1073,6 +1104,8 @@ async def convert_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     file_name = context.user_data.get('file_name')
     file_size = context.user_data.get('file_size')
     file_ext = context.user_data.get('file_ext')
+    file_unique_id = context.user_data.get('file_unique_id')
+    media_duration = context.user_data.get('duration')
     
     logger.info(f"🔄 User ID:{user_id} Name:{username} started conversion: {file_ext} -> {target_format}")
     
@@ -1080,88 +1113,48 @@ async def convert_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"❌ User ID:{user_id} - No file_id in context")
         return
     
+    # Hand the job to the download/convert/upload pipeline; it reports back via processing_msg
+    job = ConversionJob(
+        user_id=user_id,
+        username=username,
+        chat_id=query.message.chat_id,
+        lang=lang,
+        file_id=file_id,
+        file_name=file_name,
+        file_size=file_size,
+        file_ext=file_ext,
+        target_format=target_format,
+        tier_limits=limits,
+        status_message_id=query.message.message_id,
+        file_unique_id=file_unique_id,
+        media_duration=media_duration
+    )
+    
     # Send processing message
     text = get_text(lang, 'converting', format=target_format.upper())
-    processing_msg = await query.edit_message_text(text, parse_mode=ParseMode.HTML)
+    processing_msg = await query.edit_message_text(
+        text, reply_markup=cancel_markup(job), parse_mode=ParseMode.HTML
+    )
+    job.status_message_id = processing_msg.message_id
     logger.info(f"📤 Sent processing message to user ID:{user_id}")
     
-    try:
-        start_time = time.time()
-        
-        # Download file
-        logger.info(f"⬇️ Downloading file for user ID:{user_id} - {file_name} ({file_size} bytes)")
-        file = await context.bot.get_file(file_id)
-        input_path = f'/tmp/{file_id}_{file_name}'
-        await file.download_to_drive(input_path)
-        logger.info(f"✅ Download complete for user ID:{user_id} - Path: {input_path}")
-        
-        # Convert file
-        logger.info(f"🔧 Starting conversion for user ID:{user_id} - {file_ext} to {target_format}")
-        output_path = converter.convert(input_path, target_format)
-        
-        if not output_path or not os.path.exists(output_path):
-            logger.error(f"❌ Conversion failed for user ID:{user_id} - Output file not created")
-            raise Exception("Conversion failed")
-        
-        processing_time = time.time() - start_time
-        output_size = os.path.getsize(output_path)
-        logger.info(f"✅ Conversion successful for user ID:{user_id} - Time: {processing_time:.2f}s, Size: {output_size} bytes")
-        
-        # Create proper output filename (keep original name, change extension)
-        original_name_without_ext = Path(file_name).stem
-        output_filename = f"{original_name_without_ext}.{target_format}"
-        
-        # Send converted file
-        logger.info(f"📤 Sending converted file to user ID:{user_id} - {output_filename}")
-        text = get_text(lang, 'conversion_success')
-        with open(output_path, 'rb') as output_file:
-            await context.bot.send_document(
-                chat_id=query.message.chat_id,
-                document=output_file,
-                filename=output_filename,
-                caption=text,
-                parse_mode=ParseMode.HTML
-            )
-        logger.info(f"✅ File sent successfully to user ID:{user_id} Name:{username}")
-        
-        # Log conversion
-        await db.log_conversion(
-            user_id=user_id,
-            original_filename=file_name,
-            original_format=file_ext,
-            target_format=target_format,
-            file_size=file_size,
-            status='success',
-            processing_time=processing_time
-        )
-        logger.info(f"📊 Logged successful conversion for user ID:{user_id}")
-        
-        # Clean up
-        try:
-            os.remove(input_path)
-            os.remove(output_path)
-            logger.info(f"🗑️ Cleaned up temp files for user ID:{user_id}")
-        except Exception as cleanup_error:
-            logger.warning(f"⚠️ Cleanup error for user ID:{user_id}: {cleanup_error}")
-        
-        await processing_msg.delete()
-        
-    except Exception as e:
-        logger.error(f"❌ Conversion error for user ID:{user_id} Name:{username} - Error: {e}", exc_info=True)
-        text = get_text(lang, 'conversion_failed', error=str(e))
-        await processing_msg.edit_text(text, parse_mode=ParseMode.HTML)
-        
-        # Log failed conversion
-        await db.log_conversion(
-            user_id=user_id,
-            original_filename=file_name,
-            original_format=file_ext,
-            target_format=target_format,
-            file_size=file_size,
-            status='failed',
-            error_message=str(e)
-        )
-        logger.info(f"📊 Logged failed conversion for user ID:{user_id}")
+    pipeline.submit(job)
+
+
+async def cancel_conversion_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the cancel button on a processing message"""
+    query = update.callback_query
+    user_id = query.from_user.id
+    job_id = query.data.split('_', 1)[1]
+    
+    user = await db.get_user(user_id)
+    lang = user.get('language_code', 'en') if user else 'en'
+    
+    if pipeline.cancel(job_id, user_id):
+        logger.info(f"🚫 User ID:{user_id} requested cancellation of job {job_id}")
+        await query.answer(get_text(lang, 'cancel_requested'))
+    else:
+        await query.answer(get_text(lang, 'cancel_too_late'), show_alert=True)
 
 
 async def handle_payment_proof(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1368,12 +1361,42 @@ def get_category_keyboard(lang: str):
     return InlineKeyboardMarkup(keyboard)
 
 
+async def post_init(application: Application):
+    """Start background workers once the event loop is running"""
+    await db.quota.start()
+    await db.reference.start()
+    db.conversion_log.start()
+    await pipeline.start(application.bot)
+    admission.start()
+
+
+async def post_stop(application: Application):
+    """Drain: polling has stopped, let in-flight conversions finish and flush pending writes"""
+    logger.info("🛑 Stop signal received, draining conversions")
+    await admission.stop()
+    await pipeline.drain(DRAIN_DEADLINE_SECONDS)
+    await lifecycle.flush_all(DRAIN_FLUSH_TIMEOUT_SECONDS)
+
+
+async def post_shutdown(application: Application):
+    """Stop background workers"""
+    await admission.stop()
+    await pipeline.stop()
+    journal.close()
+    await db.quota.stop()
+    await db.reference.stop()
+    await db.conversion_log.stop()
+    await db.close()
+
+
 def main():
     """Start the bot"""
     # Import admin and broadcast modules
     from admin import (
         stats_command,
         users_command,
+        metrics_command,
+        reload_command,
         admin_stats_callback,
         admin_back_callback, admin_users_callback,admin_conversions_callback, admin_payments_callback, admin_premium_users_callback
     )
@@ -1383,8 +1406,41 @@ def main():
     # Initialize broadcast manager
     broadcast_manager = BroadcastManager(db)
     
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     setup_subscription_handlers(application)
+    
+    # Periodic cleanup of orphaned temp files
+    application.job_queue.run_repeating(
+        sweep_workspaces_job,
+        interval=WORKSPACE_SWEEP_INTERVAL_SECONDS,
+        first=60,
+        data=workspaces,
+        name='workspace_sweeper'
+    )
+    
+    # Tier and quota checks only read; these keep the stored values current
+    application.job_queue.run_repeating(
+        expire_premium_job,
+        interval=PREMIUM_EXPIRY_INTERVAL_SECONDS,
+        first=30,
+        data=db,
+        name='premium_expiry'
+    )
+    application.job_queue.run_daily(
+        daily_rollover_job,
+        time=DAILY_ROLLOVER_AT,
+        data=db,
+        name='daily_rollover'
+    )
+    # Catch up on a midnight missed while the bot was down
+    application.job_queue.run_once(daily_rollover_job, when=10, data=db, name='daily_rollover_startup')
 
     # ============ EXISTING HANDLERS ============
     # Command handlers
@@ -1405,6 +1461,14 @@ def main():
         "users", 
         lambda u, c: users_command(u, c, db, NOTIFICATION_ADMIN_IDS)
     ))
+    application.add_handler(CommandHandler(
+        "metrics", 
+        lambda u, c: metrics_command(u, c, NOTIFICATION_ADMIN_IDS)
+    ))
+    application.add_handler(CommandHandler(
+        "reload", 
+        lambda u, c: reload_command(u, c, db, NOTIFICATION_ADMIN_IDS)
+    ))
     application.add_handler(CommandHandler(
         "broadcast", 
         lambda u, c: broadcast_manager.start_broadcast(u, c, NOTIFICATION_ADMIN_IDS)
@@ -1414,6 +1478,7 @@ def main():
     application.add_handler(CallbackQueryHandler(language_callback, pattern='^lang_'))
     application.add_handler(CallbackQueryHandler(plan_callback, pattern='^plan_'))
     application.add_handler(CallbackQueryHandler(convert_callback, pattern='^convert_'))
+    application.add_handler(CallbackQueryHandler(cancel_conversion_callback, pattern='^cancel_'))
     application.add_handler(CallbackQueryHandler(upgrade_prompt_callback, pattern='^upgrade_prompt$'))
     application.add_handler(CallbackQueryHandler(approve_payment_callback, pattern='^approve_'))
     application.add_handler(CallbackQueryHandler(reject_payment_callback, pattern='^reject_'))
@@ -0,0 +1,42 @@
+"""
+In-process counters and gauges for the admin /metrics command
+"""
+
+import time
+import logging
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_started_at = time.time()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, Callable[[], dict]] = {}
+
+
+def incr(name: str, value: float = 1):
+    """Add value to a counter"""
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def get(name: str) -> float:
+    return _counters.get(name, 0)
+
+
+def register_gauge(name: str, source: Callable[[], dict]):
+    """Register a callable whose dict result is included in every snapshot"""
+    _gauges[name] = source
+
+
+def snapshot() -> dict:
+    """Counters plus the current value of every registered gauge"""
+    gauges = {}
+    for name, source in _gauges.items():
+        try:
+            gauges[name] = source()
+        except Exception as e:
+            logger.warning(f"⚠️ Gauge {name} failed: {e}")
+    return {
+        'uptime_seconds': time.time() - _started_at,
+        'counters': dict(_counters),
+        'gauges': gauges,
+    }
@@ -0,0 +1,88 @@
+"""
+Apply migrations/*.sql to the Postgres database, in order
+
+Applied versions (the number before the first underscore of the file name)
+are recorded in schema_migrations, so each file runs once. Statements run
+one at a time outside a transaction, which CREATE INDEX CONCURRENTLY needs;
+the migrations are written to be safe to re-run if one stops halfway.
+
+Usage:
+    DATABASE_URL=postgresql://... python migrate.py
+"""
+
+import os
+import sys
+import asyncio
+import logging
+from typing import List
+
+import asyncpg
+
+from config import PG_DSN
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split a script on semicolons outside $$-quoted function bodies, dropping -- comments"""
+    statements, current, in_body = [], [], False
+    for line in sql.splitlines():
+        if not in_body and line.strip().startswith('--'):
+            continue
+        if line.count('$$') % 2:
+            in_body = not in_body
+        current.append(line)
+        if not in_body and line.rstrip().endswith(';'):
+            statement = '\n'.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+    if '\n'.join(current).strip():
+        statements.append('\n'.join(current).strip())
+    return statements
+
+
+def migration_files(directory: str = MIGRATIONS_DIR) -> List[str]:
+    return sorted(name for name in os.listdir(directory) if name.endswith('.sql'))
+
+
+async def apply_migrations(conn: asyncpg.Connection, directory: str = MIGRATIONS_DIR,
+                           skip: tuple = ()) -> List[str]:
+    """Run the migrations not yet recorded; returns the versions applied now"""
+    await conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version text PRIMARY KEY, name text NOT NULL, applied_at timestamptz NOT NULL DEFAULT now())"
+    )
+    done = {row['version'] for row in await conn.fetch("SELECT version FROM schema_migrations")}
+    applied = []
+    for name in migration_files(directory):
+        version = name.split('_', 1)[0]
+        if version in done or version in skip:
+            continue
+        with open(os.path.join(directory, name), encoding='utf-8') as f:
+            statements = split_statements(f.read())
+        logger.info(f"🗃️ Applying migration {name} ({len(statements)} statements)")
+        for statement in statements:
+            await conn.execute(statement)
+        await conn.execute("INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name)
+        applied.append(version)
+    return applied
+
+
+async def main() -> int:
+    if not PG_DSN:
+        logger.error("❌ Set DATABASE_URL to the database to migrate")
+        return 1
+    conn = await asyncpg.connect(PG_DSN)
+    try:
+        applied = await apply_migrations(conn)
+    finally:
+        await conn.close()
+    logger.info(f"✅ Applied {len(applied)} migrations" if applied else "✅ Database is up to date")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,69 @@
+-- 000: baseline schema for the bot's tables
+--
+-- What the readme used to call db_schema.sql. Every statement is a no-op on
+-- a database that already has the tables, so existing deployments can run
+-- it too. Apply the migrations in order with `python migrate.py`.
+
+create table if not exists converter_users (
+    user_id bigint primary key,
+    username text,
+    first_name text,
+    last_name text,
+    language_code text default 'en',
+    subscription_tier text not null default 'free',
+    subscription_expires_at timestamptz,
+    created_at timestamptz not null default now()
+);
+
+create table if not exists converter_user_stats (
+    user_id bigint primary key references converter_users (user_id) on delete cascade,
+    conversions_today integer not null default 0,
+    total_conversions integer not null default 0,
+    last_conversion_date date,
+    total_files_size_bytes bigint not null default 0
+);
+
+-- Append-only log; no foreign key so the bulk inserts from the spool stay cheap
+create table if not exists file_conversions (
+    id bigint generated by default as identity primary key,
+    user_id bigint not null,
+    original_filename text,
+    original_format text,
+    target_format text,
+    file_size_bytes bigint,
+    conversion_status text not null default 'success',
+    error_message text,
+    processing_time_seconds double precision,
+    created_at timestamptz not null default now()
+);
+
+create table if not exists subscription_plans (
+    id bigint generated by default as identity primary key,
+    name text not null,
+    price numeric not null,
+    duration_days integer not null,
+    is_active boolean not null default true,
+    created_at timestamptz not null default now()
+);
+
+create table if not exists converter_payments (
+    id bigint generated by default as identity primary key,
+    user_id bigint not null references converter_users (user_id),
+    plan_id bigint not null references subscription_plans (id),
+    amount numeric not null,
+    payment_proof_file_id text,
+    status text not null default 'pending',
+    admin_notes text,
+    processed_at timestamptz,
+    processed_by bigint,
+    created_at timestamptz not null default now()
+);
+
+-- The plans listed in the readme, only into an empty table; edit the rows to change prices
+insert into subscription_plans (id, name, price, duration_days)
+select id, name, price, duration_days
+  from (values (1, 'Monthly', 10000, 30),
+               (2, 'Quarterly', 25000, 90),
+               (3, 'Yearly', 80000, 365)) as plans (id, name, price, duration_days)
+ where not exists (select 1 from subscription_plans);
+select setval(pg_get_serial_sequence('subscription_plans', 'id'), greatest(max(id), 1)) from subscription_plans;
@@ -0,0 +1,114 @@
+-- 001: database functions for flows that used several REST round-trips
+--
+-- Each function runs in one call and one transaction. Apply with psql or the
+-- Supabase SQL editor; until a function exists the bot logs a warning once
+-- and keeps using its multi-request Python path.
+
+-- create_user: user row + empty stats row (was two inserts)
+create or replace function create_converter_user(
+    p_user_id bigint,
+    p_username text default null,
+    p_first_name text default null,
+    p_last_name text default null,
+    p_language_code text default 'en'
+) returns setof converter_users
+language plpgsql
+set search_path = public
+as $$
+begin
+    insert into converter_users (user_id, username, first_name, last_name, language_code, subscription_tier)
+    values (p_user_id, p_username, p_first_name, p_last_name, p_language_code, 'free')
+    on conflict (user_id) do nothing;
+
+    insert into converter_user_stats (user_id, conversions_today, total_conversions, total_files_size_bytes)
+    values (p_user_id, 0, 0, 0)
+    on conflict (user_id) do nothing;
+
+    return query select * from converter_users where user_id = p_user_id;
+end;
+$$;
+
+-- upgrade_to_premium: extend from the current expiry if still active, else from now
+-- (was a read of the user row + an update). Returns the new expiry.
+create or replace function extend_premium(p_user_id bigint, p_days integer)
+returns timestamptz
+language plpgsql
+set search_path = public
+as $$
+declare
+    v_expires timestamptz;
+begin
+    update converter_users
+       set subscription_tier = 'premium',
+           subscription_expires_at = greatest(coalesce(subscription_expires_at, now()), now())
+                                     + make_interval(days => p_days)
+     where user_id = p_user_id
+    returning subscription_expires_at into v_expires;
+    return v_expires;
+end;
+$$;
+
+-- approve_payment: payment + plan lookup, mark approved, extend premium
+-- (was five round-trips). Returns {user_id, subscription_expires_at}, or null
+-- if the payment or its plan does not exist.
+create or replace function approve_converter_payment(p_payment_id bigint, p_admin_id bigint)
+returns jsonb
+language plpgsql
+set search_path = public
+as $$
+declare
+    v_user_id bigint;
+    v_plan_id bigint;
+    v_days integer;
+    v_expires timestamptz;
+begin
+    select user_id, plan_id into v_user_id, v_plan_id
+      from converter_payments
+     where id = p_payment_id
+       for update;
+    if not found then
+        return null;
+    end if;
+
+    select duration_days into v_days from subscription_plans where id = v_plan_id;
+    if v_days is null then
+        return null;
+    end if;
+
+    update converter_payments
+       set status = 'approved', processed_at = now(), processed_by = p_admin_id
+     where id = p_payment_id;
+
+    v_expires := extend_premium(v_user_id, v_days);
+    return jsonb_build_object('user_id', v_user_id, 'subscription_expires_at', v_expires);
+end;
+$$;
+
+-- Quota ledger flush: merge a batch of per-user increments atomically
+-- (was a select + an upsert computed in Python, which could lose increments
+-- written by another process in between).
+-- p_deltas: [{"user_id": 1, "date": "2024-01-31", "today": 2, "total": 2, "size": 1024}, ...]
+create or replace function apply_user_stats_deltas(p_deltas jsonb)
+returns table (user_id bigint, conversions_today integer)
+language sql
+set search_path = public
+as $$
+    insert into converter_user_stats as s
+        (user_id, conversions_today, total_conversions, last_conversion_date, total_files_size_bytes)
+    select (d ->> 'user_id')::bigint,
+           (d ->> 'today')::integer,
+           (d ->> 'total')::integer,
+           (d ->> 'date')::date,
+           (d ->> 'size')::bigint
+      from jsonb_array_elements(p_deltas) as d
+    on conflict (user_id) do update set
+        conversions_today = case
+            when s.last_conversion_date = excluded.last_conversion_date
+                then coalesce(s.conversions_today, 0) + excluded.conversions_today
+            else excluded.conversions_today
+        end,
+        total_conversions = coalesce(s.total_conversions, 0) + excluded.total_conversions,
+        last_conversion_date = excluded.last_conversion_date,
+        total_files_size_bytes = coalesce(s.total_files_size_bytes, 0) + excluded.total_files_size_bytes
+    returning s.user_id, s.conversions_today;
+$$;
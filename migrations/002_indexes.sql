@@ -0,0 +1,51 @@
+-- 002: indexes for the filters and sorts in admin.py, broadcast.py and database.py
+--
+-- CONCURRENTLY keeps the tables writable while the indexes build, but cannot
+-- run inside a transaction: apply with `python migrate.py` or psql, not the
+-- Supabase SQL editor. benchmarks/bench_query_plans.py checks that each query
+-- uses its index.
+
+-- Recent users (admin), daily new-user counts
+create index concurrently if not exists idx_converter_users_created_at
+    on converter_users (created_at desc);
+
+-- Premium lists ordered by expiry, premium counts, expiry sweeps
+create index concurrently if not exists idx_converter_users_tier_expires
+    on converter_users (subscription_tier, subscription_expires_at desc);
+
+-- Broadcast audience per language (index-only: user_id is in the index)
+create index concurrently if not exists idx_converter_users_language
+    on converter_users (language_code, user_id);
+
+-- Active today / this week; quota ledger refresh pages through today's rows by user_id
+create index concurrently if not exists idx_converter_user_stats_last_date
+    on converter_user_stats (last_conversion_date, user_id);
+
+-- Recent conversions, conversions today
+create index concurrently if not exists idx_file_conversions_created_at
+    on file_conversions (created_at desc);
+
+-- Success / failure counts (index-only scans instead of reading the whole log)
+create index concurrently if not exists idx_file_conversions_status
+    on file_conversions (conversion_status);
+
+-- A user's conversion history
+create index concurrently if not exists idx_file_conversions_user
+    on file_conversions (user_id, created_at desc);
+
+-- Pending count and approved revenue (amount included for index-only sums)
+create index concurrently if not exists idx_converter_payments_status
+    on converter_payments (status) include (amount);
+
+-- Recent payments
+create index concurrently if not exists idx_converter_payments_created_at
+    on converter_payments (created_at desc);
+
+-- A user's payments; also backs the foreign key
+create index concurrently if not exists idx_converter_payments_user
+    on converter_payments (user_id);
+
+analyze converter_users;
+analyze converter_user_stats;
+analyze file_conversions;
+analyze converter_payments;
@@ -0,0 +1,45 @@
+-- 003: let apply_user_stats_deltas take refunds
+--
+-- In enqueue mode the bot counts a conversion when it queues the job and the
+-- worker sends a -1 delta if it fails or is cancelled. The refund can reach
+-- the table before the bot's increment (or after the day rolled over), so
+-- the counters are clamped at zero instead of going negative. Existing rows
+-- are updated with the raw deltas; only missing rows are inserted, clamped.
+
+create or replace function apply_user_stats_deltas(p_deltas jsonb)
+returns table (user_id bigint, conversions_today integer)
+language sql
+set search_path = public
+as $$
+    with d as (
+        select (e ->> 'user_id')::bigint as user_id,
+               (e ->> 'today')::integer as today,
+               (e ->> 'total')::integer as total,
+               (e ->> 'date')::date as day,
+               (e ->> 'size')::bigint as size
+          from jsonb_array_elements(p_deltas) as e
+    ), updated as (
+        update converter_user_stats as s set
+            conversions_today = greatest(case
+                when s.last_conversion_date = d.day then coalesce(s.conversions_today, 0) + d.today
+                else d.today
+            end, 0),
+            total_conversions = greatest(coalesce(s.total_conversions, 0) + d.total, 0),
+            last_conversion_date = d.day,
+            total_files_size_bytes = greatest(coalesce(s.total_files_size_bytes, 0) + d.size, 0)
+          from d
+         where s.user_id = d.user_id
+        returning s.user_id, s.conversions_today
+    ), inserted as (
+        insert into converter_user_stats
+            (user_id, conversions_today, total_conversions, last_conversion_date, total_files_size_bytes)
+        select d.user_id, greatest(d.today, 0), greatest(d.total, 0), d.day, greatest(d.size, 0)
+          from d
+         where not exists (select 1 from converter_user_stats s where s.user_id = d.user_id)
+        on conflict (user_id) do nothing
+        returning converter_user_stats.user_id, converter_user_stats.conversions_today
+    )
+    select * from updated
+    union all
+    select * from inserted;
+$$;
@@ -0,0 +1,847 @@
+"""
+Three-stage download / convert / upload pipeline for conversion jobs
+"""
+
+import os
+import math
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+
+from config import (
+    MEMORY_PATH_MAX_BYTES, STREAMING_ENABLED, DISK_ADMISSION_WAIT_SECONDS,
+    PIPELINE_DOWNLOAD_WORKERS, PIPELINE_UPLOAD_WORKERS,
+    PIPELINE_STAGE_QUEUE_SIZE, CONVERT_CONCURRENCY,
+    QUEUE_STATUS_INTERVAL_SECONDS, QUEUE_STATUS_MIN_EDIT_SECONDS,
+    QUEUE_STATUS_MAX_EDITS_PER_TICK, JOB_DURATION_EWMA_ALPHA,
+    JOB_DURATION_INITIAL_SECONDS, DEDUP_RESULT_TTL_SECONDS,
+    JOURNAL_MAX_ATTEMPTS, JOURNAL_LEASE_SECONDS,
+    JOURNAL_CLAIM_INTERVAL_SECONDS, WORKER_PREFETCH,
+    PROGRESS_UPDATE_INTERVAL_SECONDS, PROGRESS_MIN_EDIT_SECONDS, FFMPEG_STALL_SECONDS,
+)
+from converters import get_resource_class
+from journal import JobJournal, RUNNING, UPLOADING, DELIVERED
+from resource_limits import JobLimits, ResourceLimitExceeded, ConversionCancelled
+from progress import JobProgress, ConversionStalled
+from scheduler import FairScheduler
+from streaming import stream_convert
+from translations import get_text
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class JobRejected(Exception):
+    """Raised when a job is refused before conversion; text_key is shown to the user"""
+
+    def __init__(self, text_key: str, **text_kwargs):
+        self.text_key = text_key
+        self.text_kwargs = text_kwargs
+        super().__init__(text_key)
+
+
+def cancel_markup(job: 'ConversionJob') -> InlineKeyboardMarkup:
+    """Cancel button shown on a job's processing message while it is running"""
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton(get_text(job.lang, 'btn_cancel'), callback_data=f'cancel_{job.job_id}')
+    ]])
+
+
+class ConversionJob:
+    """A conversion request travelling through the pipeline stages"""
+
+    def __init__(self, user_id: int, username: str, chat_id: int, lang: str,
+                 file_id: str, file_name: str, file_size: int, file_ext: str,
+                 target_format: str, tier_limits: dict, status_message_id: int,
+                 file_unique_id: Optional[str] = None, job_id: Optional[str] = None,
+                 media_duration: Optional[float] = None):
+        self.job_id = job_id or uuid.uuid4().hex[:16]
+        self.user_id = user_id
+        self.username = username
+        self.chat_id = chat_id
+        self.lang = lang
+        self.file_id = file_id
+        self.file_name = file_name
+        self.file_size = file_size
+        self.file_ext = file_ext
+        self.target_format = target_format
+        self.tier_limits = tier_limits
+        self.status_message_id = status_message_id
+        self.limits = JobLimits.from_tier(tier_limits)
+        self.output_filename = f"{Path(file_name).stem}.{target_format}"
+        self.file_unique_id = file_unique_id
+        self.media_duration = media_duration
+        self.quota_date: Optional[str] = None  # enqueue mode: the day the bot counted it
+        self.created_at = time.time()
+        self.attempts = 0
+
+        # Identical requests (same file, target and tier limits) share one conversion
+        self.dedup_key = (
+            (file_unique_id, target_format, tier_limits.get('tier')) if file_unique_id else None
+        )
+        self.leader: Optional['ConversionJob'] = None  # set on jobs riding on another job
+        self.followers = []
+        self.result_file_id: Optional[str] = None
+
+        # Filled in as the job moves through the stages
+        self.mode: Optional[str] = None            # memory / stream / disk
+        self.resource_class: Optional[str] = None  # ffmpeg / office / image / data
+        self.stream_cmd = None
+        self.progress: Optional[JobProgress] = None  # ffmpeg jobs only
+        self.start_time: Optional[float] = None
+        self.queue_status: Optional[tuple] = None  # (position, minutes) last shown to the user
+        self.progress_status: Optional[tuple] = None  # (percent step, ETA step) last shown
+        self.status_edited_at = 0.0
+        self.processing_time: Optional[float] = None
+        self.file_path: Optional[str] = None
+        self.input_data = None
+        self.input_path: Optional[str] = None
+        self.output = None
+        self.cleanup = ExitStack()
+        self.cancel_requested = asyncio.Event()
+        # Converter call running on the pipeline's thread pool; threads cannot be interrupted
+        self.executor_future: Optional[asyncio.Future] = None
+
+    @classmethod
+    def from_journal(cls, row: dict, tier_limits: dict) -> 'ConversionJob':
+        """Rebuild a job recorded by JobJournal before a restart, under the tier's current limits"""
+        job = cls(
+            user_id=row['user_id'],
+            username=row['username'],
+            chat_id=row['chat_id'],
+            lang=row['lang'],
+            file_id=row['file_id'],
+            file_name=row['file_name'],
+            file_size=row['file_size'],
+            file_ext=row['file_ext'],
+            target_format=row['target_format'],
+            tier_limits=tier_limits,
+            status_message_id=row['status_message_id'],
+            file_unique_id=row['file_unique_id'],
+            job_id=row['job_id'],
+            media_duration=row['media_duration'],
+        )
+        job.created_at = row['created_at']
+        job.attempts = row['attempts']
+        job.result_file_id = row['result_file_id']
+        job.processing_time = row['processing_time']
+        job.quota_date = row['quota_date']
+        return job
+
+    def __repr__(self):
+        return f"<ConversionJob user={self.user_id} {self.file_ext}->{self.target_format} {self.mode}>"
+
+
+class ConversionPipeline:
+    """Fair-scheduled intake feeding bounded download, per-resource-class convert and upload pools"""
+
+    def __init__(self, db, converter, workspaces,
+                 download_workers: int = PIPELINE_DOWNLOAD_WORKERS,
+                 upload_workers: int = PIPELINE_UPLOAD_WORKERS,
+                 convert_concurrency: Optional[dict] = None,
+                 stage_queue_size: int = PIPELINE_STAGE_QUEUE_SIZE,
+                 scheduler: Optional[FairScheduler] = None,
+                 journal: Optional[JobJournal] = None,
+                 owner: Optional[str] = None, enqueue_only: bool = False):
+        self.db = db
+        self.journal = journal
+        # Lease holder name in the journal; unique per process start
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # Bot process of a split deployment: journal jobs for worker.py, convert nothing
+        self.enqueue_only = enqueue_only
+        self.draining = False
+        self.converter = converter
+        self.workspaces = workspaces
+        self.bot = None
+        self.download_workers = download_workers
+        self.upload_workers = upload_workers
+        self.convert_concurrency = dict(convert_concurrency or CONVERT_CONCURRENCY)
+        self.stage_queue_size = stage_queue_size
+        self.executor = ThreadPoolExecutor(
+            max_workers=sum(self.convert_concurrency.values()),
+            thread_name_prefix='convert'
+        )
+        self.scheduler = scheduler or FairScheduler()
+        self.avg_job_seconds = float(JOB_DURATION_INITIAL_SECONDS)
+        self._dedup_inflight = {}  # dedup key -> leader job
+        self._dedup_recent = {}    # dedup key -> (telegram file_id, sent at)
+        self._background = set()
+        self._jobs = {}  # job_id -> job accepted here and not finished yet
+        self.convert_queues = {}
+        self.upload_queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    async def start(self, bot):
+        """Start the worker pools (call from the running event loop)"""
+        self.bot = bot
+        if self.enqueue_only:
+            logger.info("🏭 Pipeline in enqueue mode: jobs are converted by worker processes")
+            return
+        self.upload_queue = asyncio.Queue(maxsize=self.stage_queue_size)
+        self.convert_queues = {
+            cls: asyncio.Queue(maxsize=self.stage_queue_size) for cls in self.convert_concurrency
+        }
+
+        for i in range(self.download_workers):
+            self._tasks.append(asyncio.create_task(self._download_worker(), name=f'download-{i}'))
+        for cls, count in self.convert_concurrency.items():
+            for i in range(count):
+                self._tasks.append(asyncio.create_task(self._convert_worker(cls), name=f'convert-{cls}-{i}'))
+        for i in range(self.upload_workers):
+            self._tasks.append(asyncio.create_task(self._upload_worker(), name=f'upload-{i}'))
+        self._tasks.append(asyncio.create_task(self._queue_status_worker(), name='queue-status'))
+        self._tasks.append(asyncio.create_task(self._progress_worker(), name='progress'))
+
+        if self.journal:
+            self._tasks.append(asyncio.create_task(self._claim_worker(), name='journal-claim'))
+
+        logger.info(
+            f"🏭 Pipeline started: {self.download_workers} download, "
+            f"convert {self.convert_concurrency}, {self.upload_workers} upload workers"
+        )
+
+    async def drain(self, deadline_seconds: float) -> int:
+        """Stop taking work and let in-flight jobs finish; returns how many did not
+
+        Jobs not yet dispatched are handed back to the journal at once so a
+        newer instance can start them while this one is still finishing.
+        """
+        if self.enqueue_only:
+            return 0
+        self.draining = True
+        handed_back = []
+        for job in self.scheduler.take_queued():
+            handed_back.append(job)
+            handed_back.extend(job.followers)
+            job.followers = []
+            if job.dedup_key and self._dedup_inflight.get(job.dedup_key) is job:
+                del self._dedup_inflight[job.dedup_key]
+        for job in handed_back:
+            self._jobs.pop(job.job_id, None)
+        if self.journal and handed_back:
+            await self._journal_call(self.journal.release_jobs, [job.job_id for job in handed_back])
+        logger.info(
+            f"🛑 Draining: {self.scheduler.running()} jobs in flight, "
+            f"{len(handed_back)} queued jobs handed back to the journal"
+        )
+
+        deadline = time.monotonic() + deadline_seconds
+        while (self.scheduler.running() or self._background) and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+
+        remaining = self.scheduler.running()
+        if remaining:
+            logger.warning(f"⚠️ Drain deadline passed with {remaining} jobs unfinished; they will be re-run")
+        else:
+            logger.info("✅ Drain complete")
+        return remaining
+
+    async def stop(self):
+        """Cancel all workers"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Workers were cancelled mid-job: remove their workspaces and spooled output
+        for job in self.scheduler.take_running():
+            # Converters run in their own process group, so kill them explicitly
+            job.limits.cancel()
+            try:
+                job.cleanup.close()
+            except Exception as e:
+                logger.warning(f"⚠️ Cleanup error for user ID:{job.user_id}: {e}")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.journal and not self.enqueue_only:
+            # Let another process pick up whatever we did not finish right away
+            await self._journal_call(self.journal.release, self.owner)
+
+    def submit(self, job: ConversionJob, record: bool = True):
+        """Plan a job and hand it to the fair scheduler; returns immediately"""
+        metrics.incr('jobs_submitted')
+        # While draining, new jobs are left unowned for the next instance
+        local = not (self.enqueue_only or self.draining)
+        if not local and record:
+            # Counted now so the daily limit holds before a worker gets to it; refunded if it fails
+            job.quota_date = self.db.count_conversion(job.user_id, job.file_size)
+        if self.journal and record:
+            self._journal_write(self.journal.record, job, owner=self.owner if local else None)
+        if not local:
+            logger.info(f"📥 Enqueued {job} for worker processes")
+            return
+        self._jobs[job.job_id] = job
+        if job.dedup_key and self._coalesce(job):
+            return
+        self._plan(job)
+        self.scheduler.push(job)
+        logger.info(f"📥 Queued {job} (waiting: {self.scheduler.qsize()})")
+
+    def cancel(self, job_id: str, user_id: int) -> bool:
+        """Abort a user's job at whatever stage it is in; False if there is nothing to cancel
+
+        Queued jobs are dropped, a running stage is interrupted (the converter
+        process group is killed) and the worker slot is freed immediately.
+        In enqueue mode the request is left in the journal for the worker.
+        """
+        if self.enqueue_only:
+            return bool(self.journal) and self.journal.request_cancel(job_id, user_id)
+
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return False
+        if job.cancel_requested.is_set():
+            return True
+        if job.leader is not None:
+            if job not in job.leader.followers:
+                return False  # the shared result is already on its way
+            # Riding on someone else's conversion: just stop waiting for it
+            job.leader.followers.remove(job)
+            job.leader = None
+            dispatched = False
+        elif self.scheduler.remove(job):
+            dispatched = False
+        elif job in self.scheduler.running_jobs():
+            dispatched = True
+        else:
+            return False  # a recent identical result is already being sent
+
+        job.cancel_requested.set()
+        job.limits.cancel()
+        metrics.incr('jobs_cancel_requested')
+        logger.info(f"🚫 User ID:{user_id} cancelled {job}")
+        if job.followers:
+            self._promote_follower(job)
+
+        if dispatched:
+            # Its stage task raises ConversionCancelled and finishes it. A killed process group
+            # frees the slot now; a converter thread keeps it until the thread returns
+            if job.executor_future is None:
+                self.scheduler.release(job)
+            return True
+        task = asyncio.create_task(self._finish(job, ConversionCancelled()))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return True
+
+    def _promote_follower(self, job: ConversionJob):
+        """Hand a leader's followers to the first of them, which runs the conversion on its own"""
+        followers, job.followers = job.followers, []
+        leader = followers[0]
+        leader.leader = None
+        leader.followers = followers[1:]
+        for follower in leader.followers:
+            follower.leader = leader
+        if self._dedup_inflight.get(job.dedup_key) is job:
+            self._dedup_inflight[job.dedup_key] = leader
+        self._plan(leader)
+        self.scheduler.push(leader)
+        logger.info(f"♻️ User ID:{leader.user_id} takes over the conversion of user ID:{job.user_id}")
+
+    async def _claim_worker(self):
+        """Keep our journal leases alive and take over enqueued or orphaned jobs"""
+        last_renew = 0.0
+        while True:
+            try:
+                now = time.monotonic()
+                if now - last_renew >= JOURNAL_LEASE_SECONDS / 3:
+                    await self._journal_call(self.journal.renew, self.owner)
+                    last_renew = now
+                # Cancel buttons pressed in the bot process of a split deployment
+                for job_id in await self._journal_call(self.journal.cancel_requests, self.owner):
+                    job = self._jobs.get(job_id)
+                    if job is not None:
+                        self.cancel(job_id, job.user_id)
+                room = WORKER_PREFETCH - self.scheduler.qsize()
+                if room > 0 and not self.draining:
+                    for row in await self._journal_call(self.journal.claim, self.owner, room):
+                        await self._adopt(row)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error claiming journaled jobs: {e}")
+            await asyncio.sleep(JOURNAL_CLAIM_INTERVAL_SECONDS)
+
+    async def _adopt(self, row: dict):
+        """Run a job claimed from the journal: enqueued by the bot or left by a dead process"""
+        try:
+            job = ConversionJob.from_journal(row, self.db.reference.limits(row['tier']))
+        except Exception as e:
+            logger.error(f"Error restoring journaled job {row.get('job_id')}: {e}")
+            self._journal_write(self.journal.finish, row['job_id'])
+            return
+
+        if row.get('cancel_requested'):
+            await self._finish(job, ConversionCancelled())
+            return
+
+        if row['state'] == DELIVERED:
+            # The user already has the file; only logging was interrupted
+            await self._finish(job)
+            return
+
+        interrupted = bool(row['owner'])
+        if interrupted:
+            if job.attempts >= JOURNAL_MAX_ATTEMPTS:
+                await self._finish(job, Exception(f"Interrupted {job.attempts} times"))
+                return
+            if row['state'] == UPLOADING:
+                logger.warning(f"⚠️ Job {job.job_id} was interrupted mid-upload; user ID:{job.user_id} may receive it twice")
+            logger.info(f"🔁 Resuming job {job.job_id} of user ID:{job.user_id} left by {row['owner']}")
+            metrics.incr('jobs_resumed')
+        else:
+            metrics.incr('jobs_claimed')
+
+        self.submit(job, record=False)
+        if interrupted:
+            await self._edit_status(
+                job, get_text(job.lang, 'conversion_resumed', format=job.target_format.upper()), cancellable=True
+            )
+
+    def _journal_write(self, method, *args, **kwargs):
+        """Queue a journal write on the journal's thread; writes apply in the order queued"""
+        self.journal.executor.submit(method, *args, **kwargs)
+
+    async def _journal_call(self, method, *args):
+        """Run a journal call on its thread, after every write queued before it"""
+        return await asyncio.get_running_loop().run_in_executor(self.journal.executor, method, *args)
+
+    def _journal_state(self, job: ConversionJob, state: str, **fields):
+        if self.journal:
+            self._journal_write(self.journal.set_state, job.job_id, state, **fields)
+
+    def _coalesce(self, job: ConversionJob) -> bool:
+        """Attach a job to an identical in-flight or just-finished one; True if it was"""
+        recent = self._dedup_recent.get(job.dedup_key)
+        if recent and time.time() - recent[1] <= DEDUP_RESULT_TTL_SECONDS:
+            metrics.incr('dedup_recent_hits')
+            metrics.incr('dedup_bytes_saved', job.file_size or 0)
+            logger.info(f"♻️ Reusing recent result for user ID:{job.user_id} - {job.dedup_key}")
+            task = asyncio.create_task(self._deliver_shared(job, recent[0]))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+            return True
+
+        leader = self._dedup_inflight.get(job.dedup_key)
+        if leader is None:
+            self._dedup_inflight[job.dedup_key] = job
+            return False
+
+        job.leader = leader
+        leader.followers.append(job)
+        metrics.incr('dedup_inflight_hits')
+        metrics.incr('dedup_bytes_saved', job.file_size or 0)
+        logger.info(f"♻️ User ID:{job.user_id} joined in-flight conversion of user ID:{leader.user_id} - {job.dedup_key}")
+        return True
+
+    def _remember_result(self, job: ConversionJob):
+        now = time.time()
+        self._dedup_recent = {
+            key: value for key, value in self._dedup_recent.items()
+            if now - value[1] <= DEDUP_RESULT_TTL_SECONDS
+        }
+        self._dedup_recent[job.dedup_key] = (job.result_file_id, now)
+
+    def user_pending(self, user_id: int) -> int:
+        """Jobs a user has queued or running, including ones riding on another job"""
+        if self.enqueue_only and self.journal:
+            return self.journal.pending_for_user(user_id)
+        # Coalesced followers never enter the scheduler
+        followers = sum(1 for job in self._jobs.values() if job.user_id == user_id and job.leader is not None)
+        return self.scheduler.pending(user_id) + followers
+
+    def estimate_wait_seconds(self, position: int) -> float:
+        """Rough wait before the job at this queue position is dispatched"""
+        slots = max(1, sum(self.convert_concurrency.values()))
+        return math.ceil(position / slots) * self.avg_job_seconds
+
+    def stats(self) -> dict:
+        """Queue depths per stage"""
+        return {
+            'waiting': self.scheduler.qsize(),
+            'avg_job_seconds': round(self.avg_job_seconds, 1),
+            'convert': {cls: q.qsize() for cls, q in self.convert_queues.items()},
+            'upload': self.upload_queue.qsize() if self.upload_queue else 0,
+        }
+
+    def _plan(self, job: ConversionJob):
+        """Pick the memory, stream or disk path and the convert resource class"""
+        job.resource_class = get_resource_class(job.file_ext)
+        if job.resource_class == 'ffmpeg':
+            job.progress = JobProgress(job.media_duration)
+        if (job.file_size and job.file_size <= MEMORY_PATH_MAX_BYTES
+                and self.converter.supports_memory(job.file_ext, job.target_format)):
+            job.mode = 'memory'
+            return
+        if STREAMING_ENABLED:
+            job.stream_cmd = self.converter.ffmpeg_stream_command(
+                job.file_ext, job.target_format, with_progress=job.progress is not None
+            )
+        job.mode = 'stream' if job.stream_cmd else 'disk'
+
+    # Workers
+    async def _queue_status_worker(self):
+        """Keep each queued job's processing message showing its position and ETA"""
+        while True:
+            await asyncio.sleep(QUEUE_STATUS_INTERVAL_SECONDS)
+            try:
+                now = time.monotonic()
+                edits = 0
+                for position, job in enumerate(self.scheduler.ordered(), start=1):
+                    if edits >= QUEUE_STATUS_MAX_EDITS_PER_TICK:
+                        break
+                    if job.start_time:
+                        # Dispatched while earlier edits in this tick were awaited
+                        continue
+                    minutes = max(1, math.ceil(self.estimate_wait_seconds(position) / 60))
+                    status = (position, minutes)
+                    if status == job.queue_status or now - job.status_edited_at < QUEUE_STATUS_MIN_EDIT_SECONDS:
+                        continue
+                    job.queue_status = status
+                    job.status_edited_at = now
+                    edits += 1
+                    await self._edit_status(job, get_text(
+                        job.lang, 'queued_position',
+                        format=job.target_format.upper(), position=position, minutes=minutes
+                    ), cancellable=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error updating queue positions: {e}")
+
+    async def _progress_worker(self):
+        """Push ffmpeg progress into status messages and kill conversions that stall"""
+        while True:
+            await asyncio.sleep(PROGRESS_UPDATE_INTERVAL_SECONDS)
+            try:
+                now = time.monotonic()
+                for job in self.scheduler.running_jobs():
+                    progress = job.progress
+                    if progress is None or not progress.active:
+                        continue
+
+                    if progress.stalled_for() > FFMPEG_STALL_SECONDS:
+                        if progress.kill_stalled():
+                            metrics.incr('jobs_stalled')
+                            logger.warning(
+                                f"🐌 Killed stalled conversion for user ID:{job.user_id} - "
+                                f"no progress for {progress.stalled_for():.0f}s at {progress.out_time:.0f}s"
+                            )
+                        continue
+
+                    percent = progress.percent
+                    if percent is None or now - job.status_edited_at < PROGRESS_MIN_EDIT_SECONDS:
+                        continue
+                    eta = progress.eta_seconds
+                    status = (percent // 5, round(eta / 30) if eta is not None else None)
+                    if status == job.progress_status:
+                        continue
+                    job.progress_status = status
+                    job.status_edited_at = now
+                    filled = percent // 10
+                    await self._edit_status(job, get_text(
+                        job.lang, 'conversion_progress' if eta is not None else 'conversion_progress_no_eta',
+                        format=job.target_format.upper(), percent=percent,
+                        bar='▓' * filled + '░' * (10 - filled),
+                        eta=f"{int(eta // 60)}:{int(eta % 60):02d}" if eta is not None else ''
+                    ), cancellable=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error updating conversion progress: {e}")
+
+    async def _download_worker(self):
+        while True:
+            # Next job by weighted fair share, skipping users at their slot cap
+            job = await self.scheduler.get()
+            try:
+                await self._run_stage(job, self._download(job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await self._finish(job, e)
+            else:
+                # Blocks while the convert stage is full (backpressure)
+                await self.convert_queues[job.resource_class].put(job)
+
+    async def _convert_worker(self, resource_class: str):
+        queue = self.convert_queues[resource_class]
+        while True:
+            job = await queue.get()
+            try:
+                await self._run_stage(job, self._convert(job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await self._finish(job, e)
+            else:
+                await self.upload_queue.put(job)
+            finally:
+                queue.task_done()
+
+    async def _upload_worker(self):
+        while True:
+            job = await self.upload_queue.get()
+            try:
+                await self._run_stage(job, self._upload(job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await self._finish(job, e)
+            else:
+                await self._finish(job)
+            finally:
+                self.upload_queue.task_done()
+
+    async def _run_stage(self, job: ConversionJob, stage):
+        """Await a stage coroutine, interrupting it if the user cancels the job"""
+        if job.cancel_requested.is_set():
+            stage.close()
+            raise ConversionCancelled()
+        task = asyncio.ensure_future(stage)
+        cancelled = asyncio.ensure_future(job.cancel_requested.wait())
+        try:
+            await asyncio.wait((task, cancelled), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancelled.cancel()
+            if not task.done() and job.executor_future is not None and job.cancel_requested.is_set():
+                # The converter thread runs on regardless: keep this worker, the slot and
+                # the workspace until it returns so CONVERT_CONCURRENCY holds
+                await asyncio.gather(asyncio.shield(job.executor_future), return_exceptions=True)
+            if not task.done():
+                # Cancelled download/upload, or the worker itself is being stopped
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if job.cancel_requested.is_set():
+            raise ConversionCancelled()
+        return task.result()
+
+    # Stages
+    async def _download(self, job: ConversionJob):
+        job.start_time = time.time()
+        self._journal_state(job, RUNNING)
+        if job.queue_status:
+            # The message still shows a queue position
+            job.queue_status = None
+            await self._edit_status(
+                job, get_text(job.lang, 'converting', format=job.target_format.upper()), cancellable=True
+            )
+
+        if job.mode == 'memory':
+            logger.info(f"⬇️ Downloading file into memory for user ID:{job.user_id} - {job.file_name} ({job.file_size} bytes)")
+            file = await self.bot.get_file(job.file_id)
+            job.input_data = await file.download_as_bytearray()
+            return
+
+        # Disk admission: wait for space, refuse if it doesn't free up in time
+        if not await self.workspaces.wait_for_room(job.file_size, timeout=DISK_ADMISSION_WAIT_SECONDS):
+            logger.warning(f"💽 Refusing conversion for user ID:{job.user_id} - disk below watermark")
+            raise JobRejected('server_busy_disk')
+
+        file = await self.bot.get_file(job.file_id)
+        if job.mode == 'stream':
+            # Bytes are pulled by the convert stage as ffmpeg consumes them
+            job.file_path = file.file_path
+            return
+
+        # Each job gets a private directory that is removed whatever happens
+        ws = job.cleanup.enter_context(
+            self.workspaces.workspace(job.file_size, label=f'u{job.user_id}')
+        )
+        job.input_path = ws.path_for(job.file_name)
+        logger.info(f"⬇️ Downloading file for user ID:{job.user_id} - {job.file_name} ({job.file_size} bytes)")
+        await file.download_to_drive(job.input_path)
+        logger.info(f"✅ Download complete for user ID:{job.user_id} - Path: {job.input_path}")
+
+    async def _convert(self, job: ConversionJob):
+        logger.info(f"🔧 Starting {job.mode} conversion for user ID:{job.user_id} - {job.file_ext} to {job.target_format}")
+
+        if job.mode == 'memory':
+            job.output = await self._in_executor(
+                job, self.converter.convert_bytes,
+                job.input_data, job.file_ext, job.target_format, job.limits, job.progress
+            )
+            job.input_data = None
+            if not job.output:
+                logger.error(f"❌ Conversion failed for user ID:{job.user_id} - No output produced")
+                raise Exception("Conversion failed")
+        elif job.mode == 'stream':
+            job.output = await stream_convert(
+                job.file_path, job.stream_cmd, job.limits, spool_dir=self.workspaces.disk_root,
+                progress=job.progress
+            )
+            if job.output is None:
+                logger.error(f"❌ Conversion failed for user ID:{job.user_id} - ffmpeg stream produced no output")
+                raise Exception("Conversion failed")
+            job.cleanup.callback(job.output.close)
+        else:
+            job.output = await self._in_executor(
+                job, self.converter.convert,
+                job.input_path, job.target_format, job.limits, job.progress
+            )
+            if not job.output or not os.path.exists(job.output):
+                logger.error(f"❌ Conversion failed for user ID:{job.user_id} - Output file not created")
+                raise Exception("Conversion failed")
+
+        job.processing_time = time.time() - job.start_time
+        logger.info(f"✅ Conversion successful for user ID:{job.user_id} - Time: {job.processing_time:.2f}s")
+
+    async def _in_executor(self, job: ConversionJob, fn, *args):
+        """Run a converter call on the thread pool, recording it on the job while it runs"""
+        job.executor_future = asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        try:
+            # Shielded: cancelling the stage must not orphan the future _run_stage waits on
+            return await asyncio.shield(job.executor_future)
+        finally:
+            if job.executor_future.done():
+                job.executor_future = None
+
+    async def _upload(self, job: ConversionJob):
+        document = job.output
+        if job.mode == 'disk':
+            document = job.cleanup.enter_context(open(job.output, 'rb'))
+
+        logger.info(f"📤 Sending converted file to user ID:{job.user_id} - {job.output_filename}")
+        self._journal_state(job, UPLOADING)
+        message = await self.bot.send_document(
+            chat_id=job.chat_id,
+            document=document,
+            filename=job.output_filename,
+            caption=get_text(job.lang, 'conversion_success'),
+            parse_mode=ParseMode.HTML
+        )
+        if message.document:
+            job.result_file_id = message.document.file_id
+        # From here on a restart must not send the file again
+        self._journal_state(job, DELIVERED, result_file_id=job.result_file_id,
+                            processing_time=job.processing_time)
+        logger.info(f"✅ File sent successfully to user ID:{job.user_id} Name:{job.username}")
+
+    async def _deliver_shared(self, job: ConversionJob, file_id: str):
+        """Send a result converted for an identical request by its Telegram file_id"""
+        try:
+            self._journal_state(job, UPLOADING)
+            await self.bot.send_document(
+                chat_id=job.chat_id,
+                document=file_id,
+                caption=get_text(job.lang, 'conversion_success'),
+                parse_mode=ParseMode.HTML
+            )
+            job.processing_time = time.time() - job.created_at
+            self._journal_state(job, DELIVERED, result_file_id=file_id,
+                                processing_time=job.processing_time)
+            logger.info(f"✅ Shared result sent to user ID:{job.user_id} Name:{job.username}")
+        except Exception as e:
+            await self._finish(job, e)
+        else:
+            await self._finish(job)
+
+    async def _finish(self, job: ConversionJob, error: Optional[Exception] = None):
+        """Release job resources, update the status message and log the outcome"""
+        self.scheduler.release(job)
+        self._jobs.pop(job.job_id, None)
+        followers, job.followers = job.followers, []
+        if followers and error is None and not job.result_file_id:
+            # Sent, but Telegram returned no document id to forward: the followers convert it themselves
+            job.followers = followers
+            self._promote_follower(job)
+            followers = []
+        if job.dedup_key and self._dedup_inflight.get(job.dedup_key) is job:
+            del self._dedup_inflight[job.dedup_key]
+            if error is None and job.result_file_id:
+                self._remember_result(job)
+        if error is None and job.leader is None and job.start_time:
+            duration = time.time() - job.start_time
+            self.avg_job_seconds += JOB_DURATION_EWMA_ALPHA * (duration - self.avg_job_seconds)
+        try:
+            job.cleanup.close()
+        except Exception as e:
+            logger.warning(f"⚠️ Cleanup error for user ID:{job.user_id}: {e}")
+        job.input_data = None
+        job.output = None
+
+        if error is not None and job.quota_date:
+            self.db.refund_conversion(job.user_id, job.quota_date, job.file_size)
+
+        try:
+            if error is None:
+                metrics.incr('conversions_success')
+                await self.db.log_conversion(
+                    user_id=job.user_id,
+                    original_filename=job.file_name,
+                    original_format=job.file_ext,
+                    target_format=job.target_format,
+                    file_size=job.file_size,
+                    status='success',
+                    processing_time=job.processing_time,
+                    counted=bool(job.quota_date)
+                )
+                logger.info(f"📊 Logged successful conversion for user ID:{job.user_id}")
+                await self.bot.delete_message(chat_id=job.chat_id, message_id=job.status_message_id)
+                return
+
+            if isinstance(error, JobRejected):
+                text = get_text(job.lang, error.text_key, **error.text_kwargs)
+                await self._edit_status(job, text)
+                return
+
+            if isinstance(error, ConversionCancelled):
+                logger.info(f"🚫 Conversion cancelled by user ID:{job.user_id} Name:{job.username}")
+                status = 'cancelled'
+                text = get_text(job.lang, 'conversion_cancelled')
+            elif isinstance(error, ConversionStalled):
+                logger.warning(f"🐌 Conversion stalled for user ID:{job.user_id} Name:{job.username} - {error}")
+                status = 'failed'
+                text = get_text(job.lang, 'conversion_stalled')
+            elif isinstance(error, ResourceLimitExceeded):
+                logger.warning(f"🛑 Resource limit exceeded for user ID:{job.user_id} Name:{job.username} - {error}")
+                status = 'limit_exceeded'
+                text = get_text(job.lang, 'conversion_limit_exceeded')
+            else:
+                logger.error(f"❌ Conversion error for user ID:{job.user_id} Name:{job.username} - Error: {error}", exc_info=error)
+                status = 'failed'
+                text = get_text(job.lang, 'conversion_failed', error=str(error))
+            await self._edit_status(job, text)
+            metrics.incr(f'conversions_{status}')
+
+            await self.db.log_conversion(
+                user_id=job.user_id,
+                original_filename=job.file_name,
+                original_format=job.file_ext,
+                target_format=job.target_format,
+                file_size=job.file_size,
+                status=status,
+                error_message=str(error)
+            )
+            logger.info(f"📊 Logged {status} conversion for user ID:{job.user_id}")
+        except Exception as e:
+            logger.error(f"Error finishing job for user ID:{job.user_id}: {e}")
+        finally:
+            if self.journal:
+                self._journal_write(self.journal.finish, job.job_id)
+            # Requests that coalesced onto this job get the same outcome
+            for follower in followers:
+                if error is None:
+                    await self._deliver_shared(follower, job.result_file_id)
+                else:
+                    await self._finish(follower, error)
+
+    async def _edit_status(self, job: ConversionJob, text: str, cancellable: bool = False):
+        """Edit the job's processing message, keeping the cancel button if cancellable"""
+        try:
+            await self.bot.edit_message_text(
+                chat_id=job.chat_id,
+                message_id=job.status_message_id,
+                text=text,
+                parse_mode=ParseMode.HTML,
+                reply_markup=cancel_markup(job) if cancellable else None
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Could not update status message for user ID:{job.user_id}: {e}")
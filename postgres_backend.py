@@ -0,0 +1,295 @@
+"""
+Direct PostgreSQL storage backend (asyncpg)
+
+Talks to the Supabase Postgres (or any Postgres with the same tables) over
+the binary protocol instead of PostgREST: no HTTP request and no JSON
+encoding on either side per query. Connections come from an asyncpg pool,
+and asyncpg prepares every statement on first use and keeps it in a
+per-connection cache. Statement texts depend only on the table, the columns
+and the filter shape (IN lists are one array parameter), so the hot
+queries - user and stats lookups, conversion inserts, quota merges - run as
+prepared statements from their second call on.
+
+Use a direct or session-mode connection string: transaction-mode poolers
+(pgbouncer, Supavisor on port 6543) do not keep prepared statements.
+"""
+
+import json
+import asyncio
+import logging
+from decimal import Decimal
+from datetime import date, datetime, timezone
+from typing import Optional, Dict, Any, List, Union, Tuple
+
+import asyncpg
+
+from storage import StorageBackend, FunctionNotFound, RowRejected, Filters
+from config import (
+    PG_DSN, PG_POOL_MIN_SIZE, PG_POOL_MAX_SIZE, PG_STATEMENT_CACHE_SIZE, DB_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+_TABLES = (
+    'converter_users', 'converter_user_stats', 'file_conversions',
+    'subscription_plans', 'converter_payments',
+)
+
+_PRIMARY_KEYS = {
+    'converter_users': ['user_id'],
+    'converter_user_stats': ['user_id'],
+    'file_conversions': ['id'],
+    'subscription_plans': ['id'],
+    'converter_payments': ['id'],
+}
+
+_OPERATORS = {'eq': '=', 'neq': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+# The migrations/001 functions: SQL text and how to shape the result
+_FUNCTIONS = {
+    'create_converter_user': (
+        "SELECT * FROM create_converter_user($1, $2, $3, $4, $5)",
+        ('p_user_id', 'p_username', 'p_first_name', 'p_last_name', 'p_language_code'), 'rows'),
+    'extend_premium': (
+        "SELECT extend_premium($1, $2)", ('p_user_id', 'p_days'), 'value'),
+    'approve_converter_payment': (
+        "SELECT approve_converter_payment($1, $2)", ('p_payment_id', 'p_admin_id'), 'json'),
+    'apply_user_stats_deltas': (
+        "SELECT * FROM apply_user_stats_deltas($1::jsonb)", ('p_deltas',), 'rows'),
+}
+
+
+def _plain(value):
+    """Values as PostgREST would return them in JSON"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _record(row) -> Dict[str, Any]:
+    return {key: _plain(value) for key, value in row.items()}
+
+
+class PostgresBackend(StorageBackend):
+    """StorageBackend on an asyncpg connection pool"""
+
+    def __init__(self, dsn: str = PG_DSN, min_size: int = PG_POOL_MIN_SIZE,
+                 max_size: int = PG_POOL_MAX_SIZE, timeout: float = DB_TIMEOUT_SECONDS):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._pool: Optional[asyncpg.Pool] = None
+        self._pool_lock: Optional[asyncio.Lock] = None
+        self._types: Dict[str, Dict[str, str]] = {}  # table -> column -> data_type
+        self._missing_functions = set()
+
+    async def _get_pool(self) -> asyncpg.Pool:
+        """Created on first use so it binds to the running event loop"""
+        if self._pool is None:
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if self._pool is None:
+                    pool = await asyncpg.create_pool(
+                        self.dsn, min_size=self.min_size, max_size=self.max_size,
+                        statement_cache_size=PG_STATEMENT_CACHE_SIZE,
+                        command_timeout=self.timeout,
+                    )
+                    rows = await pool.fetch(
+                        "SELECT table_name, column_name, data_type FROM information_schema.columns "
+                        "WHERE table_schema = 'public' AND table_name = ANY($1::text[])",
+                        list(_TABLES)
+                    )
+                    types = {}
+                    for row in rows:
+                        types.setdefault(row['table_name'], {})[row['column_name']] = row['data_type']
+                    self._types = types
+                    self._pool = pool
+                    logger.info(f"🐘 Postgres pool ready ({self.min_size}-{self.max_size} connections)")
+        return self._pool
+
+    # SQL building
+    def _check(self, table: str, columns) -> Dict[str, str]:
+        """Table and column names go into SQL text, so only known ones pass"""
+        known = self._types.get(table)
+        if known is None:
+            raise ValueError(f"Unknown table {table}")
+        for column in columns:
+            if column not in known:
+                raise ValueError(f"Unknown column {table}.{column}")
+        return known
+
+    def _check_row(self, table: str, columns) -> Dict[str, str]:
+        """Like PostgREST, refuse rows carrying columns the table does not have"""
+        try:
+            return self._check(table, columns)
+        except ValueError as e:
+            raise RowRejected(str(e)) from e
+
+    @staticmethod
+    def _coerce(data_type: str, value):
+        """asyncpg wants date / datetime objects where the callers pass ISO strings
+
+        Naive values for timestamptz columns are taken as UTC, like the rest of
+        the bot does; asyncpg would otherwise read them in the server's zone.
+        """
+        if isinstance(value, str):
+            if data_type == 'date':
+                return date.fromisoformat(value[:10])
+            if data_type.startswith('timestamp'):
+                value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if (isinstance(value, datetime) and value.tzinfo is None
+                and data_type == 'timestamp with time zone'):
+            return value.replace(tzinfo=timezone.utc)
+        return value
+
+    def _where(self, table: str, filters: Optional[Filters], params: list) -> str:
+        types = self._check(table, (filters or {}).keys())
+        clauses = []
+        for column, value in (filters or {}).items():
+            if value is None:
+                clauses.append(f"{column} IS NULL")
+                continue
+            if isinstance(value, tuple):
+                op, operand = value
+            else:
+                op, operand = 'eq', value
+            if op == 'in':
+                params.append([self._coerce(types[column], v) for v in operand])
+                clauses.append(f"{column} = ANY(${len(params)})")
+            else:
+                params.append(self._coerce(types[column], operand))
+                clauses.append(f"{column} {_OPERATORS[op]} ${len(params)}")
+        return ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+
+    def _column_list(self, table: str, columns: str) -> str:
+        if columns.strip() == '*':
+            return '*'
+        names = [name.strip() for name in columns.split(',')]
+        self._check(table, names)
+        return ', '.join(names)
+
+    def _values(self, table: str, rows: List[dict], params: list) -> Tuple[List[str], str]:
+        """Column list and VALUES tuples for rows that share the same keys"""
+        columns = sorted(rows[0])
+        types = self._check_row(table, columns)
+        tuples = []
+        for row in rows:
+            if sorted(row) != columns:
+                raise RowRejected(f"All rows of a batch insert into {table} need the same columns")
+            placeholders = []
+            for column in columns:
+                params.append(self._coerce(types[column], row[column]))
+                placeholders.append(f"${len(params)}")
+            tuples.append(f"({', '.join(placeholders)})")
+        return columns, ', '.join(tuples)
+
+    async def _fetch(self, sql: str, params: list, timeout: Optional[float]) -> List[Dict[str, Any]]:
+        pool = await self._get_pool()
+        try:
+            rows = await pool.fetch(sql, *params, timeout=timeout)
+        except (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError) as e:
+            raise RowRejected(str(e)) from e
+        return [_record(row) for row in rows]
+
+    # StorageBackend
+    async def select(self, table: str, columns: str = '*', filters: Optional[Filters] = None,
+                     order: Optional[str] = None, limit: Optional[int] = None,
+                     offset: Optional[int] = None,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        await self._get_pool()
+        params = []
+        sql = f"SELECT {self._column_list(table, columns)} FROM {table}{self._where(table, filters, params)}"
+        if order:
+            column, _, direction = order.partition('.')
+            self._check(table, [column])
+            sql += f" ORDER BY {column} {'DESC' if direction == 'desc' else 'ASC'}"
+        if limit is not None:
+            params.append(limit)
+            sql += f" LIMIT ${len(params)}"
+        if offset:
+            params.append(offset)
+            sql += f" OFFSET ${len(params)}"
+        return await self._fetch(sql, params, timeout)
+
+    async def count(self, table: str, filters: Optional[Filters] = None,
+                    timeout: Optional[float] = None) -> int:
+        pool = await self._get_pool()
+        params = []
+        sql = f"SELECT count(*) FROM {table}{self._where(table, filters, params)}"
+        return await pool.fetchval(sql, *params, timeout=timeout)
+
+    async def insert(self, table: str, data: Union[dict, List[dict]],
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return []
+        await self._get_pool()
+        params = []
+        columns, values = self._values(table, rows, params)
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values} RETURNING *"
+        return await self._fetch(sql, params, timeout)
+
+    async def update(self, table: str, data: dict, filters: Filters,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        await self._get_pool()
+        columns = sorted(data)
+        types = self._check_row(table, columns)
+        params = [self._coerce(types[column], data[column]) for column in columns]
+        assignments = ', '.join(f"{column} = ${i}" for i, column in enumerate(columns, 1))
+        sql = f"UPDATE {table} SET {assignments}{self._where(table, filters, params)} RETURNING *"
+        return await self._fetch(sql, params, timeout)
+
+    async def upsert(self, table: str, data: Union[dict, List[dict]],
+                     on_conflict: Optional[str] = None,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return []
+        await self._get_pool()
+        target = [c.strip() for c in on_conflict.split(',')] if on_conflict else _PRIMARY_KEYS[table]
+        self._check(table, target)
+        params = []
+        columns, values = self._values(table, rows, params)
+        updates = [column for column in columns if column not in target]
+        action = (
+            'DO UPDATE SET ' + ', '.join(f"{column} = EXCLUDED.{column}" for column in updates)
+            if updates else 'DO NOTHING'
+        )
+        sql = (
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values} "
+            f"ON CONFLICT ({', '.join(target)}) {action} RETURNING *"
+        )
+        return await self._fetch(sql, params, timeout)
+
+    async def rpc(self, function: str, params: Optional[dict] = None,
+                  timeout: Optional[float] = None):
+        """Call a migrations/001 function; FunctionNotFound if it is unknown or not installed"""
+        spec = _FUNCTIONS.get(function)
+        if spec is None or function in self._missing_functions:
+            raise FunctionNotFound(function)
+        sql, names, shape = spec
+        params = params or {}
+        args = [params.get(name) for name in names]
+        if function == 'apply_user_stats_deltas':
+            args = [json.dumps(args[0])]
+        pool = await self._get_pool()
+        try:
+            if shape == 'rows':
+                return [_record(row) for row in await pool.fetch(sql, *args, timeout=timeout)]
+            value = await pool.fetchval(sql, *args, timeout=timeout)
+        except asyncpg.UndefinedFunctionError as e:
+            self._missing_functions.add(function)
+            logger.warning(f"⚠️ Database function {function} not found, using the multi-request fallback (see migrations/)")
+            raise FunctionNotFound(function) from e
+        if shape == 'json':
+            return json.loads(value) if value is not None else None
+        return _plain(value)
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
@@ -0,0 +1,127 @@
+"""
+Live progress of ffmpeg conversions from its -progress stream
+"""
+
+import re
+import time
+import logging
+from typing import Optional, List
+
+from resource_limits import ConversionAborted, kill_process_group
+
+logger = logging.getLogger(__name__)
+
+_DURATION_RE = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+_PROGRESS_KEYS = ('out_time_us', 'out_time_ms', 'out_time', 'speed', 'progress')
+
+
+class ConversionStalled(ConversionAborted):
+    """Raised when a converter stops making progress and is killed by the watchdog"""
+
+    def __init__(self, detail: str = ''):
+        self.detail = detail
+        super().__init__("stalled" + (f": {detail}" if detail else ''))
+
+
+def progress_args(progress: Optional['JobProgress']) -> List[str]:
+    """ffmpeg options that write machine-readable progress to stderr"""
+    return ['-progress', 'pipe:2', '-nostats'] if progress is not None else []
+
+
+def _parse_clock(value: str) -> Optional[float]:
+    """Seconds from HH:MM:SS.micro"""
+    try:
+        hours, minutes, seconds = value.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return None
+
+
+class JobProgress:
+    """Position, speed and stall state of one running ffmpeg process
+
+    Written from the converter thread or stream reader, read by the pipeline's
+    progress monitor; all fields are plain attribute writes.
+    """
+
+    def __init__(self, duration: Optional[float] = None):
+        self.duration = duration if duration and duration > 0 else None
+        self.out_time = 0.0
+        self.speed: Optional[float] = None
+        self.finished = False
+        self.stalled = False
+        self.last_advance = time.monotonic()
+        self._process = None
+
+    def attach(self, process):
+        """Remember the running process so the watchdog can kill it"""
+        self._process = process
+        self.last_advance = time.monotonic()
+
+    def detach(self):
+        self._process = None
+
+    @property
+    def active(self) -> bool:
+        """True while a process is attached"""
+        return self._process is not None
+
+    def feed(self, line: str) -> bool:
+        """Parse one stderr line; returns True if it was a progress line"""
+        key, sep, value = line.partition('=')
+        key = key.strip()
+        if not sep or key not in _PROGRESS_KEYS:
+            if self.duration is None:
+                match = _DURATION_RE.search(line)
+                if match:
+                    hours, minutes, seconds = match.groups()
+                    self.duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds) or None
+            return False
+
+        value = value.strip()
+        if key in ('out_time_us', 'out_time_ms'):
+            # Both are microseconds (out_time_ms is misnamed in ffmpeg)
+            if value.isdigit():
+                self._advance(int(value) / 1_000_000)
+        elif key == 'out_time':
+            seconds = _parse_clock(value)
+            if seconds is not None:
+                self._advance(seconds)
+        elif key == 'speed':
+            try:
+                self.speed = float(value.rstrip('x')) or None
+            except ValueError:
+                pass
+        elif key == 'progress' and value == 'end':
+            self.finished = True
+        return True
+
+    def _advance(self, seconds: float):
+        if seconds > self.out_time:
+            self.out_time = seconds
+            self.last_advance = time.monotonic()
+
+    @property
+    def percent(self) -> Optional[int]:
+        if not self.duration:
+            return None
+        return max(0, min(99 if not self.finished else 100, int(self.out_time / self.duration * 100)))
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        if not self.duration or not self.speed:
+            return None
+        return max(0.0, (self.duration - self.out_time) / self.speed)
+
+    def stalled_for(self) -> float:
+        """Seconds since the output position last moved"""
+        return time.monotonic() - self.last_advance
+
+    def kill_stalled(self) -> bool:
+        """Kill the process for not making progress; True if there was one to kill"""
+        process = self._process
+        if process is None or self.finished:
+            return False
+        self.stalled = True
+        kill_process_group(process)
+        return True
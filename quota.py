@@ -0,0 +1,238 @@
+"""
+Write-behind ledger of daily conversion quotas
+
+Counting a conversion used to read converter_user_stats, add in Python and
+write it back: two round-trips per conversion, and concurrent conversions of
+one user overwrote each other's increments. The ledger keeps today's counts
+in memory, so quota checks cost nothing. Increments are merged into the table
+in batches and the counts are rebuilt from the table on startup.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from storage import FunctionNotFound
+from config import (
+    QUOTA_FLUSH_INTERVAL_SECONDS, QUOTA_REFRESH_INTERVAL_SECONDS, QUOTA_BATCH_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+_TABLE = 'converter_user_stats'
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class _Pending:
+    """Increments not yet written to the table"""
+
+    __slots__ = ('date', 'today', 'total', 'size')
+
+    def __init__(self, date: str):
+        self.date = date
+        self.today = 0   # conversions on `date`
+        self.total = 0   # conversions overall
+        self.size = 0    # bytes overall
+
+
+class QuotaLedger:
+    """Authoritative in-process conversions_today per user, flushed in batches"""
+
+    def __init__(self, store, flush_interval: float = QUOTA_FLUSH_INTERVAL_SECONDS,
+                 refresh_interval: float = QUOTA_REFRESH_INTERVAL_SECONDS):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.ready = False
+        self._date = _today()
+        self._counts: Dict[int, int] = {}        # user_id -> conversions today (table + pending)
+        self._pending: Dict[int, _Pending] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def roll_over(self) -> bool:
+        """Start a new day's counts if the UTC date changed (daily_rollover_job, refresh)"""
+        today = _today()
+        if today == self._date:
+            return False
+        self._date = today
+        self._counts.clear()
+        return True
+
+    # Hot path: no date math, the rollover job clears the counts at midnight
+    def conversions_today(self, user_id: int) -> int:
+        return self._counts.get(user_id, 0)
+
+    @property
+    def date(self) -> str:
+        """The UTC day the counts are for"""
+        return self._date
+
+    def _pending_for(self, user_id: int) -> _Pending:
+        pending = self._pending.get(user_id)
+        if pending is None:
+            pending = self._pending[user_id] = _Pending(self._date)
+        elif pending.date != self._date:
+            # Yesterday's daily count is moot; totals still carry over
+            pending.date = self._date
+            pending.today = 0
+        return pending
+
+    def record(self, user_id: int, file_size: int):
+        """Count a successful conversion; written to the table on the next flush"""
+        self._counts[user_id] = self._counts.get(user_id, 0) + 1
+        pending = self._pending_for(user_id)
+        pending.today += 1
+        pending.total += 1
+        pending.size += file_size or 0
+
+    def refund(self, user_id: int, date: str, file_size: int):
+        """Take back a conversion counted on `date` that did not happen (enqueue mode)"""
+        pending = self._pending_for(user_id)
+        if date == self._date:
+            self._counts[user_id] = max(0, self._counts.get(user_id, 0) - 1)
+            pending.today -= 1
+        pending.total -= 1
+        pending.size -= file_size or 0
+
+    # Table sync
+    async def _select_rows(self, filters: dict) -> List[dict]:
+        rows = []
+        while True:
+            page = await self.store.select(
+                _TABLE, filters=filters, order='user_id',
+                limit=QUOTA_BATCH_SIZE, offset=len(rows)
+            )
+            rows.extend(page)
+            if len(page) < QUOTA_BATCH_SIZE:
+                return rows
+
+    async def refresh(self) -> bool:
+        """Rebuild today's counts from the table (plus our unflushed increments)"""
+        async with self._flush_lock:
+            try:
+                rows = await self._select_rows({'last_conversion_date': _today()})
+            except Exception as e:
+                logger.error(f"Error loading quota ledger: {e}")
+                return False
+        self.roll_over()
+        counts = {row['user_id']: row.get('conversions_today') or 0 for row in rows}
+        for user_id, pending in self._pending.items():
+            if pending.date == self._date:
+                counts[user_id] = max(0, counts.get(user_id, 0) + pending.today)
+        self._counts = counts
+        if not self.ready:
+            logger.info(f"📒 Quota ledger loaded: {len(counts)} users active today")
+        self.ready = True
+        return True
+
+    async def flush(self):
+        """Merge pending increments into converter_user_stats (one RPC per batch)"""
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            user_ids = list(pending)
+            for i in range(0, len(user_ids), QUOTA_BATCH_SIZE):
+                batch = user_ids[i:i + QUOTA_BATCH_SIZE]
+                try:
+                    await self._flush_batch({user_id: pending[user_id] for user_id in batch})
+                except Exception as e:
+                    logger.error(f"Error flushing quota ledger ({len(batch)} users): {e}")
+                    self._restore({user_id: pending[user_id] for user_id in user_ids[i:]})
+                    raise
+
+    async def _flush_batch(self, batch: Dict[int, _Pending]):
+        try:
+            rows = await self.store.rpc('apply_user_stats_deltas', {'p_deltas': [
+                {'user_id': user_id, 'date': pending.date, 'today': pending.today,
+                 'total': pending.total, 'size': pending.size}
+                for user_id, pending in batch.items()
+            ]})
+        except FunctionNotFound:
+            await self._merge_batch(batch)
+            return
+        for row in rows or []:
+            user_id = row['user_id']
+            if batch[user_id].date == self._date:
+                self._counts[user_id] = max(self._counts.get(user_id, 0), row['conversions_today'])
+
+    async def _merge_batch(self, batch: Dict[int, _Pending]):
+        """Fallback without the migration: read the rows, add in Python, upsert"""
+        rows = await self.store.select(_TABLE, filters={'user_id': ('in', list(batch))})
+        current = {row['user_id']: row for row in rows}
+        updates = []
+        for user_id, pending in batch.items():
+            row = current.get(user_id, {})
+            today = pending.today
+            if str(row.get('last_conversion_date')) == pending.date:
+                today += row.get('conversions_today') or 0
+            today = max(0, today)
+            updates.append({
+                'user_id': user_id,
+                'conversions_today': today,
+                'total_conversions': max(0, (row.get('total_conversions') or 0) + pending.total),
+                'last_conversion_date': pending.date,
+                'total_files_size_bytes': max(0, (row.get('total_files_size_bytes') or 0) + pending.size),
+            })
+            if pending.date == self._date:
+                # Picks up conversions other processes wrote since our last refresh
+                self._counts[user_id] = max(self._counts.get(user_id, 0), today)
+        await self.store.upsert(_TABLE, updates, on_conflict='user_id')
+
+    def _restore(self, failed: Dict[int, _Pending]):
+        """Put increments from a failed flush back in front of newer ones"""
+        for user_id, pending in failed.items():
+            newer = self._pending.get(user_id)
+            if newer is not None:
+                if newer.date == pending.date:
+                    pending.today += newer.today
+                else:
+                    pending.date, pending.today = newer.date, newer.today
+                pending.total += newer.total
+                pending.size += newer.size
+            self._pending[user_id] = pending
+
+    # Lifecycle
+    async def start(self):
+        """Load today's counts and start the periodic flush"""
+        await self.refresh()
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop(), name='quota-flush')
+
+    async def stop(self):
+        """Stop flushing and write out what is pending"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pending:
+            try:
+                await self.flush()
+            except Exception:
+                logger.error(f"⚠️ {len(self._pending)} users' conversion counts were not saved")
+
+    async def _flush_loop(self):
+        since_refresh = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            since_refresh += self.flush_interval
+            try:
+                if self._pending:
+                    await self.flush()
+                if since_refresh >= self.refresh_interval or not self.ready:
+                    since_refresh = 0.0
+                    await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in quota ledger sync: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'ready': self.ready,
+            'users_today': len(self._counts),
+            'pending_users': len(self._pending),
+        }
@@ -0,0 +1,85 @@
+"""
+Reference data served from memory: subscription plans and tier limits
+
+Plans change maybe once a month, yet every plan button, payment proof and
+approval looked them up in subscription_plans. They are loaded at startup,
+re-read every REFERENCE_REFRESH_INTERVAL_SECONDS and on the admin /reload
+command, and every lookup in between is a dict access. Tier limits come
+from config.py. The force-subscription channel list is already a constant
+in subscribe.py.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from config import TIER_LIMITS, REFERENCE_REFRESH_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceData:
+    """Snapshot of subscription_plans (replaced whole on refresh) plus the tier limit tables"""
+
+    def __init__(self, store, refresh_interval: float = REFERENCE_REFRESH_INTERVAL_SECONDS):
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.tier_limits = TIER_LIMITS
+        self._plans: Dict[int, dict] = {}
+        self._active_plans: List[dict] = []
+        self.loaded_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    async def refresh(self) -> bool:
+        """Reload plans; on failure the previous snapshot stays in use"""
+        try:
+            rows = await self.store.select('subscription_plans', order='id')
+        except Exception as e:
+            logger.error(f"Error loading subscription plans: {e}")
+            return False
+        self._plans = {row['id']: row for row in rows}
+        self._active_plans = [row for row in rows if row.get('is_active')]
+        if not self.ready:
+            logger.info(f"📚 Reference data loaded: {len(rows)} subscription plans")
+        self.loaded_at = time.time()
+        return True
+
+    # Lookups
+    def plan(self, plan_id: int) -> Optional[dict]:
+        return self._plans.get(plan_id)
+
+    def active_plans(self) -> List[dict]:
+        return list(self._active_plans)
+
+    def limits(self, tier: str) -> dict:
+        return self.tier_limits.get(tier, self.tier_limits['free'])
+
+    # Lifecycle
+    async def start(self):
+        """Load the plans and keep them fresh"""
+        await self.refresh()
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop(), name='reference-refresh')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    def stats(self) -> dict:
+        return {
+            'plans': len(self._plans),
+            'active_plans': len(self._active_plans),
+            'age_seconds': round(time.time() - self.loaded_at) if self.loaded_at else None,
+        }
@@ -0,0 +1,213 @@
+"""
+Per-job resource limits for converter subprocesses
+"""
+
+import os
+import signal
+import logging
+import uuid
+from typing import Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from config import CGROUP_ROOT
+
+logger = logging.getLogger(__name__)
+
+# stderr markers that mean the process ran out of address space
+_MEMORY_ERROR_MARKERS = (
+    'Cannot allocate memory',
+    'std::bad_alloc',
+    'MemoryError',
+    'out of memory',
+)
+
+
+class ConversionAborted(Exception):
+    """Base for conversions stopped before they finished: limit breach, stall or user cancel"""
+
+
+class ResourceLimitExceeded(ConversionAborted):
+    """Raised when a conversion job breaches its CPU, memory or file-size limit"""
+
+    def __init__(self, limit: str, detail: str = ''):
+        self.limit = limit
+        self.detail = detail
+        super().__init__(f"{limit} limit exceeded" + (f": {detail}" if detail else ''))
+
+
+class ConversionCancelled(ConversionAborted):
+    """Raised when the user cancelled the job and its converter process group was killed"""
+
+    def __init__(self, detail: str = ''):
+        self.detail = detail
+        super().__init__("cancelled" + (f": {detail}" if detail else ''))
+
+
+def kill_process_group(process):
+    """SIGKILL a converter started with start_new_session=True and everything it spawned"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, AttributeError, OSError):
+        # Already gone, or no process groups (Windows)
+        try:
+            process.kill()
+        except (ProcessLookupError, OSError):
+            pass
+
+
+class JobLimits:
+    """Resource limits applied to a single conversion job"""
+
+    def __init__(self, max_memory_mb: int, max_cpu_seconds: int,
+                 max_output_mb: int, max_image_pixels: int):
+        self.max_memory_mb = max_memory_mb
+        self.max_cpu_seconds = max_cpu_seconds
+        self.max_output_mb = max_output_mb
+        self.max_image_pixels = max_image_pixels
+        self.cgroup_path: Optional[str] = None
+        self.cancelled = False
+        self._processes = set()
+
+    @classmethod
+    def from_tier(cls, tier_limits: dict) -> 'JobLimits':
+        """Build job limits from FREE_TIER_LIMITS / PREMIUM_TIER_LIMITS"""
+        return cls(
+            max_memory_mb=tier_limits['max_memory_mb'],
+            max_cpu_seconds=tier_limits['max_cpu_seconds'],
+            max_output_mb=tier_limits['max_output_mb'],
+            max_image_pixels=tier_limits['max_image_pixels'],
+        )
+
+    # Cancellation
+    def attach(self, process):
+        """Confine a just-started converter process and track it so cancel() can kill it"""
+        self._processes.add(process)
+        if self.cancelled:
+            kill_process_group(process)
+            return
+        self.confine(process.pid)
+
+    def detach(self, process):
+        self._processes.discard(process)
+
+    def cancel(self):
+        """Kill the job's converter processes; later ones are killed on attach"""
+        self.cancelled = True
+        for process in list(self._processes):
+            kill_process_group(process)
+
+    # cgroup v2
+    def open_cgroup(self) -> Optional[str]:
+        """Create a private cgroup v2 slice for the job if a delegated root is configured"""
+        if not CGROUP_ROOT or not os.path.isfile(os.path.join(CGROUP_ROOT, 'cgroup.procs')):
+            return None
+        try:
+            path = os.path.join(CGROUP_ROOT, f'job-{uuid.uuid4().hex[:12]}')
+            os.mkdir(path)
+            with open(os.path.join(path, 'memory.max'), 'w') as f:
+                f.write(str(self.max_memory_mb * 1024 * 1024))
+            with open(os.path.join(path, 'memory.swap.max'), 'w') as f:
+                f.write('0')
+            self.cgroup_path = path
+            return path
+        except OSError as e:
+            logger.warning(f"⚠️ cgroup v2 slice unavailable, using rlimits only: {e}")
+            self.cgroup_path = None
+            return None
+
+    def close_cgroup(self) -> Tuple[bool, Optional[float]]:
+        """Remove the job's cgroup; returns (OOM-killed per memory.events, CPU seconds per cpu.stat)
+
+        (False, None) when the job ran without a cgroup.
+        """
+        path, self.cgroup_path = self.cgroup_path, None
+        if not path:
+            return False, None
+        oom_killed = False
+        cpu_seconds = None
+        try:
+            with open(os.path.join(path, 'memory.events')) as f:
+                for line in f:
+                    key, _, value = line.partition(' ')
+                    if key == 'oom_kill' and int(value) > 0:
+                        oom_killed = True
+            with open(os.path.join(path, 'cpu.stat')) as f:
+                for line in f:
+                    key, _, value = line.partition(' ')
+                    if key == 'usage_usec':
+                        cpu_seconds = int(value) / 1_000_000
+            os.rmdir(path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not remove cgroup {path}: {e}")
+        return oom_killed, cpu_seconds
+
+    def confine(self, pid: int):
+        """Apply the limits to a running converter from the parent process
+
+        Converters are started from executor threads, where a preexec_fn can
+        deadlock the forked child before exec, so nothing runs in the child.
+        The process is moved into the job cgroup (or gets RLIMIT_AS) right
+        after spawn; anything it forks from then on inherits the limits.
+        """
+        confined = False
+        if self.cgroup_path:
+            try:
+                with open(os.path.join(self.cgroup_path, 'cgroup.procs'), 'w') as f:
+                    f.write(str(pid))
+                confined = True
+            except OSError as e:
+                logger.warning(f"⚠️ Could not move converter {pid} into {self.cgroup_path}: {e}")
+        if resource is None or not hasattr(resource, 'prlimit'):
+            return
+        memory_bytes = self.max_memory_mb * 1024 * 1024
+        output_bytes = self.max_output_mb * 1024 * 1024
+        try:
+            if not confined:
+                resource.prlimit(pid, resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+            # SIGXCPU at the soft limit, SIGKILL a few seconds later
+            resource.prlimit(pid, resource.RLIMIT_CPU, (self.max_cpu_seconds, self.max_cpu_seconds + 5))
+            resource.prlimit(pid, resource.RLIMIT_FSIZE, (output_bytes, output_bytes))
+        except ProcessLookupError:
+            pass  # already exited
+        except OSError as e:
+            logger.warning(f"⚠️ Could not set rlimits on converter {pid}: {e}")
+
+    def check_result(self, returncode: int, stderr: bytes = b'', oom_killed: bool = False,
+                     cpu_seconds: Optional[float] = None):
+        """Raise ResourceLimitExceeded if the finished process breached a limit
+
+        oom_killed and cpu_seconds come from the job cgroup (close_cgroup). A
+        SIGKILL is only blamed on a limit when they confirm it; otherwise it is
+        left to the caller as an ordinary failed conversion.
+        """
+        if oom_killed:
+            raise ResourceLimitExceeded('memory', f'cgroup OOM at {self.max_memory_mb} MB')
+        if returncode is None or returncode == 0:
+            return
+        if returncode < 0:
+            sig = -returncode
+            if sig == getattr(signal, 'SIGXCPU', -1):
+                raise ResourceLimitExceeded('cpu', f'{self.max_cpu_seconds}s CPU time')
+            if sig == getattr(signal, 'SIGKILL', -1):
+                if cpu_seconds is not None and cpu_seconds >= self.max_cpu_seconds:
+                    raise ResourceLimitExceeded('cpu', f'{self.max_cpu_seconds}s CPU time')
+                logger.warning("⚠️ Converter killed by SIGKILL with no limit breach recorded")
+                return
+            if sig == getattr(signal, 'SIGXFSZ', -1):
+                raise ResourceLimitExceeded('file_size', f'{self.max_output_mb} MB output')
+        err = stderr.decode(errors='ignore') if isinstance(stderr, bytes) else (stderr or '')
+        if 'File too large' in err:
+            raise ResourceLimitExceeded('file_size', f'{self.max_output_mb} MB output')
+        if any(marker in err for marker in _MEMORY_ERROR_MARKERS):
+            raise ResourceLimitExceeded('memory', f'{self.max_memory_mb} MB address space')
+
+    def check_image(self, width: int, height: int):
+        """Reject images whose decoded size would exceed the pixel budget"""
+        if width * height > self.max_image_pixels:
+            raise ResourceLimitExceeded(
+                'memory', f'{width}x{height} image exceeds {self.max_image_pixels} pixels'
+            )
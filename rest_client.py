@@ -0,0 +1,182 @@
+"""
+Async PostgREST client for the Supabase tables
+
+The supabase-py client used so far is synchronous: every `.execute()` blocked
+the event loop for a full round-trip. This client talks to the same REST
+endpoint over one pooled, keep-alive httpx connection set (HTTP/2 when the
+`h2` package is installed) with per-call timeouts and a cap on requests in
+flight.
+"""
+
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List, Union
+
+import httpx
+
+from storage import StorageBackend, FunctionNotFound, Filters
+from config import (
+    DB_MAX_CONCURRENT_REQUESTS, DB_MAX_CONNECTIONS, DB_KEEPALIVE_SECONDS,
+    DB_TIMEOUT_SECONDS, DB_CONNECT_TIMEOUT_SECONDS,
+)
+
+try:
+    import h2  # noqa: F401  (enables httpx's HTTP/2 support)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def _filter_value(value) -> str:
+    if isinstance(value, tuple):
+        op, operand = value
+        if op == 'in':
+            return f"in.({','.join(str(v) for v in operand)})"
+        return f"{op}.{_plain(operand)}"
+    if value is None:
+        return 'is.null'
+    return f"eq.{_plain(value)}"
+
+
+def _plain(value) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value is None:
+        return 'null'
+    return str(value)
+
+
+class AsyncRestClient(StorageBackend):
+    """Minimal select / insert / update / upsert / rpc over Supabase's REST API"""
+
+    def __init__(self, url: str, key: str,
+                 max_concurrent: int = DB_MAX_CONCURRENT_REQUESTS,
+                 timeout: float = DB_TIMEOUT_SECONDS):
+        self.base_url = f"{(url or '').rstrip('/')}/rest/v1"
+        self.key = key
+        self.timeout = timeout
+        self._max_concurrent = max_concurrent
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._missing_functions = set()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Created on first use so it binds to the running event loop"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=HTTP2_AVAILABLE,
+                headers={
+                    'apikey': self.key or '',
+                    'Authorization': f"Bearer {self.key or ''}",
+                    'Content-Type': 'application/json',
+                },
+                timeout=httpx.Timeout(self.timeout, connect=DB_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=DB_MAX_CONNECTIONS,
+                    max_keepalive_connections=DB_MAX_CONNECTIONS,
+                    keepalive_expiry=DB_KEEPALIVE_SECONDS,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self._max_concurrent)
+        return self._client
+
+    async def _request(self, method: str, path: str, params: Optional[dict] = None,
+                       json=None, prefer: Optional[str] = None,
+                       timeout: Optional[float] = None):
+        """Send one request; raises httpx.HTTPError on transport errors and 4xx/5xx"""
+        client = self._get_client()
+        headers = {'Prefer': prefer} if prefer else None
+        async with self._semaphore:
+            response = await client.request(
+                method, path, params=params, json=json, headers=headers,
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+            )
+        response.raise_for_status()
+        if not response.content:
+            return None
+        return response.json()
+
+    @staticmethod
+    def _params(filters: Optional[Filters]) -> dict:
+        return {column: _filter_value(value) for column, value in (filters or {}).items()}
+
+    async def select(self, table: str, columns: str = '*', filters: Optional[Filters] = None,
+                     order: Optional[str] = None, limit: Optional[int] = None,
+                     offset: Optional[int] = None,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Rows of table matching filters; order is 'column' or 'column.desc'"""
+        params = self._params(filters)
+        params['select'] = columns
+        if order:
+            params['order'] = order
+        if limit is not None:
+            params['limit'] = limit
+        if offset:
+            params['offset'] = offset
+        return await self._request('GET', f'/{table}', params=params, timeout=timeout) or []
+
+    async def count(self, table: str, filters: Optional[Filters] = None,
+                    timeout: Optional[float] = None) -> int:
+        """Exact number of rows matching filters, without fetching them"""
+        client = self._get_client()
+        async with self._semaphore:
+            response = await client.head(
+                f'/{table}', params=self._params(filters), headers={'Prefer': 'count=exact'},
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+            )
+        response.raise_for_status()
+        # Content-Range: 0-24/3573 (or */0 when empty)
+        total = response.headers.get('content-range', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else 0
+
+    async def insert(self, table: str, data: Union[dict, List[dict]],
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Insert one row or a batch; returns the inserted rows"""
+        return await self._request(
+            'POST', f'/{table}', json=data, prefer='return=representation', timeout=timeout
+        ) or []
+
+    async def update(self, table: str, data: dict, filters: Filters,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Update the rows matching filters; returns the updated rows"""
+        return await self._request(
+            'PATCH', f'/{table}', params=self._params(filters), json=data,
+            prefer='return=representation', timeout=timeout
+        ) or []
+
+    async def upsert(self, table: str, data: Union[dict, List[dict]],
+                     on_conflict: Optional[str] = None,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Insert rows, merging into existing ones on the on_conflict columns"""
+        params = {'on_conflict': on_conflict} if on_conflict else None
+        return await self._request(
+            'POST', f'/{table}', params=params, json=data,
+            prefer='resolution=merge-duplicates,return=representation', timeout=timeout
+        ) or []
+
+    async def rpc(self, function: str, params: Optional[dict] = None,
+                  timeout: Optional[float] = None):
+        """Call a Postgres function exposed by PostgREST
+
+        Raises FunctionNotFound if it does not exist, remembering that so the
+        caller's fallback path is taken without a round-trip from then on.
+        """
+        if function in self._missing_functions:
+            raise FunctionNotFound(function)
+        try:
+            return await self._request('POST', f'/rpc/{function}', json=params or {}, timeout=timeout)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                raise
+            self._missing_functions.add(function)
+            logger.warning(f"⚠️ Database function {function} not found, using the multi-request fallback (see migrations/)")
+            raise FunctionNotFound(function) from e
+
+    async def close(self):
+        """Close pooled connections (call on shutdown)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,165 @@
+"""
+Weighted fair scheduling of conversion jobs between users
+"""
+
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import Optional, Callable
+
+from config import SCHEDULER_MAX_SLOTS_PER_USER
+
+logger = logging.getLogger(__name__)
+
+
+class FairScheduler:
+    """Per-user fair queuing with tier weights and a cap on worker slots per user
+
+    Every user has a private FIFO. Each queued job gets a virtual finish tag
+    of max(virtual_time, user's last tag) + 1 / weight, and the job with the
+    lowest tag among users below their slot cap ('max_concurrent_jobs' of
+    their tier) is dispatched next. A user with weight 4 is served four times
+    as often as a user with weight 1 while both have work queued, but nobody
+    is starved, and a user who was idle does not bank credit for later.
+    """
+
+    def __init__(self, max_slots_per_user: int = SCHEDULER_MAX_SLOTS_PER_USER):
+        self.max_slots_per_user = max_slots_per_user
+        self.virtual_time = 0.0
+        self._queues = {}      # user_id -> deque of (finish_tag, seq, start_tag, job)
+        self._last_tag = {}    # user_id -> finish tag of the user's newest job
+        self._in_flight = {}   # user_id -> dispatched jobs not yet released
+        self._dispatched = set()
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+        # Optional predicate; a user whose next job it holds is skipped for now
+        self.hold: Optional[Callable] = None
+
+    def push(self, job):
+        """Queue a job under its user"""
+        weight = max(float(job.tier_limits.get('scheduler_weight', 1)), 0.01)
+        start = max(self.virtual_time, self._last_tag.get(job.user_id, 0.0))
+        finish = start + 1.0 / weight
+        self._last_tag[job.user_id] = finish
+        self._queues.setdefault(job.user_id, deque()).append((finish, next(self._seq), start, job))
+        self._changed.set()
+
+    async def get(self):
+        """Wait for and return the next job to run"""
+        while True:
+            job = self._pop_next()
+            if job is not None:
+                return job
+            self._changed.clear()
+            await self._changed.wait()
+
+    def release(self, job):
+        """Free the worker slot a dispatched job was holding (no-op for other jobs)"""
+        if job not in self._dispatched:
+            return
+        self._dispatched.discard(job)
+        count = self._in_flight.get(job.user_id, 0) - 1
+        if count > 0:
+            self._in_flight[job.user_id] = count
+        else:
+            self._in_flight.pop(job.user_id, None)
+            if job.user_id not in self._queues:
+                self._last_tag.pop(job.user_id, None)
+        self._changed.set()
+
+    def remove(self, job) -> bool:
+        """Drop a job that has not been dispatched yet; False if it is not queued"""
+        queue = self._queues.get(job.user_id)
+        if not queue:
+            return False
+        for entry in queue:
+            if entry[3] is job:
+                queue.remove(entry)
+                break
+        else:
+            return False
+        if not queue:
+            del self._queues[job.user_id]
+            if job.user_id not in self._in_flight:
+                self._last_tag.pop(job.user_id, None)
+        self._changed.set()
+        return True
+
+    def wake(self):
+        """Re-evaluate dispatch after an external condition (e.g. hold) changed"""
+        self._changed.set()
+
+    def _slot_cap(self, job) -> int:
+        return job.tier_limits.get('max_concurrent_jobs', self.max_slots_per_user)
+
+    def _pop_next(self) -> Optional[object]:
+        best_user = None
+        best_key = None
+        for user_id, queue in self._queues.items():
+            head = queue[0][3]
+            if self._in_flight.get(user_id, 0) >= self._slot_cap(head):
+                continue
+            if self.hold is not None and self.hold(head):
+                continue
+            key = queue[0][:2]
+            if best_key is None or key < best_key:
+                best_user, best_key = user_id, key
+
+        if best_user is None:
+            return None
+
+        queue = self._queues[best_user]
+        _, _, start, job = queue.popleft()
+        if not queue:
+            del self._queues[best_user]
+        self.virtual_time = max(self.virtual_time, start)
+        self._in_flight[best_user] = self._in_flight.get(best_user, 0) + 1
+        self._dispatched.add(job)
+        return job
+
+    def pending(self, user_id: int) -> int:
+        """Jobs a user has queued or running"""
+        return len(self._queues.get(user_id, ())) + self._in_flight.get(user_id, 0)
+
+    def ordered(self) -> list:
+        """Queued jobs in expected dispatch order"""
+        entries = [entry for queue in self._queues.values() for entry in queue]
+        entries.sort(key=lambda entry: entry[:2])
+        return [entry[3] for entry in entries]
+
+    def take_queued(self) -> list:
+        """Remove and return every job that has not been dispatched yet"""
+        jobs = self.ordered()
+        self._queues.clear()
+        for user_id in list(self._last_tag):
+            if user_id not in self._in_flight:
+                del self._last_tag[user_id]
+        return jobs
+
+    def take_running(self) -> list:
+        """Forget and return all dispatched jobs (used when workers are torn down)"""
+        jobs = list(self._dispatched)
+        self._dispatched.clear()
+        self._in_flight.clear()
+        return jobs
+
+    def running_jobs(self) -> list:
+        """Dispatched jobs not yet released"""
+        return list(self._dispatched)
+
+    def running(self) -> int:
+        """Dispatched jobs not yet released"""
+        return len(self._dispatched)
+
+    def qsize(self) -> int:
+        """Jobs waiting to be dispatched"""
+        return sum(len(q) for q in self._queues.values())
+
+    def stats(self) -> dict:
+        """Queued and running jobs per user"""
+        return {
+            'queued': {user_id: len(q) for user_id, q in self._queues.items()},
+            'in_flight': dict(self._in_flight),
+            'virtual_time': self.virtual_time,
+        }
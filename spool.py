@@ -0,0 +1,249 @@
+"""
+Durable write-behind spool for file_conversions rows
+
+log_conversion appends the row to a local SQLite (WAL) file and returns at
+once; a background task bulk-inserts spooled rows into Supabase when enough
+have gathered or the flush interval has passed, backing off while the
+database is unavailable. Rows are deleted only after the insert succeeded,
+so nothing is lost across restarts (a crash between the insert and the
+delete can log a row twice).
+
+Several processes (bot and workers) may share the file: each flush leases
+its batch so two processes never insert the same rows concurrently.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import threading
+import logging
+from typing import Optional, List, Tuple
+
+import httpx
+
+from storage import RowRejected
+from config import (
+    SPOOL_PATH, SPOOL_BATCH_SIZE, SPOOL_FLUSH_INTERVAL_SECONDS,
+    SPOOL_RETRY_BASE_SECONDS, SPOOL_RETRY_MAX_SECONDS, SPOOL_LEASE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_until REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_events_claim ON events (claimed_until, id);
+"""
+
+
+def _rejected(error: Exception) -> bool:
+    """A constraint violation or a 4xx other than timeout / rate limit: retrying will not help"""
+    if isinstance(error, RowRejected):
+        return True
+    status = error.response.status_code
+    return 400 <= status < 500 and status not in (408, 429)
+
+
+def _reason(error: Exception) -> str:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.text[:200]
+    return str(error)
+
+
+class WriteSpool:
+    """Append-only local queue of rows bound for a Supabase table, flushed in bulk"""
+
+    def __init__(self, store, path: str = SPOOL_PATH, table: str = 'file_conversions',
+                 batch_size: int = SPOOL_BATCH_SIZE,
+                 flush_interval: float = SPOOL_FLUSH_INTERVAL_SECONDS):
+        self.store = store
+        self.path = path
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._appended = 0
+        self._failures = 0
+        self.flushed = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def append(self, row: dict) -> bool:
+        """Persist one row for insertion; returns False only if the local write failed"""
+        try:
+            with self._lock:
+                self._connect().execute(
+                    "INSERT INTO events (target, payload, created_at) VALUES (?, ?, ?)",
+                    (self.table, json.dumps(row, default=str), time.time())
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error spooling {self.table} row: {e}")
+            return False
+        self._appended += 1
+        # Size trigger; while backing off only the timer retries
+        if self._wake is not None and self._appended >= self.batch_size and not self._failures:
+            self._wake.set()
+        return True
+
+    def _claim(self, limit: int) -> List[Tuple[int, dict]]:
+        """Lease the oldest unclaimed rows to this process"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                rows = conn.execute(
+                    "SELECT id, payload FROM events WHERE target = ? AND claimed_until < ? ORDER BY id LIMIT ?",
+                    (self.table, now, limit)
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE events SET claimed_by = ?, claimed_until = ? WHERE id = ?",
+                    [(self.owner, now + SPOOL_LEASE_SECONDS, row[0]) for row in rows]
+                )
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def _settle(self, ids: List[int], delivered: bool):
+        """Delete inserted rows, or give failed ones back for the next attempt"""
+        with self._lock:
+            conn = self._connect()
+            if delivered:
+                conn.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in ids])
+            else:
+                conn.executemany(
+                    "UPDATE events SET claimed_until = 0, attempts = attempts + 1 WHERE id = ?",
+                    [(i,) for i in ids]
+                )
+
+    def pending(self) -> int:
+        try:
+            with self._lock:
+                return self._connect().execute(
+                    "SELECT COUNT(*) FROM events WHERE target = ?", (self.table,)
+                ).fetchone()[0]
+        except sqlite3.Error:
+            return -1
+
+    async def flush(self) -> int:
+        """Insert every spooled row in batches; returns rows inserted, raises on failure"""
+        self._appended = 0
+        total = 0
+        while True:
+            # SQLite work (BEGIN IMMEDIATE may wait on other processes) stays off the event loop
+            batch = await asyncio.to_thread(self._claim, self.batch_size)
+            if not batch:
+                return total
+            ids = [event_id for event_id, _ in batch]
+            try:
+                await self.store.insert(self.table, [row for _, row in batch])
+            except (httpx.HTTPStatusError, RowRejected) as e:
+                if not _rejected(e):
+                    await asyncio.to_thread(self._settle, ids, False)
+                    raise
+                # The database refused the batch: find the rows it refuses on their own
+                await self._insert_one_by_one(batch)
+            except Exception:
+                await asyncio.to_thread(self._settle, ids, False)
+                raise
+            else:
+                await asyncio.to_thread(self._settle, ids, True)
+            total += len(batch)
+            self.flushed += len(batch)
+            if len(batch) < self.batch_size:
+                return total
+
+    async def _insert_one_by_one(self, batch: List[Tuple[int, dict]]):
+        """Insert rows singly, dropping those the database rejects outright"""
+        for event_id, row in batch:
+            try:
+                await self.store.insert(self.table, row)
+            except (httpx.HTTPStatusError, RowRejected) as e:
+                if not _rejected(e):
+                    await asyncio.to_thread(self._settle, [event_id], False)
+                    raise
+                logger.error(f"❌ Dropping {self.table} row rejected by the database: {row} - {_reason(e)}")
+            except Exception:
+                await asyncio.to_thread(self._settle, [event_id], False)
+                raise
+            await asyncio.to_thread(self._settle, [event_id], True)
+
+    # Lifecycle
+    def start(self):
+        """Start the background flusher (call from the running event loop)"""
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop(), name=f'spool-{self.table}')
+            waiting = self.pending()
+            if waiting > 0:
+                logger.info(f"📮 {waiting} spooled {self.table} rows from a previous run will be flushed")
+                self._wake.set()
+
+    async def stop(self):
+        """Stop the flusher after one last attempt; unflushed rows stay on disk"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"⚠️ {self.pending()} {self.table} rows left in the spool: {e}")
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    async def _flush_loop(self):
+        delay = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                flushed = await self.flush()
+                if flushed:
+                    logger.info(f"📮 Flushed {flushed} {self.table} rows")
+                self._failures = 0
+                delay = self.flush_interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failures += 1
+                delay = min(SPOOL_RETRY_BASE_SECONDS * 2 ** (self._failures - 1), SPOOL_RETRY_MAX_SECONDS)
+                logger.warning(f"⚠️ Could not flush {self.table} rows (attempt {self._failures}), retrying in {delay}s: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'pending': self.pending(),
+            'flushed': self.flushed,
+            'failures': self._failures,
+        }
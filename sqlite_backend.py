@@ -0,0 +1,417 @@
+"""
+Embedded SQLite storage backend for single-node deployments
+
+Same tables and operations as the Supabase backend, kept in one local file:
+no network round-trip per query. The file runs in WAL mode so the bot and
+worker processes can share it, and queries run on a dedicated thread so the
+event loop never waits on the disk. Statement texts depend only on the
+table, the columns and the filter shape (IN lists are passed as one JSON
+parameter), so sqlite3's per-connection statement cache keeps every query
+prepared after its first use.
+"""
+
+import os
+import json
+import asyncio
+import sqlite3
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Union, Iterable, Tuple
+
+from storage import StorageBackend, FunctionNotFound, RowRejected, Filters
+from config import SQLITE_DB_PATH, SQLITE_STATEMENT_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+_NOW = "(strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))"
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS converter_users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    language_code TEXT DEFAULT 'en',
+    subscription_tier TEXT NOT NULL DEFAULT 'free',
+    subscription_expires_at TEXT,
+    created_at TEXT NOT NULL DEFAULT {_NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_users_created ON converter_users (created_at);
+CREATE INDEX IF NOT EXISTS idx_users_tier ON converter_users (subscription_tier, subscription_expires_at);
+CREATE INDEX IF NOT EXISTS idx_users_language ON converter_users (language_code);
+
+CREATE TABLE IF NOT EXISTS converter_user_stats (
+    user_id INTEGER PRIMARY KEY,
+    conversions_today INTEGER NOT NULL DEFAULT 0,
+    total_conversions INTEGER NOT NULL DEFAULT 0,
+    last_conversion_date TEXT,
+    total_files_size_bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_user_stats_date ON converter_user_stats (last_conversion_date);
+
+CREATE TABLE IF NOT EXISTS file_conversions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    original_filename TEXT,
+    original_format TEXT,
+    target_format TEXT,
+    file_size_bytes INTEGER,
+    conversion_status TEXT NOT NULL DEFAULT 'success',
+    error_message TEXT,
+    processing_time_seconds REAL,
+    created_at TEXT NOT NULL DEFAULT {_NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_conversions_created ON file_conversions (created_at);
+CREATE INDEX IF NOT EXISTS idx_conversions_status ON file_conversions (conversion_status);
+CREATE INDEX IF NOT EXISTS idx_conversions_user ON file_conversions (user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS subscription_plans (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    price REAL NOT NULL,
+    duration_days INTEGER NOT NULL,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL DEFAULT {_NOW}
+);
+
+CREATE TABLE IF NOT EXISTS converter_payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    plan_id INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    payment_proof_file_id TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    admin_notes TEXT,
+    processed_at TEXT,
+    processed_by INTEGER,
+    created_at TEXT NOT NULL DEFAULT {_NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_payments_status ON converter_payments (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_payments_created ON converter_payments (created_at);
+CREATE INDEX IF NOT EXISTS idx_payments_user ON converter_payments (user_id);
+
+-- The plans listed in the readme; edit the rows to change prices
+INSERT OR IGNORE INTO subscription_plans (id, name, price, duration_days) VALUES
+    (1, 'Monthly', 10000, 30),
+    (2, 'Quarterly', 25000, 90),
+    (3, 'Yearly', 80000, 365);
+"""
+
+_TABLES = (
+    'converter_users', 'converter_user_stats', 'file_conversions',
+    'subscription_plans', 'converter_payments',
+)
+
+_OPERATORS = {'eq': '=', 'neq': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+_BY_ROWID = "rowid IN (SELECT value FROM json_each(?))"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _param(value):
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+class SQLiteBackend(StorageBackend):
+    """StorageBackend on a local SQLite file, one connection on one thread"""
+
+    def __init__(self, path: str = SQLITE_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None,
+            cached_statements=SQLITE_STATEMENT_CACHE_SIZE,
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(_SCHEMA)
+        self._columns = {}
+        self._primary_keys = {}
+        for table in _TABLES:
+            info = self._conn.execute(f"PRAGMA table_info({table})").fetchall()
+            self._columns[table] = {row['name'] for row in info}
+            self._primary_keys[table] = [row['name'] for row in info if row['pk']]
+        self._functions = {
+            'create_converter_user': self._create_converter_user,
+            'extend_premium': self._extend_premium,
+            'approve_converter_payment': self._approve_converter_payment,
+            'apply_user_stats_deltas': self._apply_user_stats_deltas,
+        }
+        # One thread: SQLite serializes writers anyway, and point lookups take microseconds
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-db')
+        logger.info(f"🗄️ SQLite storage backend at {path}")
+
+    # Execution
+    def _call(self, fn, *args):
+        """Run fn(conn, *args) holding the connection; constraint violations become RowRejected"""
+        with self._lock:
+            try:
+                return fn(self._conn, *args)
+            except sqlite3.IntegrityError as e:
+                raise RowRejected(str(e)) from e
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, *args)
+
+    def _transaction(self, fn):
+        """Wrap fn(conn, ...) in BEGIN IMMEDIATE / COMMIT"""
+        def run(conn, *args):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn, *args)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        return run
+
+    # SQL building
+    def _check(self, table: str, columns: Iterable[str]):
+        """Table and column names go into SQL text, so only known ones pass"""
+        known = self._columns.get(table)
+        if known is None:
+            raise ValueError(f"Unknown table {table}")
+        for column in columns:
+            if column not in known:
+                raise ValueError(f"Unknown column {table}.{column}")
+
+    def _check_row(self, table: str, columns: Iterable[str]):
+        """Like PostgREST, refuse rows carrying columns the table does not have"""
+        try:
+            self._check(table, columns)
+        except ValueError as e:
+            raise RowRejected(str(e)) from e
+
+    def _column_list(self, table: str, columns: str) -> str:
+        if columns.strip() == '*':
+            return '*'
+        names = [name.strip() for name in columns.split(',')]
+        self._check(table, names)
+        return ', '.join(names)
+
+    def _where(self, table: str, filters: Iterable[Tuple[str, Any]]) -> Tuple[str, list]:
+        clauses, params = [], []
+        for column, value in filters:
+            self._check(table, [column])
+            if value is None:
+                clauses.append(f"{column} IS NULL")
+            elif isinstance(value, tuple) and value[0] == 'in':
+                clauses.append(f"{column} IN (SELECT value FROM json_each(?))")
+                params.append(json.dumps([_param(v) for v in value[1]]))
+            elif isinstance(value, tuple):
+                clauses.append(f"{column} {_OPERATORS[value[0]]} ?")
+                params.append(_param(value[1]))
+            else:
+                clauses.append(f"{column} = ?")
+                params.append(_param(value))
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def _rows_by_id(self, conn, table: str, rowids: List[int]) -> List[Dict[str, Any]]:
+        cursor = conn.execute(f"SELECT * FROM {table} WHERE {_BY_ROWID} ORDER BY rowid", (json.dumps(rowids),))
+        return [dict(row) for row in cursor]
+
+    # Operations (run on the database thread)
+    def _select(self, conn, table, columns, filters, order, limit, offset):
+        where, params = self._where(table, filters)
+        sql = f"SELECT {self._column_list(table, columns)} FROM {table}{where}"
+        if order:
+            column, _, direction = order.partition('.')
+            self._check(table, [column])
+            sql += f" ORDER BY {column} {'DESC' if direction == 'desc' else 'ASC'}"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit if limit is not None else -1, offset or 0]
+        return [dict(row) for row in conn.execute(sql, params)]
+
+    def _count(self, conn, table, filters):
+        where, params = self._where(table, filters)
+        return conn.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+
+    def _insert(self, conn, table, rows):
+        rowids = []
+        for row in rows:
+            columns = sorted(row)
+            self._check_row(table, columns)
+            cursor = conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [_param(row[column]) for column in columns]
+            )
+            rowids.append(cursor.lastrowid)
+        return self._rows_by_id(conn, table, rowids)
+
+    def _update(self, conn, table, data, filters):
+        where, params = self._where(table, filters)
+        rowids = [row[0] for row in conn.execute(f"SELECT rowid FROM {table}{where}", params)]
+        if not rowids:
+            return []
+        columns = sorted(data)
+        self._check_row(table, columns)
+        conn.execute(
+            f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE {_BY_ROWID}",
+            [_param(data[column]) for column in columns] + [json.dumps(rowids)]
+        )
+        return self._rows_by_id(conn, table, rowids)
+
+    def _upsert(self, conn, table, rows, on_conflict):
+        target = [c.strip() for c in on_conflict.split(',')] if on_conflict else self._primary_keys[table]
+        self._check(table, target)
+        rowids = []
+        for row in rows:
+            columns = sorted(row)
+            self._check_row(table, columns)
+            updates = [column for column in columns if column not in target]
+            action = (
+                'DO UPDATE SET ' + ', '.join(f'{column} = excluded.{column}' for column in updates)
+                if updates else 'DO NOTHING'
+            )
+            conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT ({', '.join(target)}) {action}",
+                [_param(row[column]) for column in columns]
+            )
+            key = conn.execute(
+                f"SELECT rowid FROM {table} WHERE {' AND '.join(f'{column} = ?' for column in target)}",
+                [_param(row[column]) for column in target]
+            ).fetchone()
+            if key is not None:
+                rowids.append(key[0])
+        return self._rows_by_id(conn, table, rowids)
+
+    # StorageBackend
+    async def select(self, table: str, columns: str = '*', filters: Optional[Filters] = None,
+                     order: Optional[str] = None, limit: Optional[int] = None,
+                     offset: Optional[int] = None,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        return await self._run(self._select, table, columns, list((filters or {}).items()), order, limit, offset)
+
+    async def count(self, table: str, filters: Optional[Filters] = None,
+                    timeout: Optional[float] = None) -> int:
+        return await self._run(self._count, table, list((filters or {}).items()))
+
+    async def insert(self, table: str, data: Union[dict, List[dict]],
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        rows = data if isinstance(data, list) else [data]
+        return await self._run(self._transaction(self._insert), table, rows)
+
+    async def update(self, table: str, data: dict, filters: Filters,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        return await self._run(self._transaction(self._update), table, data, list(filters.items()))
+
+    async def upsert(self, table: str, data: Union[dict, List[dict]],
+                     on_conflict: Optional[str] = None,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        rows = data if isinstance(data, list) else [data]
+        return await self._run(self._transaction(self._upsert), table, rows, on_conflict)
+
+    async def rpc(self, function: str, params: Optional[dict] = None,
+                  timeout: Optional[float] = None):
+        """The migrations/001 functions, each in one transaction"""
+        implementation = self._functions.get(function)
+        if implementation is None:
+            raise FunctionNotFound(function)
+        return await self._run(self._transaction(implementation), params or {})
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=False)
+
+    def _close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Functions (see migrations/001_rpc_functions.sql)
+    def _create_converter_user(self, conn, params):
+        conn.execute(
+            "INSERT OR IGNORE INTO converter_users "
+            "(user_id, username, first_name, last_name, language_code, subscription_tier) "
+            "VALUES (?, ?, ?, ?, ?, 'free')",
+            (params['p_user_id'], params.get('p_username'), params.get('p_first_name'),
+             params.get('p_last_name'), params.get('p_language_code', 'en'))
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO converter_user_stats "
+            "(user_id, conversions_today, total_conversions, total_files_size_bytes) VALUES (?, 0, 0, 0)",
+            (params['p_user_id'],)
+        )
+        cursor = conn.execute("SELECT * FROM converter_users WHERE user_id = ?", (params['p_user_id'],))
+        return [dict(row) for row in cursor]
+
+    def _extend_premium(self, conn, params):
+        row = conn.execute(
+            "SELECT subscription_expires_at FROM converter_users WHERE user_id = ?", (params['p_user_id'],)
+        ).fetchone()
+        if row is None:
+            return None
+        now = datetime.now(timezone.utc)
+        start = now
+        if row[0]:
+            current = datetime.fromisoformat(str(row[0]).replace('Z', '+00:00'))
+            if current > now:
+                start = current
+        expires = (start + timedelta(days=params['p_days'])).isoformat()
+        conn.execute(
+            "UPDATE converter_users SET subscription_tier = 'premium', subscription_expires_at = ? "
+            "WHERE user_id = ?",
+            (expires, params['p_user_id'])
+        )
+        return expires
+
+    def _approve_converter_payment(self, conn, params):
+        payment = conn.execute(
+            "SELECT user_id, plan_id FROM converter_payments WHERE id = ?", (params['p_payment_id'],)
+        ).fetchone()
+        if payment is None:
+            return None
+        plan = conn.execute(
+            "SELECT duration_days FROM subscription_plans WHERE id = ?", (payment['plan_id'],)
+        ).fetchone()
+        if plan is None:
+            return None
+        conn.execute(
+            "UPDATE converter_payments SET status = 'approved', processed_at = ?, processed_by = ? WHERE id = ?",
+            (_now(), params['p_admin_id'], params['p_payment_id'])
+        )
+        expires = self._extend_premium(conn, {'p_user_id': payment['user_id'], 'p_days': plan['duration_days']})
+        return {'user_id': payment['user_id'], 'subscription_expires_at': expires}
+
+    def _apply_user_stats_deltas(self, conn, params):
+        deltas = params['p_deltas']
+        conn.executemany(
+            "INSERT INTO converter_user_stats AS s "
+            "(user_id, conversions_today, total_conversions, last_conversion_date, total_files_size_bytes) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET "
+            "conversions_today = MAX(CASE WHEN s.last_conversion_date = excluded.last_conversion_date "
+            "THEN s.conversions_today + excluded.conversions_today ELSE excluded.conversions_today END, 0), "
+            "total_conversions = MAX(s.total_conversions + excluded.total_conversions, 0), "
+            "last_conversion_date = excluded.last_conversion_date, "
+            "total_files_size_bytes = MAX(s.total_files_size_bytes + excluded.total_files_size_bytes, 0)",
+            [(d['user_id'], d['today'], d['total'], d['date'], d['size']) for d in deltas]
+        )
+        # A refund for a user without a row inserts negative deltas; clamp them like 003 does
+        conn.execute(
+            "UPDATE converter_user_stats SET conversions_today = MAX(conversions_today, 0), "
+            "total_conversions = MAX(total_conversions, 0), "
+            "total_files_size_bytes = MAX(total_files_size_bytes, 0) "
+            "WHERE user_id IN (SELECT value FROM json_each(?)) "
+            "AND MIN(conversions_today, total_conversions, total_files_size_bytes) < 0",
+            (json.dumps([d['user_id'] for d in deltas]),)
+        )
+        cursor = conn.execute(
+            "SELECT user_id, conversions_today FROM converter_user_stats "
+            "WHERE user_id IN (SELECT value FROM json_each(?))",
+            (json.dumps([d['user_id'] for d in deltas]),)
+        )
+        return [dict(row) for row in cursor]
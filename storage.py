@@ -0,0 +1,69 @@
+"""
+Storage backend interface behind DatabaseManager
+
+DatabaseManager, the quota ledger and the conversion-log spool only need the
+handful of table operations below. AsyncRestClient implements them over
+Supabase's REST API; SQLiteBackend over an embedded database file for
+single-node deployments. DB_BACKEND in config.py picks one.
+
+Filters are {column: value} for column = value, {column: (op, value)} for
+op in eq / neq / gt / gte / lt / lte, {column: ('in', [values])}, and
+{column: None} for IS NULL. order is 'column' or 'column.desc'.
+"""
+
+from typing import Optional, Dict, Any, List, Union
+
+# {column: value} means column = value; {column: ('gte', value)} picks the operator
+Filters = Dict[str, Any]
+
+
+class StorageError(Exception):
+    """Base class for backend errors callers can act on"""
+
+
+class FunctionNotFound(StorageError):
+    """The RPC function is not installed in the database (migration not applied)"""
+
+
+class RowRejected(StorageError):
+    """The database refused the rows (constraint violation); retrying will not help"""
+
+
+class StorageBackend:
+    """Async table operations shared by all backends"""
+
+    async def select(self, table: str, columns: str = '*', filters: Optional[Filters] = None,
+                     order: Optional[str] = None, limit: Optional[int] = None,
+                     offset: Optional[int] = None,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Rows of table matching filters"""
+        raise NotImplementedError
+
+    async def count(self, table: str, filters: Optional[Filters] = None,
+                    timeout: Optional[float] = None) -> int:
+        """Exact number of rows matching filters, without fetching them"""
+        raise NotImplementedError
+
+    async def insert(self, table: str, data: Union[dict, List[dict]],
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Insert one row or a batch; returns the inserted rows"""
+        raise NotImplementedError
+
+    async def update(self, table: str, data: dict, filters: Filters,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Update the rows matching filters; returns the updated rows"""
+        raise NotImplementedError
+
+    async def upsert(self, table: str, data: Union[dict, List[dict]],
+                     on_conflict: Optional[str] = None,
+                     timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Insert rows, merging into existing ones on the on_conflict columns"""
+        raise NotImplementedError
+
+    async def rpc(self, function: str, params: Optional[dict] = None,
+                  timeout: Optional[float] = None):
+        """Run one of the migrations/ functions; raises FunctionNotFound if unavailable"""
+        raise NotImplementedError
+
+    async def close(self):
+        """Release connections (call on shutdown)"""
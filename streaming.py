@@ -0,0 +1,154 @@
+"""
+Pipe-through streaming for FFmpeg conversions
+
+Downloaded chunks are written to ffmpeg's stdin as they arrive and its
+stdout is collected into a spooled buffer for upload, so download and
+transcode overlap and no intermediate input/output files are written.
+"""
+
+import asyncio
+import logging
+import tempfile
+from typing import Optional, List
+
+import httpx
+
+from config import STREAM_CHUNK_SIZE, STREAM_SPOOL_MAX_BYTES
+from resource_limits import JobLimits, ConversionCancelled, kill_process_group
+from progress import JobProgress, ConversionStalled
+
+logger = logging.getLogger(__name__)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Shared client for streaming downloads from the Bot API file endpoint"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0))
+    return _http_client
+
+
+async def iter_file_chunks(file_path: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Yield a Telegram file in chunks from the Bot API URL or a local Bot API server path"""
+    if file_path.startswith(('http://', 'https://')):
+        async with _get_http_client().stream('GET', file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+    else:
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+
+async def stream_convert(file_path: str, cmd: List[str], limits: Optional[JobLimits] = None,
+                         timeout: float = 600, spool_dir: Optional[str] = None,
+                         progress: Optional[JobProgress] = None):
+    """Pipe a Telegram file through ffmpeg and return the spooled output positioned at 0
+
+    Output stays in memory up to STREAM_SPOOL_MAX_BYTES and only spills to
+    spool_dir beyond that. Returns None if ffmpeg fails.
+    Raises ResourceLimitExceeded if the job breaches its resource limits,
+    ConversionStalled if it stops making progress and ConversionCancelled if
+    the user cancelled it.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MAX_BYTES, dir=spool_dir)
+    stderr_tail = bytearray()
+    received = 0
+
+    proc = None
+    if limits:
+        limits.open_cgroup()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        if limits:
+            limits.attach(proc)
+        if progress is not None:
+            progress.attach(proc)
+
+        async def feed_input():
+            nonlocal received
+            try:
+                async for chunk in iter_file_chunks(file_path):
+                    received += len(chunk)
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # ffmpeg exited early; its return code tells us why
+                pass
+            finally:
+                try:
+                    proc.stdin.close()
+                except Exception:
+                    pass
+
+        async def collect_output():
+            while True:
+                chunk = await proc.stdout.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                output.write(chunk)
+
+        async def collect_stderr():
+            while True:
+                line = await proc.stderr.readline()
+                if not line:
+                    break
+                if progress is not None and progress.feed(line.decode(errors='ignore').rstrip()):
+                    continue
+                stderr_tail.extend(line)
+                del stderr_tail[:-16384]
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(feed_input(), collect_output(), collect_stderr(), proc.wait()),
+                timeout=timeout
+            )
+        except BaseException:
+            # Download error, timeout or cancellation: don't leave ffmpeg running
+            if proc.returncode is None:
+                kill_process_group(proc)
+                await proc.wait()
+            raise
+    except BaseException:
+        output.close()
+        raise
+    finally:
+        oom_killed, cpu_seconds = limits.close_cgroup() if limits else (False, None)
+        if limits and proc is not None:
+            limits.detach(proc)
+        if progress is not None:
+            progress.detach()
+
+    if limits and limits.cancelled:
+        output.close()
+        raise ConversionCancelled()
+    if progress is not None and progress.stalled:
+        output.close()
+        raise ConversionStalled(f"no progress for {progress.stalled_for():.0f}s")
+    if limits:
+        try:
+            limits.check_result(proc.returncode, bytes(stderr_tail), oom_killed, cpu_seconds)
+        except Exception:
+            output.close()
+            raise
+
+    if proc.returncode != 0 or output.tell() == 0:
+        logger.error(f"FFmpeg streaming error (exit {proc.returncode}): {stderr_tail.decode(errors='ignore')[-2000:]}")
+        output.close()
+        return None
+
+    logger.info(f"🌊 Streamed {received} bytes in, {output.tell()} bytes out through ffmpeg")
+    output.seek(0)
+    return output
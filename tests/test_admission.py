@@ -0,0 +1,125 @@
+import admission
+from admission import AdmissionController, NORMAL, DEFER, SHED_FREE, SHED_ALL
+from scheduler import FairScheduler
+from config import ADMISSION_MIN_HOLD_SECONDS
+
+
+class _Job:
+    def __init__(self, tier='free', resource_class='data'):
+        self.user_id = id(self)
+        self.tier_limits = {'tier': tier}
+        self.resource_class = resource_class
+
+
+class _Pipeline:
+    def __init__(self):
+        self.scheduler = FairScheduler()
+
+    def estimate_wait_seconds(self, position):
+        return position * 60
+
+
+def _controller(monkeypatch):
+    # Only the queue depth drives the level; the host's own load must not leak in
+    monkeypatch.setattr(admission, 'read_load_per_cpu', lambda: None)
+    monkeypatch.setattr(admission, 'read_memory_used_pct', lambda: None)
+    return AdmissionController(_Pipeline(), thresholds={'queue_depth': (5, 10, 15)})
+
+
+def _set_queue(controller, depth, **job_kwargs):
+    scheduler = controller.pipeline.scheduler
+    scheduler.take_queued()
+    for _ in range(depth):
+        scheduler.push(_Job(**job_kwargs))
+
+
+def _hold_elapsed(controller):
+    controller.level_since -= ADMISSION_MIN_HOLD_SECONDS
+
+
+def test_escalation_jumps_straight_to_highest_level(monkeypatch):
+    controller = _controller(monkeypatch)
+    _set_queue(controller, 4)
+    controller._update(0)
+    assert controller.level == NORMAL
+
+    _set_queue(controller, 16)
+    controller._update(0)
+    assert controller.level == SHED_ALL
+
+
+def test_recovery_waits_for_hold_and_steps_one_level(monkeypatch):
+    controller = _controller(monkeypatch)
+    _set_queue(controller, 16)
+    controller._update(0)
+
+    _set_queue(controller, 0)
+    controller._update(0)
+    assert controller.level == SHED_ALL  # held for ADMISSION_MIN_HOLD_SECONDS
+
+    _hold_elapsed(controller)
+    controller._update(0)
+    assert controller.level == SHED_FREE
+    controller._update(0)
+    assert controller.level == SHED_FREE  # the hold restarts at every step
+
+    _hold_elapsed(controller)
+    controller._update(0)
+    _hold_elapsed(controller)
+    controller._update(0)
+    assert controller.level == NORMAL
+
+
+def test_recovery_needs_signals_below_recovery_factor(monkeypatch):
+    controller = _controller(monkeypatch)
+    _set_queue(controller, 5)
+    controller._update(0)
+    assert controller.level == DEFER
+
+    # Below the threshold of 5 but not below 80% of it
+    _set_queue(controller, 4)
+    _hold_elapsed(controller)
+    controller._update(0)
+    assert controller.level == DEFER
+
+    _set_queue(controller, 3)
+    controller._update(0)
+    assert controller.level == NORMAL
+
+
+def test_deferred_jobs_do_not_count_toward_queue_depth(monkeypatch):
+    controller = _controller(monkeypatch)
+    _set_queue(controller, 5)
+    controller._update(0)
+    assert controller.level == DEFER
+
+    # Held back by should_defer, so they would otherwise keep the level up forever
+    _set_queue(controller, 12, resource_class='ffmpeg')
+    _hold_elapsed(controller)
+    controller._update(0)
+    assert controller.signals['queue_depth'] == 0
+    assert controller.level == NORMAL
+
+
+def test_decisions_per_level(monkeypatch):
+    controller = _controller(monkeypatch)
+    free_heavy = _Job(resource_class='ffmpeg')
+    premium_heavy = _Job(tier='premium', resource_class='ffmpeg')
+    assert not controller.should_defer(free_heavy)
+    assert controller.check({'tier': 'free'}) is None
+
+    controller.level = DEFER
+    assert controller.should_defer(free_heavy)
+    assert not controller.should_defer(premium_heavy)
+    assert not controller.should_defer(_Job())
+    assert controller.check({'tier': 'free'}) is None
+
+    controller.level = SHED_FREE
+    assert controller.check({'tier': 'free'}) == 1
+    assert controller.check({'tier': 'premium'}) is None
+
+    controller.level = SHED_ALL
+    assert controller.check({'tier': 'premium'}) == 1
+    assert controller.shed_count == 2
+    # The scheduler consults the controller before dispatching
+    assert controller.pipeline.scheduler.hold(free_heavy)
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from cache import TTLCache
+
+
+def test_concurrent_loads_are_coalesced():
+    async def run():
+        cache = TTLCache(ttl=60)
+        release = asyncio.Event()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await release.wait()
+            return {'user_id': 1}
+
+        tasks = [asyncio.create_task(cache.get_or_load(1, load)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert cache.get(1) == {'user_id': 1}
+        assert (cache.misses, cache.hits) == (1, 4)
+
+    asyncio.run(run())
+
+
+def test_invalidate_during_load_skips_storing():
+    async def run():
+        cache = TTLCache(ttl=60)
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            return 'stale'
+
+        task = asyncio.create_task(cache.get_or_load(1, load))
+        await asyncio.sleep(0)
+        cache.invalidate(1)
+        release.set()
+        assert await task == 'stale'
+        assert cache.get(1) is None
+
+        # The next caller loads afresh
+        async def fresh():
+            return 'fresh'
+        assert await cache.get_or_load(1, fresh) == 'fresh'
+        assert cache.get(1) == 'fresh'
+
+    asyncio.run(run())
+
+
+def test_invalidate_and_expiry():
+    async def run():
+        cache = TTLCache(ttl=60)
+
+        async def load():
+            return 'value'
+
+        await cache.get_or_load(1, load)
+        cache.invalidate(1)
+        assert cache.get(1) is None
+
+        expiring = TTLCache(ttl=-1)
+        await expiring.get_or_load(1, load)
+        assert expiring.get(1) is None
+
+    asyncio.run(run())
+
+
+def test_none_is_not_cached():
+    async def run():
+        cache = TTLCache(ttl=60)
+        calls = []
+
+        async def load():
+            calls.append(1)
+            return None
+
+        assert await cache.get_or_load(1, load) is None
+        assert await cache.get_or_load(1, load) is None
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+
+def test_loader_error_reaches_waiters_and_is_not_cached():
+    async def run():
+        cache = TTLCache(ttl=60)
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            raise RuntimeError('database down')
+
+        tasks = [asyncio.create_task(cache.get_or_load(1, load)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        async def recovered():
+            return 'value'
+        assert await cache.get_or_load(1, recovered) == 'value'
+
+    asyncio.run(run())
+
+
+def test_waiters_retry_when_loading_caller_is_cancelled():
+    async def run():
+        cache = TTLCache(ttl=60)
+        started = asyncio.Event()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            started.set()
+            if len(calls) == 1:
+                await asyncio.sleep(60)
+            return 'value'
+
+        loading = asyncio.create_task(cache.get_or_load(1, load))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_load(1, load))
+        await asyncio.sleep(0)
+        loading.cancel()
+
+        assert await asyncio.wait_for(waiter, 1) == 'value'
+        with pytest.raises(asyncio.CancelledError):
+            await loading
+        assert len(calls) == 2
+        assert cache.get(1) == 'value'
+
+    asyncio.run(run())
+
+
+def test_lru_bound():
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    cache.get(1)
+    cache.set(3, 'c')
+    assert cache.get(2) is None
+    assert cache.get(1) == 'a' and cache.get(3) == 'c'
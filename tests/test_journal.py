@@ -0,0 +1,46 @@
+import asyncio
+
+from journal import JobJournal
+from pipeline import ConversionPipeline, ConversionJob
+from config import FREE_TIER_LIMITS
+
+
+class _Converter:
+    def supports_memory(self, file_ext, target_format):
+        return True
+
+
+def _job(n):
+    return ConversionJob(
+        user_id=n, username=f'user{n}', chat_id=n, lang='en', file_id=f'file{n}',
+        file_name=f'doc{n}.docx', file_size=1024, file_ext='docx', target_format='pdf',
+        tier_limits=FREE_TIER_LIMITS, status_message_id=n,
+    )
+
+
+async def _drain_with_one_job_running(journal):
+    old = ConversionPipeline(None, _Converter(), None, journal=journal, owner='old')
+    running, queued = _job(1), _job(2)
+    old.submit(running)
+    old.submit(queued)
+    # The first job has been dispatched; the second is still waiting
+    assert await old.scheduler.get() is running
+    await old.drain(0)
+    assert queued.job_id not in old._jobs
+    old.executor.shutdown()
+    return running, queued
+
+
+def test_drained_jobs_are_claimable_by_next_instance(tmp_path):
+    journal = JobJournal(str(tmp_path / 'journal.db'))
+    running, queued = asyncio.run(_drain_with_one_job_running(journal))
+
+    # The draining instance keeps renewing its leases until it exits
+    assert journal.renew('old') == 1
+    claimed = journal.claim('new', 10)
+    assert [row['job_id'] for row in claimed] == [queued.job_id]
+    # Handed back, not interrupted: no attempt counted and no "resumed" notice
+    assert claimed[0]['owner'] is None
+    assert journal.get(queued.job_id)['attempts'] == 0
+    assert journal.get(running.job_id)['owner'] == 'old'
+    journal.close()
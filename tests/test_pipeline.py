@@ -0,0 +1,154 @@
+import asyncio
+
+import metrics
+from pipeline import ConversionPipeline, ConversionJob
+from config import FREE_TIER_LIMITS
+
+
+class _Converter:
+    def supports_memory(self, file_ext, target_format):
+        return True
+
+
+class _Document:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+
+class _Message:
+    def __init__(self, file_id):
+        self.document = _Document(file_id) if file_id else None
+
+
+class _Bot:
+    """Records what was sent; send_document answers with result_file_id"""
+
+    def __init__(self, result_file_id=None):
+        self.result_file_id = result_file_id
+        self.sent = []
+
+    async def send_document(self, chat_id, document, **kwargs):
+        self.sent.append((chat_id, document))
+        return _Message(self.result_file_id)
+
+    async def delete_message(self, **kwargs):
+        pass
+
+    async def edit_message_text(self, **kwargs):
+        pass
+
+
+class _Database:
+    def __init__(self):
+        self.logged = []
+
+    async def log_conversion(self, user_id, status, **kwargs):
+        self.logged.append((user_id, status))
+        return True
+
+
+def _job(user_id):
+    return ConversionJob(
+        user_id=user_id, username=f'user{user_id}', chat_id=user_id, lang='en', file_id='file',
+        file_name='doc.docx', file_size=1024, file_ext='docx', target_format='pdf',
+        tier_limits=FREE_TIER_LIMITS, status_message_id=1, file_unique_id='viral',
+    )
+
+
+def _pipeline(bot):
+    pipeline = ConversionPipeline(_Database(), _Converter(), None)
+    pipeline.bot = bot
+    return pipeline
+
+
+def test_followers_get_the_leaders_result():
+    async def run():
+        bot = _Bot()
+        pipeline = _pipeline(bot)
+        hits = metrics.get('dedup_inflight_hits')
+        leader, followers = _job(1), [_job(2), _job(3)]
+        for job in [leader] + followers:
+            pipeline.submit(job)
+
+        # Only the leader is converted
+        assert pipeline.scheduler.ordered() == [leader]
+        assert leader.followers == followers
+        assert metrics.get('dedup_inflight_hits') == hits + 2
+
+        assert await pipeline.scheduler.get() is leader
+        leader.result_file_id = 'converted'
+        await pipeline._finish(leader)
+
+        assert bot.sent == [(2, 'converted'), (3, 'converted')]
+        assert sorted(pipeline.db.logged) == [(1, 'success'), (2, 'success'), (3, 'success')]
+        assert not pipeline._jobs
+
+        # A request right after reuses the sent file without queueing
+        late = _job(4)
+        pipeline.submit(late)
+        await asyncio.gather(*pipeline._background)
+        assert pipeline.scheduler.qsize() == 0
+        assert bot.sent[-1] == (4, 'converted')
+        pipeline.executor.shutdown()
+
+    asyncio.run(run())
+
+
+def test_followers_rerun_when_upload_has_no_file_id():
+    async def run():
+        bot = _Bot()
+        pipeline = _pipeline(bot)
+        leader, first, second = _job(1), _job(2), _job(3)
+        for job in (leader, first, second):
+            pipeline.submit(job)
+        assert await pipeline.scheduler.get() is leader
+
+        # Sent, but Telegram returned no document to forward
+        await pipeline._finish(leader)
+
+        assert bot.sent == []
+        assert pipeline.db.logged == [(1, 'success')]
+        assert first.leader is None
+        assert first.followers == [second] and second.leader is first
+        assert pipeline.scheduler.ordered() == [first]
+        assert pipeline._dedup_inflight[leader.dedup_key] is first
+        assert not pipeline._dedup_recent
+        pipeline.executor.shutdown()
+
+    asyncio.run(run())
+
+
+def test_failed_leader_fails_its_followers():
+    async def run():
+        pipeline = _pipeline(_Bot())
+        leader, follower = _job(1), _job(2)
+        pipeline.submit(leader)
+        pipeline.submit(follower)
+        assert await pipeline.scheduler.get() is leader
+
+        await pipeline._finish(leader, Exception('corrupt file'))
+
+        assert pipeline.db.logged == [(1, 'failed'), (2, 'failed')]
+        assert not pipeline._dedup_inflight
+        assert not pipeline._jobs
+        pipeline.executor.shutdown()
+
+    asyncio.run(run())
+
+
+def test_cancelled_leader_hands_over_to_follower():
+    async def run():
+        pipeline = _pipeline(_Bot())
+        leader, follower = _job(1), _job(2)
+        pipeline.submit(leader)
+        pipeline.submit(follower)
+
+        assert pipeline.cancel(leader.job_id, 1)
+        await asyncio.gather(*pipeline._background)
+
+        assert pipeline.db.logged == [(1, 'cancelled')]
+        assert follower.leader is None
+        assert pipeline.scheduler.ordered() == [follower]
+        pipeline.executor.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,85 @@
+from progress import JobProgress, progress_args
+
+
+# What ffmpeg writes to stderr with -progress pipe:2 -nostats
+_STDERR = """\
+Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'input.mp4':
+  Duration: 00:01:40.00, start: 0.000000, bitrate: 1205 kb/s
+frame=250
+fps=50.00
+out_time_us=25000000
+out_time_ms=25000000
+out_time=00:00:25.000000
+speed=2.5x
+progress=continue
+frame=500
+out_time_us=50000000
+out_time_ms=50000000
+out_time=00:00:50.000000
+speed=2x
+progress=continue
+""".splitlines()
+
+
+def test_progress_lines_drive_percent_and_eta():
+    progress = JobProgress()
+    parsed = [progress.feed(line) for line in _STDERR]
+
+    assert progress.duration == 100
+    assert parsed[:2] == [False, False]
+    assert parsed.count(True) == 10  # frame= and fps= are not tracked
+    assert progress.out_time == 50
+    assert progress.speed == 2
+    assert progress.percent == 50
+    assert progress.eta_seconds == 25
+    assert not progress.finished
+
+
+def test_position_never_moves_backwards():
+    progress = JobProgress(duration=60)
+    progress.feed('out_time=00:00:30.000000')
+    advanced_at = progress.last_advance
+    progress.feed('out_time_us=10000000')
+    progress.feed('out_time=00:00:30.000000')
+    assert progress.out_time == 30
+    assert progress.last_advance == advanced_at
+
+
+def test_unknown_values_are_ignored():
+    progress = JobProgress()
+    assert progress.feed('out_time=N/A')
+    assert progress.feed('out_time_us=N/A')
+    assert progress.feed('speed=N/A')
+    assert progress.out_time == 0
+    assert progress.speed is None
+    # Without a duration there is nothing to show
+    assert progress.percent is None
+    assert progress.eta_seconds is None
+
+
+def test_percent_caps_at_99_until_end():
+    progress = JobProgress(duration=10)
+    progress.feed('out_time_us=10500000')
+    assert progress.percent == 99
+    progress.feed('progress=end')
+    assert progress.finished
+    assert progress.percent == 100
+
+
+def test_known_duration_is_not_replaced_by_stderr():
+    progress = JobProgress(duration=42)
+    progress.feed('  Duration: 00:01:40.00, start: 0.000000, bitrate: 1205 kb/s')
+    assert progress.duration == 42
+    assert JobProgress(duration=0).duration is None
+
+
+def test_watchdog_needs_an_attached_process():
+    progress = JobProgress(duration=10)
+    assert not progress.active
+    assert not progress.kill_stalled()
+    assert not progress.stalled
+
+
+def test_progress_args():
+    assert progress_args(None) == []
+    assert progress_args(JobProgress()) == ['-progress', 'pipe:2', '-nostats']
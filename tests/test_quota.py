@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from quota import QuotaLedger
+from storage import FunctionNotFound
+from sqlite_backend import SQLiteBackend
+
+
+class _NoFunctions(SQLiteBackend):
+    """A database without the migrations/001 functions"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.rpc_calls = 0
+
+    async def rpc(self, function, params=None, timeout=None):
+        self.rpc_calls += 1
+        raise FunctionNotFound(function)
+
+
+class _Unavailable(SQLiteBackend):
+    async def rpc(self, function, params=None, timeout=None):
+        raise RuntimeError('connection reset')
+
+
+async def _stats(store):
+    rows = await store.select('converter_user_stats', order='user_id')
+    return {row['user_id']: row for row in rows}
+
+
+async def _seed_yesterday(store):
+    yesterday = (datetime.now(timezone.utc).date() - timedelta(days=1)).isoformat()
+    await store.insert('converter_user_stats', {
+        'user_id': 1, 'conversions_today': 7, 'total_conversions': 20,
+        'last_conversion_date': yesterday, 'total_files_size_bytes': 5000,
+    })
+
+
+async def _record_and_flush(store):
+    await _seed_yesterday(store)
+    ledger = QuotaLedger(store)
+    await ledger.refresh()
+    assert ledger.conversions_today(1) == 0
+
+    ledger.record(1, 100)
+    ledger.record(1, 200)
+    ledger.record(2, 50)
+    assert ledger.conversions_today(1) == 2
+    await ledger.flush()
+    assert not ledger._pending
+
+    stats = await _stats(store)
+    # Yesterday's count is replaced, totals keep growing
+    assert stats[1]['conversions_today'] == 2
+    assert stats[1]['total_conversions'] == 22
+    assert stats[1]['total_files_size_bytes'] == 5300
+    assert str(stats[1]['last_conversion_date']) == ledger.date
+    assert stats[2]['conversions_today'] == 1
+
+    # A second flush adds to today's row
+    ledger.record(1, 0)
+    await ledger.flush()
+    assert (await _stats(store))[1]['conversions_today'] == 3
+
+    # Another process's conversions show up on refresh
+    await store.update('converter_user_stats', {'conversions_today': 5}, {'user_id': 2})
+    await ledger.refresh()
+    assert ledger.conversions_today(2) == 5
+    return ledger
+
+
+def test_flush_through_rpc(tmp_path):
+    async def run():
+        store = SQLiteBackend(str(tmp_path / 'db.sqlite'))
+        await _record_and_flush(store)
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_flush_through_fallback(tmp_path):
+    async def run():
+        store = _NoFunctions(str(tmp_path / 'db.sqlite'))
+        await _record_and_flush(store)
+        assert store.rpc_calls == 2
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_failed_flush_keeps_increments(tmp_path):
+    async def run():
+        store = _Unavailable(str(tmp_path / 'db.sqlite'))
+        ledger = QuotaLedger(store)
+        await ledger.refresh()
+        ledger.record(1, 100)
+        with pytest.raises(RuntimeError):
+            await ledger.flush()
+
+        # Recorded while the flush was failing: merged behind the restored increments
+        ledger.record(1, 10)
+        pending = ledger._pending[1]
+        assert (pending.today, pending.total, pending.size) == (2, 2, 110)
+        assert ledger.conversions_today(1) == 2
+        await store.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('backend', [SQLiteBackend, _NoFunctions])
+def test_refunds_are_clamped_at_zero(tmp_path, backend):
+    async def run():
+        store = backend(str(tmp_path / 'db.sqlite'))
+        ledger = QuotaLedger(store)
+        await ledger.refresh()
+        ledger.record(1, 100)
+        await ledger.flush()
+
+        ledger.refund(1, ledger.date, 100)
+        assert ledger.conversions_today(1) == 0
+        # A refund for a user the table has never seen, and one for a past day
+        ledger.refund(2, ledger.date, 100)
+        ledger.refund(1, '2000-01-01', 0)
+        await ledger.flush()
+
+        stats = await _stats(store)
+        assert stats[1]['conversions_today'] == 0
+        assert stats[1]['total_conversions'] == 0
+        assert stats[1]['total_files_size_bytes'] == 0
+        assert stats[2]['conversions_today'] == 0
+        assert stats[2]['total_conversions'] == 0
+        await store.close()
+
+    asyncio.run(run())
@@ -0,0 +1,135 @@
+import asyncio
+
+from scheduler import FairScheduler
+from pipeline import ConversionPipeline, ConversionJob
+from config import FREE_TIER_LIMITS
+
+
+class _Job:
+    def __init__(self, user_id, weight=1, cap=10):
+        self.user_id = user_id
+        self.tier_limits = {'scheduler_weight': weight, 'max_concurrent_jobs': cap}
+
+    def __repr__(self):
+        return f"<job {self.user_id}>"
+
+
+def _dispatch_all(scheduler):
+    """Dispatch and immediately release everything queued, in dispatch order"""
+    order = []
+    while scheduler.qsize():
+        job = scheduler._pop_next()
+        order.append(job)
+        scheduler.release(job)
+    return order
+
+
+def test_weighted_users_interleave_by_virtual_finish():
+    scheduler = FairScheduler()
+    light = [_Job(1) for _ in range(3)]          # tags 1, 2, 3
+    heavy = [_Job(2, weight=2) for _ in range(4)]  # tags 0.5, 1, 1.5, 2
+    for job in light + heavy:
+        scheduler.push(job)
+
+    expected = [heavy[0], light[0], heavy[1], heavy[2], light[1], heavy[3], light[2]]
+    assert scheduler.ordered() == expected
+    assert _dispatch_all(scheduler) == expected
+
+
+def test_idle_user_does_not_bank_credit():
+    scheduler = FairScheduler()
+    busy = [_Job(1) for _ in range(4)]
+    for job in busy:
+        scheduler.push(job)
+    assert scheduler._pop_next() is busy[0]
+    scheduler.release(busy[0])
+    assert scheduler._pop_next() is busy[1]
+    scheduler.release(busy[1])
+
+    # Arrives once virtual time is 1: tags 2 and 3, not 1 and 2
+    late = [_Job(3), _Job(3)]
+    for job in late:
+        scheduler.push(job)
+    assert _dispatch_all(scheduler) == [late[0], busy[2], late[1], busy[3]]
+
+
+def test_slot_cap_skips_user_until_release():
+    scheduler = FairScheduler()
+    first, second = _Job(1, cap=1), _Job(1, cap=1)
+    other = _Job(2, weight=0.25)
+    for job in (first, second, other):
+        scheduler.push(job)
+    assert scheduler.pending(1) == 2
+
+    assert scheduler._pop_next() is first
+    # second has the lower tag but user 1 is at its cap
+    assert scheduler._pop_next() is other
+    assert scheduler._pop_next() is None
+    assert scheduler.pending(1) == 2
+
+    scheduler.release(first)
+    assert scheduler.pending(1) == 1
+    assert scheduler._pop_next() is second
+    scheduler.release(second)
+    scheduler.release(other)
+    assert scheduler.pending(1) == 0
+    assert scheduler.pending(2) == 0
+
+
+def test_get_waits_for_release():
+    async def run():
+        scheduler = FairScheduler()
+        first, second = _Job(1, cap=1), _Job(1, cap=1)
+        scheduler.push(first)
+        scheduler.push(second)
+        assert await scheduler.get() is first
+        waiter = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        scheduler.release(first)
+        assert await asyncio.wait_for(waiter, 1) is second
+
+    asyncio.run(run())
+
+
+def test_remove_drops_queued_job():
+    scheduler = FairScheduler()
+    job = _Job(1)
+    scheduler.push(job)
+    assert scheduler.remove(job)
+    assert not scheduler.remove(job)
+    assert scheduler.pending(1) == 0
+    assert scheduler._pop_next() is None
+
+
+class _Converter:
+    def supports_memory(self, file_ext, target_format):
+        return True
+
+
+def _job(user_id, file_unique_id=None):
+    return ConversionJob(
+        user_id=user_id, username=f'user{user_id}', chat_id=user_id, lang='en', file_id='file',
+        file_name='doc.docx', file_size=1024, file_ext='docx', target_format='pdf',
+        tier_limits=FREE_TIER_LIMITS, status_message_id=1, file_unique_id=file_unique_id,
+    )
+
+
+def test_user_pending_counts_coalesced_followers():
+    async def run():
+        pipeline = ConversionPipeline(None, _Converter(), None)
+        pipeline.submit(_job(1, 'same'))
+        pipeline.submit(_job(1, 'other'))
+        follower = _job(2, 'same')
+        pipeline.submit(follower)
+
+        assert follower.leader is not None
+        assert pipeline.scheduler.pending(2) == 0
+        assert pipeline.user_pending(1) == 2
+        assert pipeline.user_pending(2) == 1
+
+        assert pipeline.cancel(follower.job_id, 2)
+        assert pipeline.user_pending(2) == 0
+        pipeline.executor.shutdown()
+
+    asyncio.run(run())
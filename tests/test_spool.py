@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+import spool
+from spool import WriteSpool
+from sqlite_backend import SQLiteBackend
+
+
+def _row(user_id):
+    return {'user_id': user_id, 'original_filename': f'doc{user_id}.docx', 'conversion_status': 'success'}
+
+
+class _Flaky(SQLiteBackend):
+    """Fails the first `failures` inserts"""
+
+    def __init__(self, path, failures):
+        super().__init__(path)
+        self.failures = failures
+
+    async def insert(self, table, data, timeout=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('database unavailable')
+        return await super().insert(table, data, timeout)
+
+
+def _attempts(log):
+    with log._lock:
+        return [row[0] for row in log._connect().execute("SELECT attempts FROM events ORDER BY id")]
+
+
+def test_flush_inserts_in_batches(tmp_path):
+    async def run():
+        store = SQLiteBackend(str(tmp_path / 'db.sqlite'))
+        log = WriteSpool(store, path=str(tmp_path / 'spool.db'), batch_size=2)
+        for user_id in range(5):
+            assert log.append(_row(user_id))
+        assert log.pending() == 5
+
+        assert await log.flush() == 5
+        assert log.pending() == 0
+        assert await store.count('file_conversions') == 5
+        await log.stop()
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_claimed_rows_are_hidden_from_other_processes(tmp_path):
+    path = str(tmp_path / 'spool.db')
+    first, second = WriteSpool(None, path=path), WriteSpool(None, path=path)
+    for user_id in range(3):
+        first.append(_row(user_id))
+
+    claimed = first._claim(2)
+    assert [row['user_id'] for _, row in claimed] == [0, 1]
+    assert [row['user_id'] for _, row in second._claim(10)] == [2]
+    assert second._claim(10) == []
+
+    # Given back after a failed insert: claimable again, attempt counted
+    first._settle([event_id for event_id, _ in claimed], False)
+    assert [row['user_id'] for _, row in second._claim(10)] == [0, 1]
+    assert _attempts(first) == [1, 1, 0]
+    first._settle([event_id for event_id, _ in claimed], True)
+    assert first.pending() == 1
+    asyncio.run(first.stop())
+    asyncio.run(second.stop())
+
+
+def test_failed_flush_keeps_rows(tmp_path):
+    async def run():
+        store = _Flaky(str(tmp_path / 'db.sqlite'), failures=1)
+        log = WriteSpool(store, path=str(tmp_path / 'spool.db'))
+        log.append(_row(1))
+        with pytest.raises(ConnectionError):
+            await log.flush()
+        assert log.pending() == 1
+        assert _attempts(log) == [1]
+
+        assert await log.flush() == 1
+        assert log.pending() == 0
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_rejected_rows_are_dropped_alone(tmp_path):
+    async def run():
+        store = SQLiteBackend(str(tmp_path / 'db.sqlite'))
+        log = WriteSpool(store, path=str(tmp_path / 'spool.db'))
+        log.append(_row(1))
+        log.append(_row(None))  # user_id is NOT NULL
+        log.append(_row(3))
+
+        assert await log.flush() == 3
+        assert log.pending() == 0
+        rows = await store.select('file_conversions', order='id')
+        assert [row['user_id'] for row in rows] == [1, 3]
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_flush_loop_backs_off_and_recovers(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, 'SPOOL_RETRY_BASE_SECONDS', 0.05)
+
+    async def run():
+        store = _Flaky(str(tmp_path / 'db.sqlite'), failures=2)
+        log = WriteSpool(store, path=str(tmp_path / 'spool.db'), batch_size=1, flush_interval=0.01)
+        log.append(_row(1))
+        log.start()
+
+        while log._failures < 2:
+            await asyncio.sleep(0.01)
+        # While backing off, filling a batch does not trigger an immediate retry
+        log.append(_row(2))
+        assert not log._wake.is_set()
+
+        for _ in range(100):
+            if not log.pending():
+                break
+            await asyncio.sleep(0.01)
+        assert log.pending() == 0
+        assert log._failures == 0
+        assert await store.count('file_conversions') == 2
+        await log.stop()
+        await store.close()
+
+    asyncio.run(run())
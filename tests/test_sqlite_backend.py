@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from storage import FunctionNotFound, RowRejected
+from sqlite_backend import SQLiteBackend
+
+
+def _run(tmp_path, test):
+    async def run():
+        store = SQLiteBackend(str(tmp_path / 'db.sqlite'))
+        try:
+            await test(store)
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def _expires(value):
+    return datetime.fromisoformat(value)
+
+
+def test_create_converter_user_is_idempotent(tmp_path):
+    async def test(store):
+        params = {'p_user_id': 1, 'p_username': 'alice', 'p_language_code': 'uz'}
+        created = await store.rpc('create_converter_user', params)
+        assert created[0]['username'] == 'alice'
+        assert created[0]['subscription_tier'] == 'free'
+
+        await store.rpc('create_converter_user', dict(params, p_username='renamed'))
+        users = await store.select('converter_users')
+        assert [(user['user_id'], user['username'], user['language_code']) for user in users] == [(1, 'alice', 'uz')]
+        stats = await store.select('converter_user_stats')
+        assert [(row['user_id'], row['conversions_today']) for row in stats] == [(1, 0)]
+
+    _run(tmp_path, test)
+
+
+def test_extend_premium_stacks_on_active_subscription(tmp_path):
+    async def test(store):
+        await store.rpc('create_converter_user', {'p_user_id': 1})
+        assert await store.rpc('extend_premium', {'p_user_id': 2, 'p_days': 30}) is None
+
+        now = datetime.now(timezone.utc)
+        first = _expires(await store.rpc('extend_premium', {'p_user_id': 1, 'p_days': 30}))
+        assert abs(first - (now + timedelta(days=30))) < timedelta(minutes=1)
+        second = _expires(await store.rpc('extend_premium', {'p_user_id': 1, 'p_days': 10}))
+        assert second == first + timedelta(days=10)
+
+        user = (await store.select('converter_users', filters={'user_id': 1}))[0]
+        assert user['subscription_tier'] == 'premium'
+        assert _expires(user['subscription_expires_at']) == second
+
+        # An expired subscription restarts from now
+        expired = (now - timedelta(days=5)).isoformat()
+        await store.update('converter_users', {'subscription_expires_at': expired}, {'user_id': 1})
+        third = _expires(await store.rpc('extend_premium', {'p_user_id': 1, 'p_days': 1}))
+        assert abs(third - (now + timedelta(days=1))) < timedelta(minutes=1)
+
+    _run(tmp_path, test)
+
+
+def test_approve_converter_payment(tmp_path):
+    async def test(store):
+        await store.rpc('create_converter_user', {'p_user_id': 1})
+        payment = (await store.insert('converter_payments', {'user_id': 1, 'plan_id': 2, 'amount': 25000}))[0]
+        assert await store.rpc('approve_converter_payment', {'p_payment_id': 999, 'p_admin_id': 7}) is None
+
+        result = await store.rpc('approve_converter_payment', {'p_payment_id': payment['id'], 'p_admin_id': 7})
+        assert result['user_id'] == 1
+        expected = datetime.now(timezone.utc) + timedelta(days=90)  # the Quarterly plan
+        assert abs(_expires(result['subscription_expires_at']) - expected) < timedelta(minutes=1)
+
+        payment = (await store.select('converter_payments', filters={'id': payment['id']}))[0]
+        assert payment['status'] == 'approved'
+        assert payment['processed_by'] == 7
+        assert payment['processed_at']
+        user = (await store.select('converter_users', filters={'user_id': 1}))[0]
+        assert user['subscription_tier'] == 'premium'
+
+    _run(tmp_path, test)
+
+
+def test_apply_user_stats_deltas(tmp_path):
+    async def test(store):
+        await store.rpc('create_converter_user', {'p_user_id': 1})
+
+        def delta(user_id, day, today, size=10):
+            return {'user_id': user_id, 'date': day, 'today': today, 'total': today, 'size': size}
+
+        rows = await store.rpc('apply_user_stats_deltas', {'p_deltas': [
+            delta(1, '2024-05-01', 2), delta(2, '2024-05-01', 1),
+        ]})
+        assert sorted((row['user_id'], row['conversions_today']) for row in rows) == [(1, 2), (2, 1)]
+
+        rows = await store.rpc('apply_user_stats_deltas', {'p_deltas': [delta(1, '2024-05-01', 3)]})
+        assert rows == [{'user_id': 1, 'conversions_today': 5}]
+        # A new day starts the daily count over
+        rows = await store.rpc('apply_user_stats_deltas', {'p_deltas': [delta(1, '2024-05-02', 1)]})
+        assert rows == [{'user_id': 1, 'conversions_today': 1}]
+
+        stats = (await store.select('converter_user_stats', filters={'user_id': 1}))[0]
+        assert stats['total_conversions'] == 6
+        assert stats['total_files_size_bytes'] == 30
+        assert stats['last_conversion_date'] == '2024-05-02'
+
+        # Refunds never take the counters below zero
+        rows = await store.rpc('apply_user_stats_deltas', {'p_deltas': [
+            delta(1, '2024-05-02', -3, size=-100), delta(3, '2024-05-02', -1, size=-100),
+        ]})
+        assert sorted((row['user_id'], row['conversions_today']) for row in rows) == [(1, 0), (3, 0)]
+        stats = {row['user_id']: row for row in await store.select('converter_user_stats')}
+        assert stats[1]['total_conversions'] == 3
+        assert stats[1]['total_files_size_bytes'] == 0
+        assert stats[3]['total_conversions'] == 0
+
+    _run(tmp_path, test)
+
+
+def test_unknown_function(tmp_path):
+    async def test(store):
+        with pytest.raises(FunctionNotFound):
+            await store.rpc('no_such_function', {})
+
+    _run(tmp_path, test)
+
+
+def test_queries_and_constraints(tmp_path):
+    async def test(store):
+        await store.insert('file_conversions', [
+            {'user_id': 1, 'conversion_status': 'success', 'file_size_bytes': 10},
+            {'user_id': 1, 'conversion_status': 'failed', 'file_size_bytes': 20},
+            {'user_id': 2, 'conversion_status': 'cancelled', 'file_size_bytes': 30},
+        ])
+        assert await store.count('file_conversions', filters={'user_id': 1}) == 2
+        rows = await store.select('file_conversions', columns='user_id,file_size_bytes',
+                                  filters={'file_size_bytes': ('gte', 20)}, order='file_size_bytes.desc')
+        assert rows == [{'user_id': 2, 'file_size_bytes': 30}, {'user_id': 1, 'file_size_bytes': 20}]
+        rows = await store.select('file_conversions', filters={'conversion_status': ('in', ['failed', 'cancelled'])},
+                                  order='id', limit=1, offset=1)
+        assert [row['user_id'] for row in rows] == [2]
+
+        await store.upsert('converter_user_stats', [{'user_id': 1, 'conversions_today': 1}], on_conflict='user_id')
+        await store.upsert('converter_user_stats', [{'user_id': 1, 'conversions_today': 4}], on_conflict='user_id')
+        assert (await store.select('converter_user_stats'))[0]['conversions_today'] == 4
+
+        # Nothing is written when one row of a batch is refused
+        with pytest.raises(RowRejected):
+            await store.insert('file_conversions', [{'user_id': 3}, {'user_id': None}])
+        assert await store.count('file_conversions', filters={'user_id': 3}) == 0
+
+    _run(tmp_path, test)
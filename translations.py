@@ -128,6 +128,34 @@ TRANSLATIONS = {
         ),
         'conversion_success': "✅ Conversion complete! Here's your file:",
         'conversion_failed': "❌ Conversion failed: {error}",
+        'server_busy_disk': (
+            "⏳ <b>Server is busy</b>\n\n"
+            "There is not enough free space to process your file right now.\n"
+            "Please try again in a few minutes."
+        ),
+        'conversion_limit_exceeded': (
+            "🛑 <b>Conversion stopped</b>\n\n"
+            "This file needs more memory, CPU time or output space than your plan allows.\n"
+            "Try a smaller file or another format."
+        ),
+        'queued_position': (
+            "⏳ <b>Queued for {format}</b>\n\n"
+            "Position in queue: {position}\n"
+            "Estimated start: in ~{minutes} min"
+        ),
+        'queue_full': "⏳ You already have {count} conversions waiting. Please wait for them to finish.",
+        'server_busy_retry': "⏳ The server is busy right now. Please try again in {minutes} min.",
+        'conversion_resumed': "🔄 The bot was restarted. Your conversion to {format} has been resumed.",
+        'conversion_cancelled': "🚫 Conversion cancelled.",
+        'cancel_requested': "🚫 Cancelling...",
+        'cancel_too_late': "This conversion has already finished.",
+        'conversion_progress': "🔄 <b>Converting to {format}</b>\n\n{bar} {percent}%\nTime left: ~{eta}",
+        'conversion_progress_no_eta': "🔄 <b>Converting to {format}</b>\n\n{bar} {percent}%",
+        'conversion_stalled': (
+            "🛑 <b>Conversion stopped</b>\n\n"
+            "The conversion stopped making progress and was cancelled.\n"
+            "The file may be damaged. Please try again or choose another format."
+        ),
         
         # Limits - Free tier
         'file_too_large_free': (
@@ -326,6 +354,34 @@ TRANSLATIONS = {
         ),
         'conversion_success': "✅ Готово! Вот ваш файл:",
         'conversion_failed': "❌ Ошибка: {error}",
+        'server_busy_disk': (
+            "⏳ <b>Сервер занят</b>\n\n"
+            "Сейчас недостаточно места для обработки вашего файла.\n"
+            "Пожалуйста, попробуйте через несколько минут."
+        ),
+        'conversion_limit_exceeded': (
+            "🛑 <b>Конвертация остановлена</b>\n\n"
+            "Файлу требуется больше памяти, процессорного времени или места, чем позволяет ваш тариф.\n"
+            "Попробуйте файл поменьше или другой формат."
+        ),
+        'queued_position': (
+            "⏳ <b>В очереди на {format}</b>\n\n"
+            "Позиция в очереди: {position}\n"
+            "Примерное начало: через ~{minutes} мин"
+        ),
+        'queue_full': "⏳ У вас уже {count} конвертаций в очереди. Дождитесь их завершения.",
+        'server_busy_retry': "⏳ Сервер сейчас перегружен. Попробуйте снова через {minutes} мин.",
+        'conversion_resumed': "🔄 Бот был перезапущен. Ваша конвертация в {format} возобновлена.",
+        'conversion_cancelled': "🚫 Конвертация отменена.",
+        'cancel_requested': "🚫 Отменяем...",
+        'cancel_too_late': "Эта конвертация уже завершена.",
+        'conversion_progress': "🔄 <b>Конвертация в {format}</b>\n\n{bar} {percent}%\nОсталось: ~{eta}",
+        'conversion_progress_no_eta': "🔄 <b>Конвертация в {format}</b>\n\n{bar} {percent}%",
+        'conversion_stalled': (
+            "🛑 <b>Конвертация остановлена</b>\n\n"
+            "Конвертация перестала продвигаться и была отменена.\n"
+            "Возможно, файл повреждён. Попробуйте снова или выберите другой формат."
+        ),
         
         # Limits - Free tier
         'file_too_large_free': (
@@ -589,6 +645,34 @@ TRANSLATIONS = {
     'converting': "⏳ Fayl {format} formatiga konvertatsiya qilinmoqda...",
     'conversion_success': "✅ Konvertatsiya muvaffaqiyatli bajarildi! Mana sizning faylingiz:",
     'conversion_failed': "❌ Konvertatsiyada xato: {error}\n\nIltimos, qaytadan urinib ko'ring yoki boshqa formatni tanlang.",
+    'server_busy_disk': (
+        "⏳ <b>Server band</b>\n\n"
+        "Hozir faylingizni qayta ishlash uchun joy yetarli emas.\n"
+        "Iltimos, bir necha daqiqadan so'ng qayta urinib ko'ring."
+    ),
+    'conversion_limit_exceeded': (
+        "🛑 <b>Konvertatsiya to'xtatildi</b>\n\n"
+        "Bu fayl tarifingiz ruxsat berganidan ko'proq xotira, protsessor vaqti yoki joy talab qiladi.\n"
+        "Kichikroq fayl yoki boshqa formatni sinab ko'ring."
+    ),
+    'queued_position': (
+        "⏳ <b>{format} uchun navbatda</b>\n\n"
+        "Navbatdagi o'rin: {position}\n"
+        "Taxminiy boshlanish: ~{minutes} daqiqadan so'ng"
+    ),
+    'queue_full': "⏳ Sizda allaqachon {count} ta konvertatsiya navbatda. Iltimos, ular tugashini kuting.",
+    'server_busy_retry': "⏳ Server hozir band. Iltimos, {minutes} daqiqadan so'ng qayta urinib ko'ring.",
+    'conversion_resumed': "🔄 Bot qayta ishga tushirildi. {format} formatiga o'zgartirish davom ettirildi.",
+    'conversion_cancelled': "🚫 Konvertatsiya bekor qilindi.",
+    'cancel_requested': "🚫 Bekor qilinmoqda...",
+    'cancel_too_late': "Bu konvertatsiya allaqachon yakunlangan.",
+    'conversion_progress': "🔄 <b>{format} formatiga o'zgartirilmoqda</b>\n\n{bar} {percent}%\nQolgan vaqt: ~{eta}",
+    'conversion_progress_no_eta': "🔄 <b>{format} formatiga o'zgartirilmoqda</b>\n\n{bar} {percent}%",
+    'conversion_stalled': (
+        "🛑 <b>Konvertatsiya to'xtatildi</b>\n\n"
+        "Konvertatsiya oldinga siljimay qoldi va bekor qilindi.\n"
+        "Fayl shikastlangan bo'lishi mumkin. Qayta urinib ko'ring yoki boshqa formatni tanlang."
+    ),
 
     'select_category': (
         "📁 <b>Qaysi turdagi faylni konvertatsiya qilmoqchisiz?</b>\n\n"
@@ -0,0 +1,122 @@
+"""
+Conversion worker process for the split deployment (CONVERSION_MODE=enqueue)
+
+The bot process only journals jobs; each worker claims them from the shared
+journal, converts them and uploads the results with its own Bot instance.
+
+Usage:
+    python worker.py                 # one worker
+    python worker.py --processes 4   # four workers on this host
+"""
+
+import os
+import uuid
+import socket
+import signal
+import asyncio
+import logging
+import argparse
+import multiprocessing
+
+from telegram import Bot
+
+from config import (
+    BOT_TOKEN, WORKSPACE_SWEEP_INTERVAL_SECONDS,
+    DRAIN_DEADLINE_SECONDS, DRAIN_FLUSH_TIMEOUT_SECONDS,
+)
+from database import DatabaseManager
+from converters import FileConverter
+from workspace import WorkspaceManager
+from journal import JobJournal
+from pipeline import ConversionPipeline
+import lifecycle
+
+logger = logging.getLogger(__name__)
+
+
+async def _sweep_periodically(workspaces: WorkspaceManager):
+    """Remove orphaned temp files (the bot's JobQueue does this in inline mode)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(WORKSPACE_SWEEP_INTERVAL_SECONDS)
+        try:
+            await loop.run_in_executor(None, workspaces.sweep_stale)
+        except Exception as e:
+            logger.error(f"Error sweeping temp files: {e}")
+
+
+async def run_worker(worker_id: str):
+    """Claim and convert journaled jobs until SIGTERM/SIGINT, then drain"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    converter = FileConverter()
+    workspaces = WorkspaceManager(sweep_roots=[converter.temp_dir])
+    journal = JobJournal()
+    db = DatabaseManager()
+    pipeline = ConversionPipeline(db, converter, workspaces, journal=journal, owner=worker_id)
+    lifecycle.register_flush_hook('quota ledger', db.quota.flush)
+    lifecycle.register_flush_hook('conversion log spool', db.conversion_log.flush)
+
+    bot = Bot(BOT_TOKEN)
+    await bot.initialize()
+    await db.quota.start()
+    db.conversion_log.start()
+    await pipeline.start(bot)
+    sweeper = asyncio.create_task(_sweep_periodically(workspaces))
+    logger.info(f"👷 Worker {worker_id} started")
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info(f"👷 Worker {worker_id} draining")
+        sweeper.cancel()
+        await pipeline.drain(DRAIN_DEADLINE_SECONDS)
+        await lifecycle.flush_all(DRAIN_FLUSH_TIMEOUT_SECONDS)
+        await pipeline.stop()
+        await bot.shutdown()
+        journal.close()
+        await db.quota.stop()
+        await db.conversion_log.stop()
+        await db.close()
+
+
+def _worker_main(name: str):
+    # Unique per process start, so a restarted worker never renews its predecessor's leases
+    asyncio.run(run_worker(f"{name}-{os.getpid()}-{uuid.uuid4().hex[:6]}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversion worker process")
+    parser.add_argument('--processes', type=int, default=1, help='worker processes to start on this host')
+    args = parser.parse_args()
+
+    base_id = os.environ.get("WORKER_ID") or socket.gethostname()
+    if args.processes <= 1:
+        _worker_main(base_id)
+        return
+
+    processes = []
+    for i in range(args.processes):
+        process = multiprocessing.Process(target=_worker_main, args=(f"{base_id}-w{i}",), name=f'worker-{i}')
+        process.start()
+        processes.append(process)
+
+    def _forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, _forward)
+    signal.signal(signal.SIGINT, _forward)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Per-job working directories with tmpfs placement and guaranteed cleanup
+"""
+
+import os
+import time
+import fcntl
+import shutil
+import asyncio
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Optional, List
+
+from config import (
+    WORKSPACE_DISK_ROOT, WORKSPACE_TMPFS_ROOT,
+    WORKSPACE_RAM_BUDGET_MB, WORKSPACE_SIZE_FACTOR,
+    WORKSPACE_MAX_AGE_MINUTES, WORKSPACE_MAX_TOTAL_MB,
+    DISK_FREE_WATERMARK_MB,
+)
+
+logger = logging.getLogger(__name__)
+
+# Held (flock) by the job using a workspace; the sweepers of other processes skip locked ones
+LOCK_FILE = '.lock'
+
+
+def _is_locked(path: str) -> bool:
+    """True if a live job in any process holds the workspace's lock file"""
+    try:
+        fd = os.open(os.path.join(path, LOCK_FILE), os.O_RDONLY)
+    except OSError:
+        return False  # no lock file: created by an older release or not a workspace
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def _dir_size(path: str) -> int:
+    """Total size of all files below path"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class JobWorkspace:
+    """Private directory owned by one conversion job"""
+
+    def __init__(self, path: str, on_tmpfs: bool, reserved_bytes: int):
+        self.path = path
+        self.on_tmpfs = on_tmpfs
+        self.reserved_bytes = reserved_bytes
+
+    def path_for(self, filename: str) -> str:
+        """Path for a file inside the workspace (directory parts are stripped)"""
+        return os.path.join(self.path, os.path.basename(filename) or 'input')
+
+    def usage_bytes(self) -> int:
+        """Bytes currently written inside the workspace"""
+        return _dir_size(self.path)
+
+
+class WorkspaceManager:
+    """Allocates job workspaces on tmpfs or disk and accounts for their usage"""
+
+    def __init__(self, disk_root: str = WORKSPACE_DISK_ROOT,
+                 tmpfs_root: Optional[str] = WORKSPACE_TMPFS_ROOT,
+                 ram_budget_mb: int = WORKSPACE_RAM_BUDGET_MB,
+                 size_factor: float = WORKSPACE_SIZE_FACTOR,
+                 sweep_roots: Optional[List[str]] = None):
+        self.disk_root = disk_root
+        self.tmpfs_root = tmpfs_root
+        self.ram_budget_bytes = ram_budget_mb * 1024 * 1024
+        self.size_factor = size_factor
+        self.ram_bytes_reserved = 0
+        self.disk_bytes_reserved = 0
+        self.active_jobs = 0
+        self._active_paths = set()
+        self._lock = threading.Lock()
+        self._sweep_roots = list(sweep_roots or [])
+
+        os.makedirs(disk_root, exist_ok=True)
+        if tmpfs_root and os.path.isdir(os.path.dirname(tmpfs_root.rstrip('/')) or '/'):
+            os.makedirs(tmpfs_root, exist_ok=True)
+        else:
+            self.tmpfs_root = None
+
+    def estimate_bytes(self, file_size: int) -> int:
+        """Expected peak footprint of a job (input + output + scratch)"""
+        return int((file_size or 0) * self.size_factor)
+
+    def _reserve(self, estimate: int) -> bool:
+        """Reserve space for a job; returns True if it goes on tmpfs"""
+        with self._lock:
+            self.active_jobs += 1
+            if self.tmpfs_root and self.ram_bytes_reserved + estimate <= self.ram_budget_bytes:
+                self.ram_bytes_reserved += estimate
+                return True
+            self.disk_bytes_reserved += estimate
+            return False
+
+    def _release(self, on_tmpfs: bool, estimate: int):
+        with self._lock:
+            self.active_jobs -= 1
+            if on_tmpfs:
+                self.ram_bytes_reserved -= estimate
+            else:
+                self.disk_bytes_reserved -= estimate
+
+    @contextmanager
+    def workspace(self, file_size: int, label: str = 'job'):
+        """Create a private job directory and always remove it on exit"""
+        estimate = self.estimate_bytes(file_size)
+        on_tmpfs = self._reserve(estimate)
+        root = self.tmpfs_root if on_tmpfs else self.disk_root
+        path = None
+        lock_fd = None
+        try:
+            path = tempfile.mkdtemp(prefix=f'{label}_', dir=root)
+            # Released by the kernel if this process dies, so a crashed job's workspace becomes sweepable
+            lock_fd = os.open(os.path.join(path, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            with self._lock:
+                self._active_paths.add(path)
+            logger.info(
+                f"📁 Workspace {path} ({'tmpfs' if on_tmpfs else 'disk'}, "
+                f"reserved {estimate / (1024 * 1024):.1f}MB)"
+            )
+            yield JobWorkspace(path, on_tmpfs, estimate)
+        finally:
+            if path:
+                used = _dir_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+                with self._lock:
+                    self._active_paths.discard(path)
+                logger.info(f"🗑️ Removed workspace {path} (used {used / (1024 * 1024):.1f}MB)")
+            if lock_fd is not None:
+                os.close(lock_fd)
+            self._release(on_tmpfs, estimate)
+
+    # Disk admission control
+    def has_room_for(self, file_size: int) -> bool:
+        """Check that a new job would leave free space above the watermark"""
+        estimate = self.estimate_bytes(file_size)
+        with self._lock:
+            if self.tmpfs_root and self.ram_bytes_reserved + estimate <= self.ram_budget_bytes:
+                return True
+            pending = self.disk_bytes_reserved
+        try:
+            free = shutil.disk_usage(self.disk_root).free
+        except OSError as e:
+            logger.warning(f"⚠️ Could not read free space on {self.disk_root}: {e}")
+            return True
+        # Reservations of running jobs have not necessarily been written yet
+        return free - pending - estimate >= DISK_FREE_WATERMARK_MB * 1024 * 1024
+
+    async def wait_for_room(self, file_size: int, timeout: float, poll_interval: float = 5) -> bool:
+        """Queue a job until there is disk space for it or the timeout passes"""
+        deadline = time.monotonic() + timeout
+        while not self.has_room_for(file_size):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(poll_interval)
+        return True
+
+    # Orphan sweeper
+    def sweep_stale(self, max_age_seconds: float = WORKSPACE_MAX_AGE_MINUTES * 60,
+                    max_total_bytes: int = WORKSPACE_MAX_TOTAL_MB * 1024 * 1024,
+                    min_age_seconds: float = 60) -> dict:
+        """Remove temp artifacts older than max_age, then the oldest ones above max_total
+
+        Several processes (bot, workers) sweep the same roots; workspaces whose
+        lock is held belong to a running job somewhere and are never removed.
+        """
+        now = time.time()
+        roots = [r for r in [self.disk_root, self.tmpfs_root, *self._sweep_roots] if r]
+        managed = {os.path.abspath(r) for r in roots}
+        candidates = []
+        
+        for root in set(roots):
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                path = os.path.abspath(entry.path)
+                if path in managed:
+                    continue
+                try:
+                    mtime = entry.stat(follow_symlinks=False).st_mtime
+                    size = _dir_size(path) if entry.is_dir(follow_symlinks=False) else entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+                candidates.append((mtime, path, size))
+        
+        with self._lock:
+            active = set(self._active_paths)
+        
+        total = sum(size for _, _, size in candidates)
+        removed = 0
+        freed = 0
+        for mtime, path, size in sorted(candidates):
+            age = now - mtime
+            if path in active or age < min_age_seconds or _is_locked(path):
+                continue
+            if age > max_age_seconds or total > max_total_bytes:
+                try:
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+                except OSError as e:
+                    logger.warning(f"⚠️ Sweeper could not remove {path}: {e}")
+                    continue
+                total -= size
+                removed += 1
+                freed += size
+        
+        if removed:
+            logger.info(f"🧹 Sweeper removed {removed} stale temp artifacts ({freed / (1024 * 1024):.1f}MB)")
+        return {'removed': removed, 'freed_bytes': freed, 'remaining_bytes': total}
+
+    def stats(self) -> dict:
+        """Current workspace accounting"""
+        with self._lock:
+            return {
+                'active_jobs': self.active_jobs,
+                'ram_bytes_reserved': self.ram_bytes_reserved,
+                'ram_budget_bytes': self.ram_budget_bytes,
+                'disk_bytes_reserved': self.disk_bytes_reserved,
+            }
+
+
+async def sweep_workspaces_job(context):
+    """JobQueue task: remove orphaned temp files in a worker thread"""
+    manager: WorkspaceManager = context.job.data
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, manager.sweep_stale)
+    except Exception as e:
+        logger.error(f"Error sweeping temp files: {e}")